@@ -1,5 +1,25 @@
 from django.contrib import admin
-from .models import Teacher, Subject
+from core.signals import bulk_teacher_changes
+from core.utils.generation import bump_generation
+from core.utils.search import update_search_index
+from .models import ChunkedUpload, DataGeneration, ImportJob, ImportLock
+from .models import Subject, Teacher
 
-admin.site.register(Teacher)
+
+class TeacherAdmin(admin.ModelAdmin):
+    def delete_queryset(self, request, queryset):
+        # One search index update and generation bump for the whole
+        # selection instead of one per deleted teacher
+        pks = list(queryset.values_list('pk', flat=True))
+        with bulk_teacher_changes():
+            super().delete_queryset(request, queryset)
+        update_search_index(pks)
+        bump_generation()
+
+
+admin.site.register(Teacher, TeacherAdmin)
 admin.site.register(Subject)
+admin.site.register(ImportJob)
+admin.site.register(DataGeneration)
+admin.site.register(ChunkedUpload)
+admin.site.register(ImportLock)
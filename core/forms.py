@@ -1,7 +1,10 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
+from django.core.files import File
 from django.core.validators import FileExtensionValidator
+from core.models import ChunkedUpload, ImportJob
+from core.utils.uploads import get_upload_path
 from core.validators.csv_file_validator import CSVFileValidator
 from core.validators.zip_file_validator import ZipFileValidator
 
@@ -21,7 +24,7 @@ class TeachersImportForm(forms.Form):
     """
     A form for importing teacher data from CSV and profile pictures from ZIP.
 
-    Fields: 'csv_file' and 'zip_file'.
+    Fields: 'csv_file', 'zip_file' and 'mode'.
     """
     csv_file = forms.FileField(
         label='Teacher Data (CSV)',
@@ -39,3 +42,63 @@ class TeachersImportForm(forms.Form):
             ZipFileValidator(),
         ]
     )
+
+    mode = forms.ChoiceField(
+        label='Import mode:',
+        choices=ImportJob.MODE_CHOICES,
+        initial=ImportJob.MERGE
+    )
+
+
+class UploadedImportForm(forms.Form):
+    """
+    A form for importing teacher data from files sent as chunked uploads.
+    The assembled files are validated on disk with the validators of
+    TeachersImportForm, and only the user's complete uploads can be chosen.
+
+    Fields: 'csv_upload', 'zip_upload' and 'mode'.
+
+    Attributes:
+        csv_upload (ChunkedUpload): The chosen CSV upload, also when it failed
+        validation, or None.
+        dataset (TeacherDataset): Valid rows of the CSV file, also when other
+        rows failed validation, or None.
+    """
+    csv_upload = forms.ModelChoiceField(queryset=ChunkedUpload.objects.none())
+
+    zip_upload = forms.ModelChoiceField(
+        queryset=ChunkedUpload.objects.none(),
+        required=False
+    )
+
+    mode = forms.ChoiceField(
+        choices=ImportJob.MODE_CHOICES,
+        initial=ImportJob.MERGE
+    )
+
+    def __init__(self, user, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        uploads = user.chunked_uploads.filter(status=ChunkedUpload.COMPLETE)
+        self.fields['csv_upload'].queryset = uploads
+        self.fields['zip_upload'].queryset = uploads
+        self.csv_upload = self.dataset = None
+
+    def clean_csv_upload(self):
+        upload = self.csv_upload = self.cleaned_data['csv_upload']
+        with open(get_upload_path(upload), 'rb') as f:
+            csv_file = File(f, name=upload.filename)
+            FileExtensionValidator(allowed_extensions=['csv'])(csv_file)
+            try:
+                CSVFileValidator()(csv_file)
+            finally:
+                self.dataset = getattr(csv_file, 'teachers_dataset', None)
+        return upload
+
+    def clean_zip_upload(self):
+        upload = self.cleaned_data['zip_upload']
+        if upload:
+            FileExtensionValidator(allowed_extensions=['zip'])(
+                File(None, name=upload.filename)
+            )
+            ZipFileValidator()(get_upload_path(upload))
+        return upload
@@ -0,0 +1,334 @@
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+import django
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.core.paginator import Paginator
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+from core.models import Subject, Teacher
+from core.utils.generation import bump_generation
+from core.utils.importer import import_teachers_from_csv
+from core.utils.importer import import_teachers_from_csv_and_zip
+from core.utils.pagination import encode_cursor, paginate_by_cursor
+from core.utils.search import get_search_backend, search_teachers
+from core.utils.search import update_search_index
+from core.utils.synthetic import synthetic_archive, synthetic_roster
+from core.validators.csv_file_validator import CSVFileValidator
+from core.validators.zip_file_validator import ZipFileValidator
+from core.views import TeachersDirectoryListView
+
+# Searches for a frequent first name prefix, a last name, a name and a
+# subject, a subject inside a name and a miss
+SEARCH_QUERIES = ['ma', 'garcía', 'emma math', 'sci', 'zzz']
+
+
+class Command(BaseCommand):
+    """
+    Times the import and read paths on synthetic rosters and prints the
+    results as JSON, so two runs can be compared with ``--compare``.
+
+    The benchmark runs against a throwaway test database and media
+    directory, which are created in a temporary directory and removed
+    afterwards, so the configured database is never touched. For every
+    roster size the CSV and ZIP validators, the CSV import into an empty
+    directory, the same import again (every row unchanged) and the CSV and
+    ZIP import (every row gets a picture) are run once, followed by the
+    directory search, cursor and page pagination and the profile view,
+    which are repeated. Equal arguments generate equal rosters and
+    archives.
+    """
+    help = 'Benchmarks validation, import, search, pagination and the ' \
+           'profile view on synthetic data.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            type=int,
+            nargs='+',
+            default=[1000, 50000],
+            help='Numbers of teachers of the generated rosters, e.g. '
+                 '1000 50000 500000.'
+        )
+        parser.add_argument(
+            '--pictures',
+            type=int,
+            default=200,
+            help='Number of pictures in the generated archive.'
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=5,
+            help='Number of times every read benchmark is repeated.'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='Seed of the generated rosters and archive.'
+        )
+        parser.add_argument(
+            '--output',
+            help='Write the JSON results to this file instead of stdout.'
+        )
+        parser.add_argument(
+            '--compare',
+            help='JSON results of an earlier run to compare the medians with.'
+        )
+
+    def handle(self, *args, **options):
+        if min(options['sizes']) < 1 or options['repeat'] < 1:
+            raise CommandError('--sizes and --repeat must be positive.')
+        if options['pictures'] < 1:
+            raise CommandError('--pictures must be positive.')
+        self.repeat = options['repeat']
+        self.results = []
+
+        directory = tempfile.mkdtemp(prefix='teachers-benchmark-')
+        test_settings = {
+            'MEDIA_ROOT': os.path.join(directory, 'media'),
+            'ALLOWED_HOSTS': ['testserver'],
+            'CACHES': {
+                alias: {
+                    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                    'LOCATION': f'benchmark-{alias}',
+                }
+                for alias in settings.CACHES
+            },
+        }
+        old_name = connection.settings_dict['NAME']
+        if connection.vendor == 'sqlite':
+            # A database file, so the numbers include the I/O of the
+            # configured PRAGMAs like a real deployment
+            connection.settings_dict['TEST']['NAME'] = os.path.join(
+                directory, 'benchmark.sqlite3'
+            )
+        try:
+            with override_settings(**test_settings):
+                connection.creation.create_test_db(
+                    verbosity=0, autoclobber=True, serialize=False
+                )
+                try:
+                    self.run_benchmarks(directory, options)
+                finally:
+                    connection.creation.destroy_test_db(old_name, verbosity=0)
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+        report = {
+            'environment': self.environment(),
+            'options': {
+                key: options[key]
+                for key in ('sizes', 'pictures', 'repeat', 'seed')
+            },
+            'results': self.results,
+        }
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+        else:
+            self.stdout.write(output)
+        if options['compare']:
+            self.compare(options['compare'])
+
+    def run_benchmarks(self, directory, options):
+        archive_path = os.path.join(directory, 'pictures.zip')
+        synthetic_archive(archive_path, options['pictures'], options['seed'])
+        self.measure(
+            'zip_validator', 0, lambda: ZipFileValidator()(archive_path),
+            items=options['pictures']
+        )
+
+        for size in sorted(options['sizes']):
+            self.reset_directory()
+            roster = synthetic_roster(size, options['seed'])
+            csv_path = os.path.join(directory, f'teachers-{size}.csv')
+            roster.to_csv(csv_path, index=False)
+
+            def validate():
+                with open(csv_path, 'rb') as f:
+                    validator(f)
+                    return f.teachers_dataset
+
+            validator = CSVFileValidator()
+            self.measure(
+                'csv_validator', size, lambda: validate().close(), items=size
+            )
+            dataset = validate()
+            self.measure(
+                'import_csv', size,
+                lambda: import_teachers_from_csv(dataset),
+                items=size, repeat=1
+            )
+            self.measure(
+                'import_csv_unchanged', size,
+                lambda: import_teachers_from_csv(dataset),
+                items=size, repeat=1
+            )
+            dataset.close()
+            roster = synthetic_roster(
+                size, options['seed'], options['pictures']
+            )
+            self.measure(
+                'import_csv_and_zip', size,
+                lambda: import_teachers_from_csv_and_zip(roster, archive_path),
+                items=size, repeat=1
+            )
+
+            self.benchmark_reads(size, options['seed'])
+
+    def benchmark_reads(self, size, seed):
+        teachers = Teacher.objects.all()
+        per_page = TeachersDirectoryListView.paginate_by
+
+        for query in SEARCH_QUERIES:
+            self.measure(
+                'search', size,
+                lambda: list(search_teachers(teachers, query)[:per_page]),
+                query=query
+            )
+
+        middle = teachers[size // 2]
+        cursor = encode_cursor(middle)
+        self.measure(
+            'paginate_cursor_first', size,
+            lambda: list(
+                paginate_by_cursor(teachers, None, per_page).object_list
+            )
+        )
+        self.measure(
+            'paginate_cursor_middle', size,
+            lambda: list(
+                paginate_by_cursor(teachers, cursor, per_page).object_list
+            )
+        )
+        self.measure(
+            'paginate_page_middle', size,
+            lambda: list(Paginator(teachers, per_page).page(
+                size // 2 // per_page + 1
+            ))
+        )
+
+        client = Client()
+        rng = random.Random(seed)
+        pks = list(teachers.order_by('pk').values_list('pk', flat=True))
+        urls = [
+            reverse('teacher_profile', args=[pk])
+            for pk in rng.sample(pks, min(len(pks), 100))
+        ]
+
+        def get_profiles():
+            for url in urls:
+                client.get(url)
+
+        self.measure(
+            'profile_view_cold', size, get_profiles,
+            items=len(urls), setup=self.clear_caches
+        )
+        self.measure(
+            'profile_view_cached', size, get_profiles, items=len(urls)
+        )
+
+    def measure(self, name, size, func, items=1, repeat=None, setup=None,
+                **params):
+        """
+        Runs and times a benchmark and records the result.
+
+        Args:
+            name (str): Benchmark name.
+            size (int): Number of teachers in the directory, or 0.
+            func (callable): Benchmarked code.
+            items (int): Number of rows, pictures or requests processed by a
+            single call, for the throughput.
+            repeat (int): Number of calls, defaults to ``--repeat``.
+            setup (callable): Called before every call, untimed.
+            **params: Parameters recorded with the result.
+        """
+        timings = []
+        for _ in range(repeat or self.repeat):
+            if setup:
+                setup()
+            started = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - started)
+        median = statistics.median(timings)
+        self.results.append(dict(
+            name=name,
+            size=size,
+            params=params,
+            timings=timings,
+            min=min(timings),
+            median=median,
+            items_per_second=items / median if median else None,
+        ))
+        self.stderr.write(
+            f'{name:<24} {size:>8} {median * 1000:>10.2f} ms {params or ""}'
+        )
+
+    def reset_directory(self):
+        """
+        Deletes all teachers and subjects without per-row signals. The data
+        generation is bumped instead of reset, so nothing cached for the
+        previous roster is served for the next one.
+        """
+        with connection.cursor() as cursor:
+            for model in (Teacher.subjects_taught.through, Teacher, Subject):
+                cursor.execute(f'DELETE FROM {model._meta.db_table}')
+        update_search_index()
+        bump_generation()
+        self.clear_caches()
+
+    @staticmethod
+    def clear_caches():
+        for cache in caches.all():
+            cache.clear()
+
+    @staticmethod
+    def environment():
+        return {
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'database': connection.vendor,
+            'search_backend': get_search_backend(),
+            'argv': sys.argv[1:],
+        }
+
+    def compare(self, path):
+        """
+        Prints the ratio of the medians of this run to the medians of an
+        earlier run, for the benchmarks both runs have.
+
+        Args:
+            path (str): JSON results of the earlier run.
+        """
+        with open(path) as f:
+            baseline = {
+                (r['name'], r['size'], json.dumps(r['params'])): r['median']
+                for r in json.load(f)['results']
+            }
+        for result in self.results:
+            key = (result['name'], result['size'],
+                   json.dumps(result['params']))
+            if key in baseline and baseline[key]:
+                ratio = result['median'] / baseline[key]
+                self.stderr.write(
+                    f'{result["name"]:<24} {result["size"]:>8} '
+                    f'{ratio:>6.2f}x {result["params"] or ""}'
+                )
@@ -0,0 +1,209 @@
+import asyncio
+import io
+import statistics
+import time
+
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+from django.core.management.base import BaseCommand, CommandError
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.urls import reverse
+from core.models import Teacher
+
+HOST = 'localhost'
+
+
+class Command(BaseCommand):
+    """
+    Measures the throughput of the directory read path under concurrent
+    requests. Every path is requested through Django's ASGI handler from
+    coroutines and through its WSGI handler from a thread pool of the same
+    size, in process and against the configured database, so the numbers
+    compare the request handling and not the network or the server.
+    """
+    help = 'Benchmarks the directory views under ASGI and WSGI.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'paths',
+            nargs='*',
+            help='Paths to request. Defaults to the directory page, list, '
+                 'API and the profile of the first teacher.'
+        )
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=1000,
+            help='Number of requests per path and interface.'
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=50,
+            help='Number of requests in flight.'
+        )
+        parser.add_argument(
+            '--interface',
+            choices=['asgi', 'wsgi', 'both'],
+            default='both',
+            help='Handlers to benchmark.'
+        )
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1 or options['concurrency'] < 1:
+            raise CommandError('--requests and --concurrency must be positive.')
+        paths = options['paths'] or self.default_paths()
+        interfaces = (['asgi', 'wsgi'] if options['interface'] == 'both'
+                      else [options['interface']])
+
+        self.stdout.write(
+            f"{'path':<45} {'interface':<9} {'req/s':>9} {'p50 ms':>8} "
+            f"{'p99 ms':>8}  statuses"
+        )
+        for path in paths:
+            for interface in interfaces:
+                benchmark = getattr(self, f'benchmark_{interface}')
+                elapsed, latencies, statuses = benchmark(
+                    path, options['requests'], options['concurrency']
+                )
+                latencies.sort()
+                self.stdout.write(
+                    f"{path:<45} {interface:<9} "
+                    f"{len(latencies) / elapsed:>9.1f} "
+                    f"{statistics.median(latencies) * 1000:>8.2f} "
+                    f"{latencies[int(len(latencies) * 0.99) - 1] * 1000:>8.2f}"
+                    f"  {dict(statuses)}"
+                )
+
+    def default_paths(self):
+        paths = [
+            reverse('teachers_directory'),
+            reverse('teachers_directory_list') + '?page=1',
+            reverse('teachers_directory_list') + '?page=1&query=a',
+            reverse('teachers_directory_api') + '?query=a',
+        ]
+        teacher = Teacher.objects.order_by('pk').first()
+        if teacher:
+            paths.append(reverse('teacher_profile', args=[teacher.pk]))
+        return paths
+
+    def benchmark_asgi(self, path, requests, concurrency):
+        """
+        Sends the requests to the ASGI handler from ``concurrency``
+        coroutines.
+
+        Returns:
+            tuple: Elapsed seconds, latency of every request and the number
+            of responses per status code.
+        """
+        application = ASGIHandler()
+        url = urlsplit(path)
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': 'GET',
+            'scheme': 'http',
+            'path': url.path,
+            'raw_path': url.path.encode(),
+            'query_string': url.query.encode(),
+            'root_path': '',
+            'headers': [(b'host', HOST.encode())],
+            'client': ('127.0.0.1', 0),
+            'server': (HOST, 80),
+        }
+        latencies, statuses = [], Counter()
+
+        async def request():
+            messages = [{'type': 'http.request', 'body': b''}]
+
+            async def receive():
+                if messages:
+                    return messages.pop()
+                # Block like a client that keeps the connection open
+                await asyncio.Future()
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    statuses[message['status']] += 1
+
+            started = time.perf_counter()
+            await application(dict(scope), receive, send)
+            latencies.append(time.perf_counter() - started)
+
+        async def worker(count):
+            for _ in range(count):
+                await request()
+
+        async def run():
+            await asyncio.gather(*(
+                worker(count) for count in split(requests, concurrency)
+            ))
+
+        started = time.perf_counter()
+        asyncio.run(run())
+        return time.perf_counter() - started, latencies, statuses
+
+    def benchmark_wsgi(self, path, requests, concurrency):
+        """
+        Sends the requests to the WSGI handler from ``concurrency`` threads,
+        like a threaded WSGI server.
+
+        Returns:
+            tuple: Elapsed seconds, latency of every request and the number
+            of responses per status code.
+        """
+        application = WSGIHandler()
+        url = urlsplit(path)
+        latencies, statuses = [], Counter()
+
+        def start_response(status, headers, exc_info=None):
+            statuses[int(status.split()[0])] += 1
+
+        def request():
+            environ = {
+                'REQUEST_METHOD': 'GET',
+                'PATH_INFO': url.path,
+                'QUERY_STRING': url.query,
+                'SCRIPT_NAME': '',
+                'SERVER_NAME': HOST,
+                'SERVER_PORT': '80',
+                'SERVER_PROTOCOL': 'HTTP/1.1',
+                'HTTP_HOST': HOST,
+                'REMOTE_ADDR': '127.0.0.1',
+                'wsgi.input': io.BytesIO(),
+                'wsgi.errors': self.stderr,
+                'wsgi.url_scheme': 'http',
+            }
+            started = time.perf_counter()
+            response = application(environ, start_response)
+            for _ in response:
+                pass
+            response.close()
+            latencies.append(time.perf_counter() - started)
+
+        def worker(count):
+            for _ in range(count):
+                request()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(worker, split(requests, concurrency)))
+        return time.perf_counter() - started, latencies, statuses
+
+
+def split(total, parts):
+    """
+    Splits a number of requests between workers.
+
+    Args:
+        total (int): Number of requests.
+        parts (int): Number of workers.
+
+    Returns:
+        list: Number of requests of every worker.
+    """
+    parts = min(parts, total)
+    return [total // parts + (i < total % parts) for i in range(parts)]
@@ -0,0 +1,162 @@
+import statistics
+import threading
+import time
+
+import pandas as pd
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, connections, transaction
+from core.models import Teacher
+from core.utils.importer import import_teachers_from_csv
+from core.utils.search import search_teachers
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    """
+    Measures directory reads while an import writes. Reader threads load a
+    directory page and run a search in a loop, first with an idle database
+    and then while another thread imports synthetic teachers. The import
+    runs in a transaction that is rolled back, so the database is left
+    unchanged.
+    """
+    help = 'Benchmarks directory reads during a running import.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rows',
+            type=int,
+            default=50000,
+            help='Number of teachers imported by the writer.'
+        )
+        parser.add_argument(
+            '--readers',
+            type=int,
+            default=4,
+            help='Number of reader threads.'
+        )
+        parser.add_argument(
+            '--idle-seconds',
+            type=float,
+            default=3.0,
+            help='Duration of the reads without a writer.'
+        )
+
+    def handle(self, *args, **options):
+        if options['rows'] < 1 or options['readers'] < 1:
+            raise CommandError('--rows and --readers must be positive.')
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA journal_mode')
+                self.stdout.write(f'journal_mode: {cursor.fetchone()[0]}')
+
+        idle = self.measure_reads(
+            options['readers'], lambda: time.sleep(options['idle_seconds'])
+        )
+        self.report('idle', idle)
+
+        imported = {}
+
+        def write():
+            started = time.perf_counter()
+            try:
+                with transaction.atomic():
+                    imported.update(import_teachers_from_csv(
+                        synthetic_teachers(options['rows'])
+                    ))
+                    imported['seconds'] = time.perf_counter() - started
+                    raise Rollback
+            except Rollback:
+                pass
+            finally:
+                connections.close_all()
+
+        busy = self.measure_reads(options['readers'], write)
+        self.report('during import', busy)
+        if imported:
+            self.stdout.write(
+                f"import: {imported['rows']} rows in "
+                f"{imported['seconds']:.2f} s (rolled back)"
+            )
+
+    def measure_reads(self, readers, workload):
+        """
+        Runs reader threads until ``workload`` returns.
+
+        Args:
+            readers (int): Number of reader threads.
+            workload (callable): Runs in the calling thread.
+
+        Returns:
+            dict: Elapsed seconds, read latencies and number of failed reads.
+        """
+        stop = threading.Event()
+        latencies, errors = [], []
+
+        def read():
+            try:
+                while not stop.is_set():
+                    started = time.perf_counter()
+                    try:
+                        list(Teacher.objects.all()[:8])
+                        list(search_teachers(Teacher.objects.all(), 'a')[:8])
+                    except OperationalError as e:
+                        errors.append(e)
+                        continue
+                    latencies.append(time.perf_counter() - started)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=read) for _ in range(readers)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        try:
+            workload()
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+        return {
+            'seconds': time.perf_counter() - started,
+            'latencies': sorted(latencies),
+            'errors': errors,
+        }
+
+    def report(self, phase, result):
+        latencies = result['latencies']
+        if not latencies:
+            self.stdout.write(
+                f"{phase}: no successful reads, {len(result['errors'])} errors"
+            )
+            return
+        self.stdout.write(
+            f"{phase}: {len(latencies) / result['seconds']:.1f} reads/s, "
+            f"p50 {statistics.median(latencies) * 1000:.2f} ms, "
+            f"p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:.2f} ms, "
+            f"max {latencies[-1] * 1000:.2f} ms, "
+            f"{len(result['errors'])} errors"
+        )
+
+
+def synthetic_teachers(rows):
+    """
+    Returns a dataframe with unique synthetic teachers.
+
+    Args:
+        rows (int): Number of teachers.
+
+    Returns:
+        pd.DataFrame: Teacher data in the CSV file layout.
+    """
+    return pd.DataFrame({
+        'first_name': [f'Bench{i}' for i in range(rows)],
+        'last_name': [f'Writer{i % 1000}' for i in range(rows)],
+        'email_address': [f'bench-writer-{i}@example.com'
+                          for i in range(rows)],
+        'phone_number': ['+1-555-000-0000'] * rows,
+        'room_number': [str(i % 500) for i in range(rows)],
+        'subjects_taught': ['Mathematics, Physics'] * rows,
+    })
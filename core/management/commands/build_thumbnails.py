@@ -0,0 +1,53 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from core.models import Teacher
+from core.utils.generation import bump_generation
+from core.utils.thumbnails import generate_thumbnails
+
+
+class Command(BaseCommand):
+    """
+    Generates the missing thumbnails of the profile pictures of all
+    teachers, e.g. for pictures stored before thumbnails were introduced.
+    """
+    help = 'Generates profile picture thumbnails for existing teachers.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=settings.IMPORT_IMAGE_WORKERS,
+            help='Number of threads generating thumbnails.'
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Regenerate thumbnails that already exist.'
+        )
+
+    def handle(self, *args, **options):
+        storage = Teacher._meta.get_field('profile_picture').storage
+        names = (
+            Teacher.objects.exclude(profile_picture='')
+            .exclude(profile_picture__isnull=True)
+            .values_list('profile_picture', flat=True)
+            .distinct()
+        )
+
+        def build(name):
+            try:
+                return generate_thumbnails(storage, name, options['force'])
+            except (OSError, ValueError) as e:
+                self.stderr.write(f"{name}: {e}")
+                return 0
+
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            written = sum(pool.map(build, names.iterator()))
+        if written:
+            # Directory responses and caches refer to the thumbnails
+            bump_generation()
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Generated {written} thumbnails.")
+        )
@@ -0,0 +1,61 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from core.utils.export import EXPORT_FORMATS, export_teachers
+
+
+class Command(BaseCommand):
+    """
+    Writes the whole directory to a file or stdout, as CSV in the layout
+    of the import file or as JSON lines. The export is streamed chunk by
+    chunk, so memory does not depend on the number of teachers.
+    """
+    help = 'Exports the teacher directory as CSV or JSON lines.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            nargs='?',
+            default='-',
+            help='Destination file, or - for stdout.'
+        )
+        parser.add_argument(
+            '--format',
+            choices=list(EXPORT_FORMATS),
+            default='csv',
+            help='Export format.'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            help='Number of teachers read per query. Defaults to '
+                 'EXPORT_CHUNK_SIZE.'
+        )
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] is not None and options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be positive.')
+        started = time.perf_counter()
+        parts = export_teachers(options['format'], options['chunk_size'])
+        if options['path'] == '-':
+            size = self.write(sys.stdout, parts)
+        else:
+            try:
+                with open(options['path'], 'w', encoding='utf-8',
+                          newline='') as f:
+                    size = self.write(f, parts)
+            except OSError as e:
+                raise CommandError(f'Error writing the export: {e}')
+        elapsed = time.perf_counter() - started
+        self.stderr.write(
+            f'Exported {size / 1024 ** 2:.1f} MiB in {elapsed:.2f} s'
+        )
+
+    @staticmethod
+    def write(f, parts):
+        size = 0
+        for part in parts:
+            f.write(part)
+            size += len(part)
+        return size
@@ -0,0 +1,236 @@
+import time
+import zipfile
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from core.models import ImportJob
+from core.utils.importer import BulkTeacherImporter
+from core.utils.shadow_import import ReplaceImportRunning
+from core.utils.shadow_import import ShadowTeacherImporter
+from core.validators.csv_file_validator import CSVFileValidator
+from core.validators.zip_file_validator import ZipFileValidator
+
+# Number of validation errors printed before they are summarized
+MAX_REPORTED_ERRORS = 20
+
+
+class DryRun(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    """
+    Imports teachers from a CSV file and profile pictures from a ZIP file on
+    local disk, e.g. for nightly syncs from cron. The files are validated
+    with the validators of the import form and imported with the importers
+    of the import jobs, but they are read from disk instead of uploaded, and
+    the import runs in the command instead of a job.
+
+    Like in the import form, rows that fail validation are skipped and the
+    valid rows are imported. Teachers are only removed by the sync and
+    replace modes when the CSV file has no errors.
+    """
+    help = 'Imports teachers from a CSV file and an optional ZIP file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'csv_path',
+            help='CSV file with teacher data.'
+        )
+        parser.add_argument(
+            '--zip',
+            dest='zip_path',
+            help='ZIP file with profile pictures.'
+        )
+        parser.add_argument(
+            '--mode',
+            choices=[mode for mode, label in ImportJob.MODE_CHOICES],
+            default=ImportJob.MERGE,
+            help='merge into the directory, sync it with the file, or '
+                 'replace it by the file.'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            help='Number of rows written per batch. Defaults to '
+                 'IMPORT_BATCH_SIZE.'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            help='Number of threads validating and storing profile '
+                 'pictures. Defaults to IMPORT_IMAGE_WORKERS.'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Validate and import in a transaction that is rolled back, '
+                 'without storing pictures, and report what would change.'
+        )
+
+    def handle(self, *args, **options):
+        for option in ('batch_size', 'workers'):
+            if options[option] is not None and options[option] < 1:
+                raise CommandError(
+                    f"--{option.replace('_', '-')} must be positive."
+                )
+        self.verbosity = options['verbosity']
+        mode = options['mode']
+        zip_path = options['zip_path']
+
+        started = time.perf_counter()
+        if zip_path:
+            try:
+                ZipFileValidator(workers=options['workers'])(zip_path)
+            except ValidationError as e:
+                raise CommandError(self.format_errors(e))
+        dataset, errors = self.validate_csv(options['csv_path'])
+        if errors and mode != ImportJob.MERGE:
+            # Rows that failed validation would be removed from the directory
+            self.stderr.write(
+                'Teachers missing from the file are not removed, because '
+                'the file has errors.'
+            )
+            mode = ImportJob.MERGE
+        validated = time.perf_counter()
+        self.stdout.write(
+            f'Validated the files in {validated - started:.2f} s: '
+            f'{len(dataset)} valid rows, {len(errors)} errors'
+        )
+
+        try:
+            summary, images = self.run_import(dataset, zip_path, mode, options)
+        except ReplaceImportRunning as e:
+            raise CommandError(str(e))
+        finally:
+            dataset.close()
+        elapsed = time.perf_counter() - validated
+        if summary.get('errors'):
+            self.stderr.write(self.format_errors(
+                ValidationError(summary['errors'])
+            ))
+
+        self.stdout.write(
+            f"{'Would import' if options['dry_run'] else 'Imported'} "
+            f"{summary['rows']} rows in {elapsed:.2f} s "
+            f"({summary['rows'] / elapsed:.0f} rows/s, "
+            f"{images / elapsed:.1f} images/s): "
+            f"{summary['inserted']} inserted, {summary['updated']} updated, "
+            f"{summary['unchanged']} unchanged, {summary['removed']} removed"
+        )
+
+    def validate_csv(self, path):
+        """
+        Validates the CSV file in chunks while it is read.
+
+        Args:
+            path (str): Path of the CSV file.
+
+        Returns:
+            tuple: TeacherDataset with the valid rows and the list of
+            validation errors.
+        """
+        try:
+            with open(path, 'rb') as csv_file:
+                try:
+                    CSVFileValidator()(csv_file)
+                    errors = []
+                except ValidationError as e:
+                    if not hasattr(csv_file, 'teachers_dataset'):
+                        raise
+                    errors = e.messages
+                    self.stderr.write(self.format_errors(e))
+        except OSError as e:
+            raise CommandError(f'Error opening the CSV file: {e}')
+        except ValidationError as e:
+            raise CommandError(self.format_errors(e))
+        return csv_file.teachers_dataset, errors
+
+    def run_import(self, dataset, zip_path, mode, options):
+        """
+        Imports the dataset with the importer of the mode.
+
+        Returns:
+            tuple: Import summary and number of stored pictures.
+        """
+        if mode == ImportJob.REPLACE:
+            importer_class, kwargs = ShadowTeacherImporter, {}
+        else:
+            importer_class = BulkTeacherImporter
+            kwargs = {'sync': mode == ImportJob.SYNC}
+        if options['dry_run']:
+            importer_class = dry_run_importer(importer_class)
+
+        progress = self.progress_reporter()
+        zip_ref = zipfile.ZipFile(zip_path) if zip_path else None
+        try:
+            importer = importer_class(
+                zip_ref,
+                batch_size=options['batch_size'],
+                progress=progress,
+                image_workers=options['workers'],
+                **kwargs
+            )
+            if not options['dry_run']:
+                return importer.run(dataset), importer.images_processed
+            try:
+                with transaction.atomic():
+                    summary = importer.run(dataset)
+                    raise DryRun
+            except DryRun:
+                return summary, importer.images_processed
+        finally:
+            if zip_ref:
+                zip_ref.close()
+
+    def progress_reporter(self, interval=5.0):
+        """
+        Returns a progress callback printing the throughput every
+        ``interval`` seconds, at verbosity 2 and above.
+        """
+        if self.verbosity < 2:
+            return None
+        started = last = time.perf_counter()
+
+        def progress(rows, images):
+            nonlocal last
+            now = time.perf_counter()
+            if now - last < interval:
+                return
+            last = now
+            elapsed = now - started
+            self.stdout.write(
+                f'{rows} rows ({rows / elapsed:.0f} rows/s), '
+                f'{images} images ({images / elapsed:.1f} images/s)'
+            )
+
+        return progress
+
+    @staticmethod
+    def format_errors(error):
+        messages = error.messages
+        lines = messages[:MAX_REPORTED_ERRORS]
+        if len(messages) > MAX_REPORTED_ERRORS:
+            lines.append(
+                f'... and {len(messages) - MAX_REPORTED_ERRORS} more errors'
+            )
+        return '\n'.join(lines)
+
+
+def dry_run_importer(importer_class):
+    """
+    Returns a subclass of an importer that reads pictures from the archive
+    only for their fingerprints and does not store them.
+
+    Args:
+        importer_class (type): BulkTeacherImporter or a subclass.
+
+    Returns:
+        type: Importer class.
+    """
+    class DryRunImporter(importer_class):
+        def store_picture(self, member):
+            return member
+
+    return DryRunImporter
@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+from core.utils.jobs import run_next_import_job
+
+
+class Command(BaseCommand):
+    """
+    Runs queued teacher import jobs. Use it together with
+    IMPORT_JOB_THREADS = 0 to execute imports outside the web processes.
+    """
+    help = 'Runs queued teacher import jobs.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=2.0,
+            help='Seconds to wait between polls of an empty queue.'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Exit as soon as the queue is empty.'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            if run_next_import_job():
+                continue
+            if options['once']:
+                break
+            time.sleep(options['interval'])
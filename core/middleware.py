@@ -0,0 +1,95 @@
+import asyncio
+import logging
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from core.utils.metrics import (
+    REQUEST_DB_DURATION, REQUEST_DURATION, REQUEST_QUERIES,
+    REQUEST_RENDER_DURATION, RequestMetrics, instrument, metrics_enabled
+)
+
+logger = logging.getLogger(__name__)
+
+
+class RequestMetricsMiddleware():
+    """
+    Records the number of SQL queries, the SQL time, the template render
+    time and the total time of every request. They are sent to the client
+    in a ``Server-Timing`` header and aggregated into the histograms served
+    by the metrics endpoint. Statements executed at least
+    REQUEST_METRICS_N_PLUS_ONE times in one request are logged as likely
+    N+1 queries.
+
+    The middleware is only installed when REQUEST_METRICS is True, so it
+    costs nothing otherwise. It supports sync and async requests, so async
+    views are not moved to a thread for it.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not metrics_enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.n_plus_one = getattr(settings, 'REQUEST_METRICS_N_PLUS_ONE', 10)
+        if asyncio.iscoroutinefunction(get_response):
+            # Lets Django call the middleware as a coroutine function
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+        else:
+            self._is_coroutine = None
+        instrument()
+
+    def __call__(self, request):
+        if self._is_coroutine:
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        started = time.perf_counter()
+        with metrics.record():
+            response = self.get_response(request)
+        return self.finish(request, response, metrics, started)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        started = time.perf_counter()
+        with metrics.record():
+            response = await self.get_response(request)
+        return self.finish(request, response, metrics, started)
+
+    def finish(self, request, response, metrics, started):
+        """
+        Adds the Server-Timing header and records the metrics of a request.
+
+        Args:
+            request (HttpRequest): Handled request.
+            response (HttpResponse): Response of the request.
+            metrics (RequestMetrics): Metrics recorded for the request.
+            started (float): ``time.perf_counter()`` at the start of the
+            request.
+
+        Returns:
+            HttpResponse: The response.
+        """
+        total = time.perf_counter() - started
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+
+        response.headers['Server-Timing'] = ', '.join([
+            f'db;dur={metrics.db_time * 1000:.2f};'
+            f'desc="{metrics.queries} queries"',
+            f'render;dur={metrics.render_time * 1000:.2f}',
+            f'total;dur={total * 1000:.2f}',
+        ])
+        REQUEST_DURATION.observe(
+            total, view, request.method, response.status_code
+        )
+        REQUEST_DB_DURATION.observe(metrics.db_time, view)
+        REQUEST_RENDER_DURATION.observe(metrics.render_time, view)
+        REQUEST_QUERIES.observe(metrics.queries, view)
+
+        for sql, count in metrics.repeated_statements(self.n_plus_one):
+            logger.warning(
+                "Possible N+1 query in %s: statement executed %d times: %s",
+                view, count, sql
+            )
+        return response
@@ -0,0 +1,23 @@
+# Generated by Django 4.1.7 on 2026-10-17 10:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_importjob'),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name='importjob',
+            old_name='csv_path',
+            new_name='data_path',
+        ),
+        migrations.AlterField(
+            model_name='importjob',
+            name='data_path',
+            field=models.CharField(max_length=255, verbose_name='Data File Path'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.1.7 on 2026-10-17 10:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_rename_csv_path_importjob_data_path'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='inserted',
+            field=models.PositiveIntegerField(default=0, verbose_name='Inserted'),
+        ),
+        migrations.AddField(
+            model_name='importjob',
+            name='mode',
+            field=models.CharField(choices=[('merge', 'Merge into the directory'), ('sync', 'Sync: remove teachers missing from the file')], default='merge', max_length=10, verbose_name='Mode'),
+        ),
+        migrations.AddField(
+            model_name='importjob',
+            name='removed',
+            field=models.PositiveIntegerField(default=0, verbose_name='Removed'),
+        ),
+        migrations.AddField(
+            model_name='importjob',
+            name='unchanged',
+            field=models.PositiveIntegerField(default=0, verbose_name='Unchanged'),
+        ),
+        migrations.AddField(
+            model_name='importjob',
+            name='updated',
+            field=models.PositiveIntegerField(default=0, verbose_name='Updated'),
+        ),
+        migrations.AddField(
+            model_name='teacher',
+            name='fingerprint',
+            field=models.CharField(blank=True, editable=False, max_length=32, verbose_name='Import Fingerprint'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.1.7 on 2026-10-17 11:20
+
+from django.db import migrations
+from django.db.utils import OperationalError
+
+
+def create_search_table(apps, schema_editor):
+    """
+    Creates the FTS5 table for the directory search on SQLite and fills it
+    with the existing teachers. Other backends and SQLite builds without
+    FTS5 keep using the ORM search.
+    """
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    try:
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE core_teacher_search USING fts5("
+            "first_name, last_name, subjects, "
+            "tokenize = 'unicode61 remove_diacritics 2', "
+            "prefix = '1 2 3')"
+        )
+    except OperationalError:
+        return
+    schema_editor.execute(
+        "INSERT INTO core_teacher_search "
+        "(rowid, first_name, last_name, subjects) "
+        "SELECT t.id, t.first_name, t.last_name, "
+        "COALESCE(GROUP_CONCAT(s.name, ' '), '') "
+        "FROM core_teacher t "
+        "LEFT JOIN core_teacher_subjects_taught ts ON ts.teacher_id = t.id "
+        "LEFT JOIN core_subject s ON s.id = ts.subject_id "
+        "GROUP BY t.id"
+    )
+
+
+def drop_search_table(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS core_teacher_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_teacher_fingerprint_importjob_summary'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_table, drop_search_table),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.1.7 on 2026-10-17 11:40
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_teacher_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DataGeneration',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('generation', models.PositiveBigIntegerField(default=0, verbose_name='Generation')),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Updated At')),
+            ],
+            options={
+                'verbose_name': 'Data Generation',
+                'verbose_name_plural': 'Data Generations',
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.1.7 on 2026-10-17 12:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_datageneration'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='teacher',
+            options={'ordering': ['last_name', 'first_name', 'id'], 'verbose_name': 'Teacher', 'verbose_name_plural': 'Teachers'},
+        ),
+        migrations.AddIndex(
+            model_name='teacher',
+            index=models.Index(fields=['last_name', 'first_name', 'id'], name='teacher_directory_order'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.1.7 on 2026-10-17 12:30
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_teacher_directory_order'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='teacher',
+            name='updated_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False, verbose_name='Updated At'),
+        ),
+        migrations.AddField(
+            model_name='teacher',
+            name='version',
+            field=models.PositiveIntegerField(default=1, editable=False, verbose_name='Version'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.1.7 on 2026-10-17 13:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_teacher_version'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='importjob',
+            name='mode',
+            field=models.CharField(choices=[('merge', 'Merge into the directory'), ('sync', 'Sync: remove teachers missing from the file'), ('replace', 'Replace: load the file aside and swap it in at once')], default='merge', max_length=10, verbose_name='Mode'),
+        ),
+    ]
@@ -1,5 +1,7 @@
 import os
+from django.conf import settings
 from django.db import models
+from django.utils import timezone
 
 
 class Subject(models.Model):
@@ -54,11 +56,328 @@ class Teacher(models.Model):
         verbose_name="Subjects Taught",
         blank=True,
     )
+    fingerprint = models.CharField(
+        "Import Fingerprint",
+        max_length=32,
+        blank=True,
+        editable=False
+    )
+    version = models.PositiveIntegerField(
+        "Version",
+        default=1,
+        editable=False
+    )
+    updated_at = models.DateTimeField(
+        "Updated At",
+        default=timezone.now,
+        editable=False
+    )
 
     def __str__(self):
         return f"{self.first_name} {self.last_name}"
 
+    def save(self, *args, **kwargs):
+        # Teachers edited outside the importer are rewritten by the next
+        # import, even if their row did not change
+        self.fingerprint = ''
+        self.updated_at = timezone.now()
+        if not self._state.adding:
+            self.version += 1
+        super().save(*args, **kwargs)
+
     class Meta:
         verbose_name = "Teacher"
         verbose_name_plural = "Teachers"
-        ordering = ['last_name', 'first_name']
+        ordering = ['last_name', 'first_name', 'id']
+        indexes = [
+            models.Index(
+                fields=['last_name', 'first_name', 'id'],
+                name='teacher_directory_order'
+            ),
+        ]
+
+
+class ImportJob(models.Model):
+    """ Background import of teacher data. """
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    MERGE = 'merge'
+    SYNC = 'sync'
+    REPLACE = 'replace'
+    MODE_CHOICES = [
+        (MERGE, 'Merge into the directory'),
+        (SYNC, 'Sync: remove teachers missing from the file'),
+        (REPLACE, 'Replace: load the file aside and swap it in at once'),
+    ]
+
+    status = models.CharField(
+        "Status",
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default=QUEUED
+    )
+    data_path = models.CharField(
+        "Data File Path",
+        max_length=255
+    )
+    zip_path = models.CharField(
+        "ZIP File Path",
+        max_length=255,
+        blank=True
+    )
+    mode = models.CharField(
+        "Mode",
+        max_length=10,
+        choices=MODE_CHOICES,
+        default=MERGE
+    )
+    rows_processed = models.PositiveIntegerField(
+        "Rows Processed",
+        default=0
+    )
+    images_processed = models.PositiveIntegerField(
+        "Images Processed",
+        default=0
+    )
+    inserted = models.PositiveIntegerField(
+        "Inserted",
+        default=0
+    )
+    updated = models.PositiveIntegerField(
+        "Updated",
+        default=0
+    )
+    unchanged = models.PositiveIntegerField(
+        "Unchanged",
+        default=0
+    )
+    removed = models.PositiveIntegerField(
+        "Removed",
+        default=0
+    )
+    errors = models.JSONField(
+        "Errors",
+        default=list,
+        blank=True
+    )
+    created_at = models.DateTimeField(
+        "Created At",
+        auto_now_add=True
+    )
+    started_at = models.DateTimeField(
+        "Started At",
+        blank=True,
+        null=True
+    )
+    finished_at = models.DateTimeField(
+        "Finished At",
+        blank=True,
+        null=True
+    )
+
+    def __str__(self):
+        return f"Import #{self.pk} ({self.status})"
+
+    @property
+    def is_finished(self):
+        return self.status in (self.DONE, self.FAILED)
+
+    def as_status(self, rows_processed=None, images_processed=None):
+        """
+        Returns the job progress as a JSON serializable dict.
+
+        Args:
+            rows_processed (int): Live row counter of a running job.
+            images_processed (int): Live image counter of a running job.
+
+        Returns:
+            dict: Status, counters, summary, errors and throughput of the
+            job.
+        """
+        if rows_processed is None:
+            rows_processed = self.rows_processed
+        if images_processed is None:
+            images_processed = self.images_processed
+
+        elapsed = 0.0
+        if self.started_at:
+            end = self.finished_at or timezone.now()
+            elapsed = (end - self.started_at).total_seconds()
+
+        return {
+            'id': self.pk,
+            'status': self.status,
+            'mode': self.mode,
+            'rows_processed': rows_processed,
+            'images_processed': images_processed,
+            'inserted': self.inserted,
+            'updated': self.updated,
+            'unchanged': self.unchanged,
+            'removed': self.removed,
+            'errors': self.errors,
+            'error_count': len(self.errors),
+            'elapsed': round(elapsed, 3),
+            'rows_per_second': (
+                round(rows_processed / elapsed, 1) if elapsed else 0.0
+            ),
+            'images_per_second': (
+                round(images_processed / elapsed, 1) if elapsed else 0.0
+            ),
+        }
+
+    class Meta:
+        verbose_name = "Import Job"
+        verbose_name_plural = "Import Jobs"
+        ordering = ['-created_at']
+
+
+class DataGeneration(models.Model):
+    """
+    Counter of changes to the teachers directory. Every import and every
+    change of a teacher or subject increments it, so caches and in-memory
+    indexes of other processes can tell when they are stale.
+    """
+
+    generation = models.PositiveBigIntegerField(
+        "Generation",
+        default=0
+    )
+    updated_at = models.DateTimeField(
+        "Updated At",
+        default=timezone.now
+    )
+
+    def __str__(self):
+        return f"Generation {self.generation}"
+
+    class Meta:
+        verbose_name = "Data Generation"
+        verbose_name_plural = "Data Generations"
+
+
+class ImportLock(models.Model):
+    """
+    Lock held by an import that must not run concurrently with another one,
+    e.g. a replace import, which owns the staging tables while it runs.
+    The holder refreshes ``updated_at`` while it runs, so the lock of an
+    import that died is taken over after IMPORT_LOCK_TIMEOUT seconds.
+    """
+
+    name = models.CharField(
+        "Name",
+        max_length=50,
+        unique=True
+    )
+    owner = models.CharField(
+        "Owner",
+        max_length=255
+    )
+    created_at = models.DateTimeField(
+        "Created At",
+        default=timezone.now
+    )
+    updated_at = models.DateTimeField(
+        "Updated At",
+        default=timezone.now
+    )
+
+    def __str__(self):
+        return f"{self.name} ({self.owner})"
+
+    class Meta:
+        verbose_name = "Import Lock"
+        verbose_name_plural = "Import Locks"
+
+
+class ChunkedUpload(models.Model):
+    """
+    File uploaded in chunks for an import. The chunks are written to the
+    spool directory of the upload and assembled into a single file once
+    the last one arrived, see ``core.utils.uploads``.
+    """
+
+    UPLOADING = 'uploading'
+    COMPLETE = 'complete'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (UPLOADING, 'Uploading'),
+        (COMPLETE, 'Complete'),
+        (FAILED, 'Failed'),
+    ]
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='chunked_uploads',
+        verbose_name="User"
+    )
+    filename = models.CharField(
+        "File Name",
+        max_length=255
+    )
+    size = models.PositiveBigIntegerField(
+        "Size"
+    )
+    offset = models.PositiveBigIntegerField(
+        "Offset",
+        default=0
+    )
+    expected_sha256 = models.CharField(
+        "Expected SHA-256",
+        max_length=64,
+        blank=True
+    )
+    sha256 = models.CharField(
+        "SHA-256",
+        max_length=64,
+        blank=True
+    )
+    status = models.CharField(
+        "Status",
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default=UPLOADING
+    )
+    created_at = models.DateTimeField(
+        "Created At",
+        auto_now_add=True
+    )
+    updated_at = models.DateTimeField(
+        "Updated At",
+        auto_now=True
+    )
+
+    def __str__(self):
+        return f"{self.filename} ({self.offset}/{self.size})"
+
+    def as_status(self):
+        """
+        Returns the upload progress as a JSON serializable dict. Clients
+        resume an interrupted upload from ``offset``.
+
+        Returns:
+            dict: Id, file name, size, offset, status and digest.
+        """
+        return {
+            'id': self.pk,
+            'filename': self.filename,
+            'size': self.size,
+            'offset': self.offset,
+            'status': self.status,
+            'sha256': self.sha256,
+        }
+
+    class Meta:
+        verbose_name = "Chunked Upload"
+        verbose_name_plural = "Chunked Uploads"
+        ordering = ['-created_at']
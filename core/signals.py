@@ -0,0 +1,90 @@
+import contextvars
+
+from contextlib import contextmanager
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from core.models import Subject, Teacher
+from core.utils.generation import bump_generation
+from core.utils.search import update_search_index
+
+_suppressed = contextvars.ContextVar('teacher_signals_suppressed',
+                                     default=False)
+
+
+@contextmanager
+def bulk_teacher_changes():
+    """
+    Suppresses the per-row receivers below while many teachers are changed,
+    e.g. by a bulk delete. The caller updates the search index and bumps the
+    generation once afterwards.
+    """
+    token = _suppressed.set(True)
+    try:
+        yield
+    finally:
+        _suppressed.reset(token)
+
+
+@receiver(post_save, sender=Teacher)
+@receiver(post_delete, sender=Teacher)
+def teacher_changed(sender, instance, **kwargs):
+    """ Updates the search index and the generation for a single teacher. """
+    if _suppressed.get():
+        return
+    update_search_index([instance.pk])
+    bump_generation()
+
+
+@receiver(m2m_changed, sender=Teacher.subjects_taught.through)
+def subjects_taught_changed(sender, instance, action, reverse, pk_set,
+                            **kwargs):
+    """ Updates the search index and the generation for changed subjects. """
+    if not action.startswith('post_') or _suppressed.get():
+        return
+    if not reverse:
+        teacher_ids = [instance.pk]
+    elif pk_set:
+        teacher_ids = list(pk_set)
+    else:
+        teacher_ids = list(instance.teachers.values_list('pk', flat=True))
+    update_search_index(teacher_ids)
+    touch_teachers(teacher_ids)
+    bump_generation()
+
+
+@receiver(post_save, sender=Subject)
+def subject_changed(sender, instance, created, **kwargs):
+    """ Updates the search index and the generation for renamed subjects. """
+    if not created and not _suppressed.get():
+        teacher_ids = list(instance.teachers.values_list('pk', flat=True))
+        update_search_index(teacher_ids)
+        touch_teachers(teacher_ids)
+        bump_generation()
+
+
+def touch_teachers(teacher_ids):
+    """
+    Increments the version of teachers whose subjects changed, so cached
+    profiles are not served for them.
+
+    Args:
+        teacher_ids (list): Ids of the changed teachers.
+    """
+    Teacher.objects.filter(pk__in=teacher_ids).update(
+        version=F('version') + 1, updated_at=timezone.now()
+    )
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    """ Applies SQLITE_PRAGMAS to new SQLite connections. """
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', {})
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
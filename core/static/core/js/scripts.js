@@ -2,19 +2,23 @@
  * Makes a GET request to the server to get a list of teachers matching the given query and page number.
  * @param {string} query - The search query string. Optional.
  * @param {number} page - The page number to display. Optional.
+ * @param {string} cursor - The cursor of the page to display, with cursor pagination. Optional.
  */
-function getTeachers(query, page) {
+function getTeachers(query, page, cursor) {
   // Create a new XMLHttpRequest object
   const xhr = new XMLHttpRequest();
 
-  // Set the URL for the GET request
-  let url = `list/?page=${page}`
+  // Set the URL for the GET request, with the parameters encoded
+  const params = new URLSearchParams({page: page || 1});
   if (query) {
-      url += `&query=${query}`;
+      params.set('query', query);
+  }
+  if (cursor) {
+      params.set('cursor', cursor);
   }
 
   // Open the XMLHttpRequest with the URL
-  xhr.open('GET', url);
+  xhr.open('GET', `list/?${params}`);
 
   // Define the function to execute when the XMLHttpRequest loads
   xhr.onload = function() {
@@ -23,6 +27,14 @@ function getTeachers(query, page) {
           const teachersList = document.getElementById('teachers-container');
           console.log(xhr.responseText)
           teachersList.innerHTML = xhr.responseText;
+
+          // Follow the pagination links with the parameters in their data attributes
+          teachersList.querySelectorAll('.pagination a[data-page]').forEach((link) => {
+              link.addEventListener('click', (event) => {
+                  event.preventDefault();
+                  getTeachers(link.dataset.query, link.dataset.page, link.dataset.cursor);
+              });
+          });
       } else {
           console.log('Search error!');
       }
@@ -31,3 +43,277 @@ function getTeachers(query, page) {
   // Send the XMLHttpRequest
   xhr.send();
 }
+
+/**
+ * Makes a GET request to the directory API and renders the returned teacher cards and pagination links.
+ * @param {string} query - The search query string. Optional.
+ * @param {string} cursor - The cursor of the page to display. Optional.
+ */
+function getTeacherCards(query, cursor) {
+  // Create a new XMLHttpRequest object
+  const xhr = new XMLHttpRequest();
+
+  // Set the URL for the GET request, unchanged pages are revalidated with their ETag
+  const params = new URLSearchParams();
+  if (query) {
+      params.set('query', query);
+  }
+  if (cursor) {
+      params.set('cursor', cursor);
+  }
+  const teachersList = document.getElementById('teachers-container');
+  xhr.open('GET', `${teachersList.dataset.apiUrl}?${params}`);
+
+  // Define the function to execute when the XMLHttpRequest loads
+  xhr.onload = function() {
+      if (xhr.status !== 200) {
+          console.log('Search error!');
+          return;
+      }
+      renderTeacherCards(teachersList, JSON.parse(xhr.responseText), query);
+  }
+
+  // Send the XMLHttpRequest
+  xhr.send();
+}
+
+/**
+ * Renders a page of the directory API into the given element.
+ * @param {HTMLElement} container - Element receiving the cards.
+ * @param {Object} data - Response of the directory API.
+ * @param {string} query - The search query string of the page. Optional.
+ */
+function renderTeacherCards(container, data, query) {
+  const cards = document.createElement('div');
+  cards.className = 'teachers-container';
+
+  // Build a card linking to the profile of every teacher
+  data.teachers.forEach((teacher) => {
+      const link = document.createElement('a');
+      link.href = teacher.url;
+      link.className = 'link-profile';
+      const card = document.createElement('div');
+      card.className = 'teacher-card';
+      const img = document.createElement('img');
+      img.src = teacher.thumbnail;
+      img.alt = teacher.name;
+      img.className = 'teacher-img';
+      img.loading = 'lazy';
+      const info = document.createElement('div');
+      info.className = 'teacher-info';
+      const name = document.createElement('h2');
+      name.className = 'teacher-name';
+      name.textContent = teacher.name;
+      const phone = document.createElement('p');
+      phone.className = 'teacher-phone';
+      phone.textContent = teacher.phone;
+      info.append(name, phone);
+      card.append(img, info);
+      link.appendChild(card);
+      cards.appendChild(link);
+  });
+
+  // Add links to the previous and next pages
+  const pagination = document.createElement('div');
+  pagination.className = 'pagination';
+  [[data.previous, '\u00ab'], [data.next, '\u00bb']].forEach(([cursor, label]) => {
+      if (cursor) {
+          const link = document.createElement('a');
+          link.href = '#';
+          link.textContent = label;
+          link.addEventListener('click', (event) => {
+              event.preventDefault();
+              getTeacherCards(query, cursor);
+          });
+          pagination.appendChild(link);
+      }
+  });
+
+  container.replaceChildren(cards, pagination);
+}
+
+/**
+ * Polls the status endpoint of an import job and updates the fields of the given element until the job finishes.
+ * @param {HTMLElement} container - Element with a data-status-url attribute and data-field children.
+ * @param {number} interval - Milliseconds between polls. Optional.
+ */
+function pollImportJob(container, interval = 1000) {
+  // Create a new XMLHttpRequest object
+  const xhr = new XMLHttpRequest();
+
+  // Open the XMLHttpRequest with the status URL of the job
+  xhr.open('GET', container.dataset.statusUrl);
+
+  // Define the function to execute when the XMLHttpRequest loads
+  xhr.onload = function() {
+      if (xhr.status !== 200) {
+          console.log('Import status error!');
+          return;
+      }
+      const status = JSON.parse(xhr.responseText);
+
+      // Update every field that is present in the response
+      container.querySelectorAll('[data-field]').forEach((field) => {
+          field.textContent = status[field.dataset.field];
+      });
+
+      // Show the error messages
+      const errors = container.querySelector('.import-errors');
+      errors.innerHTML = '';
+      status.errors.forEach((message) => {
+          const error = document.createElement('p');
+          error.className = 'error';
+          error.textContent = message;
+          errors.appendChild(error);
+      });
+
+      // Keep polling until the job is done or failed
+      if (status.status === 'queued' || status.status === 'running') {
+          setTimeout(() => pollImportJob(container, interval), interval);
+      }
+  }
+
+  // Send the XMLHttpRequest
+  xhr.send();
+}
+
+/**
+ * Uploads a file in chunks to the chunked upload endpoint. The upload URL is kept in localStorage, so after a dropped connection or a reload the same file resumes from the last acknowledged offset instead of starting over.
+ * @param {File} file - File to upload.
+ * @param {string} createUrl - URL starting a chunked upload.
+ * @param {string} csrfToken - CSRF token of the page.
+ * @param {number} chunkSize - Bytes sent per request.
+ * @param {function} onProgress - Called with the number of bytes acknowledged. Optional.
+ * @returns {Promise<object>} Status of the complete upload.
+ */
+async function uploadFileInChunks(file, createUrl, csrfToken, chunkSize, onProgress) {
+  const key = `chunked-upload:${file.name}:${file.size}:${file.lastModified}`;
+  const headers = {'X-CSRFToken': csrfToken};
+
+  // Resume an earlier upload of the same file, if the server still has it
+  let status = null;
+  const url = localStorage.getItem(key);
+  if (url) {
+      const response = await fetch(url, {headers: headers});
+      status = response.ok ? await response.json() : null;
+      if (!status || status.status === 'failed') {
+          status = null;
+          localStorage.removeItem(key);
+      }
+  }
+  if (!status) {
+      const data = new FormData();
+      data.append('filename', file.name);
+      data.append('size', file.size);
+      const response = await fetch(createUrl, {method: 'POST', headers: headers, body: data});
+      status = await response.json();
+      if (!response.ok) {
+          throw new Error(status.error);
+      }
+      localStorage.setItem(key, status.url);
+  }
+
+  let retries = 0;
+  while (status.status === 'uploading') {
+      const start = status.offset;
+      const chunk = file.slice(start, Math.min(start + chunkSize, file.size));
+      const chunkHeaders = {
+          ...headers,
+          'Content-Range': `bytes ${start}-${start + chunk.size - 1}/${file.size}`,
+      };
+      // Let the server check the chunk, where Web Crypto is available
+      if (window.crypto && crypto.subtle) {
+          const digest = await crypto.subtle.digest('SHA-256', await chunk.arrayBuffer());
+          chunkHeaders['Content-Digest'] = `sha-256=:${btoa(String.fromCharCode(...new Uint8Array(digest)))}:`;
+      }
+      let response;
+      try {
+          response = await fetch(status.url, {method: 'PUT', headers: chunkHeaders, body: chunk});
+      } catch (error) {
+          // Network error: ask the server where to resume after a pause
+          if (++retries > 5) {
+              throw error;
+          }
+          await new Promise((resolve) => setTimeout(resolve, 1000 * retries));
+          response = await fetch(status.url, {headers: headers});
+      }
+      const result = await response.json();
+      // 409: another request already appended this chunk, resume from the returned offset
+      if (!response.ok && response.status !== 409) {
+          throw new Error(result.error);
+      }
+      status = {...status, ...result};
+      if (onProgress) {
+          onProgress(status.offset);
+      }
+  }
+  if (status.status !== 'complete') {
+      localStorage.removeItem(key);
+      throw new Error(`Upload of ${file.name} failed.`);
+  }
+  localStorage.removeItem(key);
+  return status;
+}
+
+/**
+ * Submits the import form with chunked uploads: the files are uploaded in chunks, and the import is started from the uploaded files. Browsers without fetch submit the form as a regular multipart post.
+ * @param {HTMLFormElement} form - Import form with data-upload-url, data-import-url and data-chunk-size attributes.
+ */
+function enableChunkedImport(form) {
+  if (!window.fetch) {
+      return;
+  }
+  form.addEventListener('submit', async (event) => {
+      event.preventDefault();
+      const csrfToken = form.querySelector('[name=csrfmiddlewaretoken]').value;
+      const chunkSize = parseInt(form.dataset.chunkSize);
+      const progress = form.querySelector('.upload-progress');
+      const data = new FormData();
+      data.append('mode', form.elements.mode.value);
+
+      try {
+          for (const [field, upload] of [['csv_file', 'csv_upload'], ['zip_file', 'zip_upload']]) {
+              const file = form.elements[field].files[0];
+              if (!file) {
+                  continue;
+              }
+              const status = await uploadFileInChunks(
+                  file, form.dataset.uploadUrl, csrfToken, chunkSize,
+                  (offset) => {
+                      progress.textContent = `Uploading ${file.name}: ${Math.floor(100 * offset / file.size)}%`;
+                  }
+              );
+              data.append(upload, status.id);
+          }
+          progress.textContent = 'Validating...';
+
+          const response = await fetch(form.dataset.importUrl, {
+              method: 'POST', headers: {'X-CSRFToken': csrfToken}, body: data,
+          });
+          const result = await response.json();
+          if (response.ok) {
+              window.location = result.url;
+              return;
+          }
+
+          // Show the validation errors, and the job importing the valid rows
+          const errors = form.querySelector('.import-errors');
+          errors.innerHTML = '';
+          Object.values(result.errors).flat().forEach((message) => {
+              const error = document.createElement('p');
+              error.className = 'error';
+              error.textContent = message;
+              errors.appendChild(error);
+          });
+          progress.textContent = '';
+          if (result.url) {
+              const link = document.createElement('a');
+              link.href = result.url;
+              link.textContent = `Import #${result.job}`;
+              progress.append('The valid rows are being imported: ', link);
+          }
+      } catch (error) {
+          progress.textContent = `Upload error: ${error.message}`;
+      }
+  });
+}
@@ -0,0 +1,87 @@
+import gzip
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_EXTENSIONS = (
+    '.css', '.js', '.json', '.map', '.svg', '.txt', '.html', '.xml',
+)
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    Static files storage that stores files under content-hashed names and
+    writes gzip and, if the ``brotli`` package is installed, brotli
+    compressed variants of text assets next to them, e.g. 'app.3f2a.js.gz'.
+    Compression happens once in ``collectstatic``, so servers only pick the
+    variant matching the Accept-Encoding header of a request.
+
+    Files missing from the manifest, e.g. because ``collectstatic`` was not
+    run yet, are referred to by their unhashed names instead of failing
+    every page that uses ``{% static %}``.
+
+    Attributes:
+        min_size (int): Smallest file size worth compressing, in bytes.
+    """
+
+    min_size = 256
+    manifest_strict = False
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            # Not in the manifest and not collected to STATIC_ROOT either
+            return name
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        # The manifest lists the final hashed names once all passes are done
+        for name in sorted(set(paths) | set(self.hashed_files.values())):
+            if name.endswith(COMPRESSIBLE_EXTENSIONS) and self.exists(name):
+                self.compress(name)
+
+    def compress(self, name):
+        """
+        Writes the compressed variants of a stored file, if they are smaller
+        than the file itself.
+
+        Args:
+            name (str): Storage name of the file.
+        """
+        with self.open(name) as original:
+            content = original.read()
+        if len(content) < self.min_size:
+            return
+
+        variants = {'.gz': gzip.compress(content, 9, mtime=0)}
+        if brotli is not None:
+            variants['.br'] = brotli.compress(content)
+        for extension, compressed in variants.items():
+            if len(compressed) >= len(content) * 0.95:
+                continue
+            if self.exists(name + extension):
+                self.delete(name + extension)
+            self._save(name + extension, ContentFile(compressed))
+
+    def is_hashed(self, name):
+        """
+        Checks whether a name is the content-hashed name of a file, which
+        never changes and can be cached indefinitely.
+
+        Args:
+            name (str): Storage name.
+
+        Returns:
+            bool: True for names listed as hashed names in the manifest.
+        """
+        if not hasattr(self, '_hashed_names'):
+            self._hashed_names = set(self.hashed_files.values())
+        return name in self._hashed_names
@@ -0,0 +1,33 @@
+from django import template
+from core.utils.thumbnails import get_variants, picture_sources
+
+register = template.Library()
+
+
+@register.inclusion_tag('profile_picture.html')
+def profile_picture(teacher, variant, css_class=''):
+    """
+    Renders the profile picture of a teacher with the derivatives of the
+    given variant in a ``<picture>`` element, so browsers download the
+    smallest suitable file. Falls back to the original picture when no
+    derivatives exist, and to the default avatar when there is no picture.
+
+    Usage:
+        {% profile_picture teacher 'card' 'teacher-img' %}
+    """
+    sources = []
+    if teacher.profile_picture:
+        sources = picture_sources(
+            teacher.profile_picture.storage,
+            teacher.profile_picture.name,
+            variant
+        )
+    width = get_variants()[variant][0]
+    return {
+        'teacher': teacher,
+        'sources': sources,
+        # The last format is the most widely supported one
+        'src': sources[-1]['src'] if sources else None,
+        'width': width,
+        'css_class': css_class,
+    }
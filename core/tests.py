@@ -1,3 +1,851 @@
-from django.test import TestCase
+import base64
+import csv
+import hashlib
+import io
+import json
+import os
+import shutil
+import struct
+import tempfile
+import zipfile
+import zlib
 
-# Create your tests here.
+from datetime import timedelta
+from unittest import mock
+from PIL import Image
+from django.contrib.auth.models import User
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils import timezone
+from core.middleware import RequestMetricsMiddleware
+from core.models import ImportJob, ImportLock, Subject, Teacher
+from core.utils.directory_cache import get_directory_cache
+from core.utils.export import export_teachers
+from core.utils.importer import import_teachers_from_csv
+from core.utils.importer import import_teachers_from_csv_and_zip
+from core.utils.jobs import claim_import_job, create_import_job
+from core.utils.jobs import get_import_job_status, progress_cache_key
+from core.utils.jobs import run_import_job, run_next_import_job
+from core.utils.pagination import paginate_by_cursor
+from core.utils.prefix_index import get_prefix_index
+from core.utils.search import fts_available, search_teachers
+from core.utils.shadow_import import LOCK_NAME, SHADOW_INDEX_SUFFIX
+from core.utils.shadow_import import ReplaceImportRunning
+from core.utils.shadow_import import replace_teachers_from_csv
+from core.utils.synthetic import synthetic_archive, synthetic_roster
+from core.validators.csv_file_validator import CSVFileValidator
+from core.validators.zip_file_validator import ZipFileValidator
+from core.views import MetricsView
+
+CSV_HEADER = (
+    'first_name,last_name,email_address,phone_number,room_number,'
+    'subjects_taught\n'
+)
+
+
+class TemporaryDirectoryMixin():
+    """ Runs every test with media and uploads in a temporary directory. """
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.mkdtemp(prefix='teachers-test-')
+        settings = override_settings(
+            MEDIA_ROOT=os.path.join(self.directory, 'media'),
+            UPLOADS_DIR=os.path.join(self.directory, 'uploads'),
+            IMPORT_JOBS_DIR=os.path.join(self.directory, 'import_jobs'),
+            IMPORT_JOB_THREADS=0,
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+
+class BulkTeacherImporterTests(TemporaryDirectoryMixin, TestCase):
+
+    def test_counts(self):
+        roster = synthetic_roster(10)
+        summary = import_teachers_from_csv(roster)
+        self.assertEqual(
+            (summary['inserted'], summary['updated'], summary['unchanged']),
+            (10, 0, 0)
+        )
+
+        changed = roster.copy()
+        changed.loc[0, 'room_number'] = '999'
+        summary = import_teachers_from_csv(changed)
+        self.assertEqual(
+            (summary['inserted'], summary['updated'], summary['unchanged'],
+             summary['removed']),
+            (0, 1, 9, 0)
+        )
+        teacher = Teacher.objects.get(
+            email_address=roster.loc[0, 'email_address']
+        )
+        self.assertEqual(teacher.room_number, '999')
+        self.assertEqual(teacher.version, 2)
+
+    def test_sync_removes_missing_teachers(self):
+        roster = synthetic_roster(10)
+        import_teachers_from_csv(roster)
+        summary = import_teachers_from_csv(roster.iloc[:4], sync=True)
+        self.assertEqual((summary['unchanged'], summary['removed']), (4, 6))
+        self.assertEqual(Teacher.objects.count(), 4)
+        self.assertEqual(
+            Teacher.subjects_taught.through.objects.exclude(
+                teacher_id__in=Teacher.objects.values('pk')
+            ).count(),
+            0
+        )
+
+    def test_undecodable_picture_is_skipped(self):
+        source = io.BytesIO()
+        synthetic_archive(source, 2)
+        archive = os.path.join(self.directory, 'pictures.zip')
+        with zipfile.ZipFile(source) as original, \
+                zipfile.ZipFile(archive, 'w') as truncated:
+            for name in original.namelist():
+                data = original.read(name)
+                if name.endswith('1.jpg'):
+                    data = data[:len(data) // 2]
+                truncated.writestr(name, data)
+        ZipFileValidator()(archive)
+
+        roster = synthetic_roster(6, pictures=2)
+        summary = import_teachers_from_csv_and_zip(roster, archive)
+        broken = (roster['profile_picture'] == 'teacher-000001.jpg').sum()
+        self.assertEqual(summary['inserted'], 6)
+        self.assertEqual(len(summary['errors']), broken)
+        self.assertEqual(
+            Teacher.objects.exclude(profile_picture='').count(), 6 - broken
+        )
+
+
+class ImportJobTests(TemporaryDirectoryMixin, TestCase):
+
+    def create_job(self, rows, **kwargs):
+        file = io.BytesIO(synthetic_roster(rows).to_csv(index=False).encode())
+        CSVFileValidator()(file)
+        return create_import_job(file.teachers_dataset, **kwargs)
+
+    def test_job_is_claimed_once(self):
+        job = self.create_job(5)
+        self.assertEqual(job.status, ImportJob.QUEUED)
+        self.assertTrue(claim_import_job(job.pk))
+        self.assertFalse(claim_import_job(job.pk))
+        self.assertFalse(run_import_job(job.pk))
+        self.assertEqual(Teacher.objects.count(), 0)
+
+    @override_settings(IMPORT_BATCH_SIZE=10)
+    def test_progress(self):
+        first, second = self.create_job(25), self.create_job(5)
+        key = progress_cache_key(first.pk)
+        with mock.patch('core.utils.jobs.cache') as cache:
+            self.assertTrue(run_next_import_job())
+        self.assertEqual(
+            [call.args[:2] for call in cache.set.call_args_list],
+            [(key, (10, 0)), (key, (20, 0)), (key, (25, 0)), (key, (25, 0))]
+        )
+        cache.delete.assert_called_once_with(key)
+
+        first.refresh_from_db()
+        status = get_import_job_status(first)
+        self.assertEqual(
+            (status['status'], status['rows_processed'], status['inserted']),
+            (ImportJob.DONE, 25, 25)
+        )
+        self.assertFalse(os.path.exists(os.path.dirname(first.data_path)))
+        self.assertEqual(
+            ImportJob.objects.get(pk=second.pk).status, ImportJob.QUEUED
+        )
+
+        # Running jobs report the live counters of the cache
+        with mock.patch('core.utils.jobs.cache') as cache:
+            cache.get.return_value = (3, 1)
+            second.status = ImportJob.RUNNING
+            status = get_import_job_status(second)
+        cache.get.assert_called_once_with(
+            progress_cache_key(second.pk), (None, None)
+        )
+        self.assertEqual(
+            (status['rows_processed'], status['images_processed']), (3, 1)
+        )
+
+    def test_empty_queue(self):
+        self.assertFalse(run_next_import_job())
+
+
+class CSVFileValidatorTests(TestCase):
+
+    def validate(self, content, chunk_size=2):
+        file = io.BytesIO((CSV_HEADER + content).encode())
+        try:
+            CSVFileValidator(chunk_size=chunk_size)(file)
+            messages = []
+        except ValidationError as e:
+            messages = e.messages
+        self.addCleanup(file.teachers_dataset.close)
+        return messages, file.teachers_dataset
+
+    def test_errors_across_chunks(self):
+        messages, dataset = self.validate(
+            'A,B,a@x.io,+1-555-000-000,1,Math\n'
+            ',B,bad,+1-555-000-001,1,Math\n'
+            'C,D,a@x.io,123,1,"a,b,c,d,e,f"\n'
+            'E,F,e@x.io,+1-555-000-003,2,Math\n'
+        )
+        self.assertEqual(messages, [
+            "Row 1, Column 'first_name': Field is empty",
+            "Row 0, Column 'email_address': Duplicate email address",
+            "Row 1, Column 'email_address': Invalid email address",
+            "Row 2, Column 'email_address': Duplicate email address",
+            "Row 2, Column 'phone_number': Invalid phone number",
+            "Row 2, Column 'subjects_taught': More than 5 subjects",
+        ])
+        # Rows with a duplicate email address in another chunk are excluded
+        emails = [email for df in dataset for email in df['email_address']]
+        self.assertEqual(emails, ['e@x.io'])
+
+    def test_order_does_not_depend_on_chunk_size(self):
+        content = ''.join(
+            f',N,dup@x.io,+1-555-000-{i:03d},1,Math\n' for i in range(5)
+        )
+        self.assertEqual(
+            self.validate(content, chunk_size=2)[0],
+            self.validate(content, chunk_size=100)[0]
+        )
+
+
+class ExportTests(TemporaryDirectoryMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        archive = os.path.join(self.directory, 'pictures.zip')
+        synthetic_archive(archive, 3, size=(64, 64))
+        roster = synthetic_roster(12, pictures=3)
+        roster.loc[0, 'profile_picture'] = None
+        import_teachers_from_csv_and_zip(roster, archive)
+        self.state = self.directory_state()
+
+    @staticmethod
+    def directory_state():
+        return {
+            teacher.pk: (
+                teacher.first_name, teacher.room_number,
+                teacher.profile_picture.name or '', teacher.version,
+                tuple(sorted(s.name for s in teacher.subjects_taught.all()))
+            )
+            for teacher in Teacher.objects.prefetch_related('subjects_taught')
+        }
+
+    def export_dataset(self):
+        file = io.BytesIO(''.join(export_teachers('csv')).encode())
+        CSVFileValidator()(file)
+        self.addCleanup(file.teachers_dataset.close)
+        return file.teachers_dataset
+
+    def test_formats(self):
+        # One query for the teachers and one for the subjects of every chunk
+        with self.assertNumQueries(4):
+            csv_export = ''.join(export_teachers('csv', chunk_size=5))
+        lines = [json.loads(line) for line in
+                 ''.join(export_teachers('jsonl')).splitlines()]
+        rows = list(csv.DictReader(io.StringIO(csv_export)))
+        self.assertEqual(rows, lines)
+        self.assertEqual(
+            {row['email_address']: row['profile_picture'] for row in rows},
+            dict(Teacher.objects.values_list(
+                'email_address', 'profile_picture'
+            ))
+        )
+        self.assertEqual(sum(not row['profile_picture'] for row in rows), 1)
+        with self.assertRaises(ValueError):
+            list(export_teachers('xml'))
+
+    def test_round_trip(self):
+        summary = import_teachers_from_csv(self.export_dataset())
+        self.assertEqual((summary['unchanged'], summary['updated']), (12, 0))
+        self.assertEqual(self.directory_state(), self.state)
+
+        summary = import_teachers_from_csv(self.export_dataset(), sync=True)
+        self.assertEqual((summary['unchanged'], summary['removed']), (12, 0))
+        if connection.vendor == 'sqlite':
+            summary = replace_teachers_from_csv(self.export_dataset())
+            self.assertEqual(
+                (summary['unchanged'], summary['updated'],
+                 summary['removed']),
+                (12, 0, 0)
+            )
+        self.assertEqual(self.directory_state(), self.state)
+
+    def test_changed_rows_are_updated(self):
+        dataset = self.export_dataset()
+        teacher = Teacher.objects.get(profile_picture='')
+        teacher.subjects_taught.add(Subject.objects.create(name='Latin'))
+        # Merging the export only adds subjects the teacher already has
+        summary = import_teachers_from_csv(dataset)
+        self.assertEqual((summary['unchanged'], summary['updated']), (12, 0))
+        summary = import_teachers_from_csv(self.export_dataset(), sync=True)
+        self.assertEqual((summary['unchanged'], summary['updated']), (12, 0))
+        summary = import_teachers_from_csv(dataset, sync=True)
+        self.assertEqual((summary['unchanged'], summary['updated']), (11, 1))
+        self.assertFalse(teacher.subjects_taught.filter(name='Latin'))
+
+        Teacher.objects.filter(pk=teacher.pk).update(room_number='999')
+        dataset = self.export_dataset()
+        Teacher.objects.filter(pk=teacher.pk).update(room_number='1')
+        summary = import_teachers_from_csv(dataset)
+        self.assertEqual((summary['unchanged'], summary['updated']), (11, 1))
+        teacher.refresh_from_db()
+        self.assertEqual(teacher.room_number, '999')
+
+
+class ZipFileValidatorTests(TestCase):
+
+    def archive(self, members, compression=zipfile.ZIP_STORED):
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w', compression) as f:
+            for name, data in members.items():
+                f.writestr(name, data)
+        archive.seek(0)
+        return archive
+
+    def validate(self, archive, **kwargs):
+        try:
+            ZipFileValidator(**kwargs)(archive)
+        except ValidationError as e:
+            return e.messages
+        return []
+
+    @staticmethod
+    def png(size=(4, 4)):
+        image = io.BytesIO()
+        Image.new('L', size).save(image, 'PNG')
+        return image.getvalue()
+
+    def test_valid_archive(self):
+        self.assertEqual(self.validate(self.archive({'a.png': self.png()})),
+                         [])
+
+    def test_size_limits(self):
+        png = self.png()
+        archive = self.archive({'a.png': png, 'b.png': png + b'\0' * 100})
+        self.assertEqual(
+            self.validate(archive, max_member_size=len(png) + 50),
+            ["File 'b.png': Image file is too large"]
+        )
+        self.assertEqual(
+            self.validate(archive, max_total_size=2 * len(png)),
+            [f'ZIP file is too large when extracted '
+             f'({2 * len(png) + 100} bytes)']
+        )
+
+    def test_compression_ratio(self):
+        archive = self.archive(
+            {'a.png': self.png() + b'\0' * 100000}, zipfile.ZIP_DEFLATED
+        )
+        self.assertEqual(self.validate(archive),
+                         ["File 'a.png': Suspicious compression ratio"])
+
+    def test_pixel_bomb(self):
+        # A few bytes declaring a 30000 x 30000 pixel image
+        data = bytearray(self.png((1, 1)))
+        data[16:24] = struct.pack('>II', 30000, 30000)
+        data[29:33] = struct.pack('>I', zlib.crc32(data[12:29]))
+        archive = self.archive({'bomb.png': bytes(data)})
+        self.assertEqual(self.validate(archive),
+                         ["File 'bomb.png': Image dimensions are too large"])
+
+
+class SearchFixtureMixin():
+    """ Creates four teachers with overlapping subjects to search. """
+
+    def setUp(self):
+        super().setUp()
+        for first_name, last_name, subjects in [
+            ('Ada', 'Lovelace', ['Computer Science', 'Mathematics']),
+            ('José', 'Núñez', ['History']),
+            ('Grace', 'Hopper', ['Computer Science']),
+            ('Alan', 'Turing', ['Mathematics']),
+        ]:
+            teacher = Teacher.objects.create(
+                first_name=first_name, last_name=last_name,
+                email_address=f'{first_name.lower()}@school.example',
+                phone_number='+1-555-000-000', room_number='1'
+            )
+            teacher.subjects_taught.add(*(
+                Subject.objects.get_or_create(name=name)[0]
+                for name in subjects
+            ))
+
+    def search(self, query):
+        return {teacher.first_name for teacher in
+                search_teachers(Teacher.objects.all(), query)}
+
+
+class SearchTests(SearchFixtureMixin, TestCase):
+    """ Searches with the FTS5 table, kept current by the signals. """
+
+    def setUp(self):
+        if not fts_available():
+            self.skipTest('SQLite is built without FTS5')
+        super().setUp()
+
+    def test_fts_search(self):
+        self.assertEqual(self.search('sci'), {'Ada', 'Grace'})
+        self.assertEqual(self.search('comp MATH'), {'Ada'})
+        self.assertEqual(self.search('nunez'), {'José'})
+        # FTS5 query syntax in the query is searched for as text
+        self.assertEqual(self.search('"sci* OR'), set())
+        self.assertEqual(self.search('(sci)'), {'Ada', 'Grace'})
+        self.assertEqual(self.search('  '), {'Ada', 'José', 'Grace', 'Alan'})
+
+    def test_fts_index_follows_changes(self):
+        subject = Subject.objects.get(name='History')
+        subject.name = 'Art'
+        subject.save()
+        self.assertEqual(self.search('art'), {'José'})
+        self.assertEqual(self.search('hist'), set())
+
+        grace = Teacher.objects.get(first_name='Grace')
+        grace.subjects_taught.add(subject)
+        self.assertEqual(self.search('art'), {'José', 'Grace'})
+        grace.subjects_taught.clear()
+        self.assertEqual(self.search('sci'), {'Ada'})
+
+        Teacher.objects.get(first_name='Ada').delete()
+        self.assertEqual(self.search('math'), {'Alan'})
+
+    @override_settings(DIRECTORY_SEARCH_BACKEND='orm')
+    def test_orm_search(self):
+        # Tokens only match the start of names and subject names
+        self.assertEqual(self.search('sci'), set())
+        self.assertEqual(self.search('comp'), {'Ada', 'Grace'})
+        self.assertEqual(self.search('ADA comp'), {'Ada'})
+        self.assertEqual(self.search('lov math'), {'Ada'})
+
+
+@override_settings(DIRECTORY_SEARCH_BACKEND='memory')
+class PrefixIndexTests(SearchFixtureMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        # Generations restart with every test, so indexes built by other
+        # tests would be taken for current
+        index = mock.patch('core.utils.prefix_index._index', None)
+        index.start()
+        self.addCleanup(index.stop)
+
+    def test_search(self):
+        self.assertEqual(self.search('sci'), {'Ada', 'Grace'})
+        self.assertEqual(self.search('comp MATH'), {'Ada'})
+        self.assertEqual(self.search('nunez'), {'José'})
+        self.assertEqual(self.search('jos nu'), {'José'})
+        self.assertEqual(self.search('x'), set())
+
+    def test_results_in_directory_order(self):
+        teachers = Teacher.objects.all()
+        hopper, lovelace = teachers.filter(first_name__in=['Ada', 'Grace'])
+        results = search_teachers(teachers, 'comp')
+        self.assertEqual(len(results), 2)
+        self.assertEqual(results[0:2], [hopper, lovelace])
+        self.assertEqual(results[1], lovelace)
+        key = (hopper.last_name, hopper.first_name, hopper.pk)
+        self.assertEqual(results.offset(key), 1)
+        self.assertEqual(results.offset(key, after=False), 0)
+
+        page = paginate_by_cursor(results, None, 1)
+        self.assertEqual(list(page), [hopper])
+        page = paginate_by_cursor(results, page.next_cursor, 1)
+        self.assertEqual(list(page), [lovelace])
+        self.assertFalse(page.has_next())
+        page = paginate_by_cursor(results, page.previous_cursor, 1)
+        self.assertEqual(list(page), [hopper])
+
+    def test_index_is_rebuilt_for_new_generations(self):
+        index = get_prefix_index()
+        self.assertIs(get_prefix_index(), index)
+        Teacher.objects.create(
+            first_name='Katherine', last_name='Johnson',
+            email_address='katherine@school.example',
+            phone_number='+1-555-000-000', room_number='1'
+        )
+        self.assertIsNot(get_prefix_index(), index)
+        self.assertEqual(self.search('kath'), {'Katherine'})
+
+
+class CursorPaginationTests(TestCase):
+
+    def setUp(self):
+        import_teachers_from_csv(synthetic_roster(20))
+        self.teachers = Teacher.objects.all()
+        self.ordered = list(
+            self.teachers.order_by('last_name', 'first_name', 'pk')
+        )
+
+    def test_forward_and_back(self):
+        pages, cursor = [], None
+        while True:
+            page = paginate_by_cursor(self.teachers, cursor, 8)
+            pages.append(list(page))
+            if not page.has_next():
+                break
+            cursor = page.next_cursor
+        self.assertEqual([len(page) for page in pages], [8, 8, 4])
+        self.assertEqual(sum(pages, []), self.ordered)
+
+        last = paginate_by_cursor(self.teachers, cursor, 8)
+        previous = paginate_by_cursor(self.teachers, last.previous_cursor, 8)
+        self.assertEqual(list(previous), self.ordered[8:16])
+        first = paginate_by_cursor(
+            self.teachers, previous.previous_cursor, 8
+        )
+        self.assertEqual(list(first), self.ordered[:8])
+        self.assertFalse(first.has_previous())
+
+    def test_invalid_cursor_returns_first_page(self):
+        page = paginate_by_cursor(self.teachers, 'not-a-cursor', 8)
+        self.assertEqual(list(page), self.ordered[:8])
+
+
+class ShadowImportTests(TemporaryDirectoryMixin, TestCase):
+
+    def index_names(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'index' "
+                "AND tbl_name LIKE 'core_teacher%%' AND sql IS NOT NULL"
+            )
+            return {name for name, in cursor.fetchall()}
+
+    def test_replace_keeps_ids_sequence_and_index_names(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('The swap is SQLite only')
+        roster = synthetic_roster(7)
+        import_teachers_from_csv(roster)
+        pks = dict(Teacher.objects.values_list('email_address', 'pk'))
+        highest = max(pks.values())
+        indexes = self.index_names()
+
+        # The teacher with the highest id is missing from the file
+        summary = replace_teachers_from_csv(roster.iloc[:6])
+        self.assertEqual((summary['unchanged'], summary['removed']), (6, 1))
+        self.assertEqual(
+            dict(Teacher.objects.values_list('email_address', 'pk')),
+            {email: pk for email, pk in pks.items() if pk != highest}
+        )
+        teacher = Teacher.objects.create(
+            first_name='New', last_name='Teacher',
+            email_address='new@school.example',
+            phone_number='+1-555-000-000', room_number='1'
+        )
+        self.assertGreater(teacher.pk, highest)
+
+        self.assertEqual(self.index_names(), indexes)
+        self.assertFalse(any(
+            name.endswith(SHADOW_INDEX_SUFFIX) for name in self.index_names()
+        ))
+
+        # A second replace reuses the plain index names again
+        replace_teachers_from_csv(roster.iloc[:5])
+        self.assertEqual(self.index_names(), indexes)
+        self.assertFalse(ImportLock.objects.exists())
+
+    def test_concurrent_replace_is_refused(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('The swap is SQLite only')
+        roster = synthetic_roster(5)
+        import_teachers_from_csv(roster)
+        ImportLock.objects.create(name=LOCK_NAME, owner='import job')
+        # Staging tables being loaded by the other import
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE TABLE core_teacher_staging (id integer)')
+
+        with self.assertRaisesMessage(ReplaceImportRunning, 'import job'):
+            replace_teachers_from_csv(roster.iloc[:2])
+        self.assertEqual(Teacher.objects.count(), 5)
+        self.assertIn('core_teacher_staging',
+                      connection.introspection.table_names())
+
+        csv_path = os.path.join(self.directory, 'teachers.csv')
+        roster.iloc[:2].to_csv(csv_path, index=False)
+        with self.assertRaisesMessage(CommandError, 'import job'):
+            call_command('import_teachers', csv_path, '--mode', 'replace',
+                         stdout=io.StringIO())
+
+        with open(csv_path, 'rb') as file:
+            CSVFileValidator()(file)
+        job = create_import_job(file.teachers_dataset, mode=ImportJob.REPLACE)
+        with self.assertLogs('core.utils.jobs', 'WARNING'):
+            run_import_job(job.pk)
+        job.refresh_from_db()
+        self.assertEqual(job.status, ImportJob.FAILED)
+        self.assertIn('Another replace import is running', job.errors[-1])
+        self.assertEqual(Teacher.objects.count(), 5)
+
+    def test_expired_lock_is_taken_over(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('The swap is SQLite only')
+        roster = synthetic_roster(5)
+        import_teachers_from_csv(roster)
+        ImportLock.objects.create(
+            name=LOCK_NAME, owner='killed import',
+            updated_at=timezone.now() - timedelta(hours=1)
+        )
+        replace_teachers_from_csv(roster.iloc[:2])
+        self.assertEqual(Teacher.objects.count(), 2)
+        self.assertFalse(ImportLock.objects.exists())
+
+    def test_import_that_lost_its_lock_is_not_swapped_in(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('The swap is SQLite only')
+        roster = synthetic_roster(5)
+        import_teachers_from_csv(roster)
+
+        def progress(rows, images):
+            # The lock expired and another import took it over
+            ImportLock.objects.all().delete()
+
+        with self.assertRaises(ReplaceImportRunning):
+            replace_teachers_from_csv(roster.iloc[:2], progress=progress)
+        self.assertEqual(Teacher.objects.count(), 5)
+        self.assertNotIn('core_teacher_staging',
+                         connection.introspection.table_names())
+
+
+class StaticFilesTests(TemporaryDirectoryMixin, TestCase):
+
+    def test_pages_render_before_collectstatic(self):
+        with override_settings(STATIC_ROOT=self.directory):
+            response = self.client.get('/teachers/directory/')
+        self.assertContains(response, '/static/core/css/style.css')
+        self.assertContains(response, '/static/core/js/scripts.js')
+
+
+class TeachersDirectoryListViewTests(TestCase):
+
+    def setUp(self):
+        roster = synthetic_roster(12)
+        roster['last_name'] = 'Smith'
+        import_teachers_from_csv(roster)
+        # Generations restart with every test
+        self.addCleanup(get_directory_cache().clear)
+
+    def test_pages_are_cached_per_generation(self):
+        url = '/teachers/directory/list/?query=smith'
+        content = self.client.get(url).content
+        # Only the generation is read for a cached page
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(url).content, content)
+
+        teacher = Teacher.objects.first()
+        teacher.first_name = 'Aardvark'
+        teacher.save()
+        response = self.client.get(url)
+        self.assertNotEqual(response.content, content)
+        self.assertContains(response, 'Aardvark Smith')
+
+    def test_pages_keep_the_spelling_of_the_query(self):
+        url = '/teachers/directory/list/'
+        for query in ('SMITH', 'smith', ' smith'):
+            response = self.client.get(url, {'query': query})
+            self.assertContains(response, '12 teachers')
+            self.assertContains(response, f'data-query="{query}"', count=1)
+
+
+class TeachersDirectoryApiViewTests(TestCase):
+
+    def setUp(self):
+        import_teachers_from_csv(synthetic_roster(12))
+        # Generations restart with every test
+        self.addCleanup(get_directory_cache().clear)
+
+    def test_etag(self):
+        url = '/teachers/directory/api/?query=a'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('no-cache', response['Cache-Control'])
+        data = response.json()
+        self.assertTrue(data['teachers'])
+        self.assertEqual(data['previous'], None)
+        etag = response['ETag']
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertNotEqual(
+            self.client.get('/teachers/directory/api/?query=b')['ETag'], etag
+        )
+
+        # Any change of the directory changes the ETag of every page
+        teacher = Teacher.objects.first()
+        teacher.room_number = '999'
+        teacher.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json(), data)
+
+    def test_pages(self):
+        response = self.client.get('/teachers/directory/api/')
+        data = response.json()
+        self.assertEqual(
+            [card['id'] for card in data['teachers']],
+            list(Teacher.objects.values_list('pk', flat=True)[:8])
+        )
+        response = self.client.get(
+            '/teachers/directory/api/', {'cursor': data['next']}
+        )
+        self.assertEqual(len(response.json()['teachers']), 4)
+        self.assertEqual(response.json()['next'], None)
+
+
+class TeacherProfileViewTests(TemporaryDirectoryMixin, TestCase):
+
+    def create_teacher(self, pk, first_name):
+        return Teacher.objects.create(
+            pk=pk, first_name=first_name, last_name='Teacher',
+            email_address=f'{first_name.lower()}@school.example',
+            phone_number='+1-555-000-000', room_number='1'
+        )
+
+    def test_reused_pk_is_not_served_from_cache(self):
+        teacher = self.create_teacher(1, 'Deleted')
+        url = f'/teachers/{teacher.pk}/'
+        etag = self.client.get(url)['ETag']
+        teacher.delete()
+
+        self.create_teacher(1, 'Reused')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertContains(response, 'Reused')
+        self.assertEqual(
+            self.client.get(
+                url, HTTP_IF_NONE_MATCH=response['ETag']
+            ).status_code,
+            304
+        )
+
+
+class RequestMetricsTests(TestCase):
+
+    def get_metrics(self, address):
+        request = RequestFactory().get('/metrics', REMOTE_ADDR=address)
+        return MetricsView.as_view()(request)
+
+    def test_metrics_allowlist(self):
+        response = self.get_metrics('127.0.0.1')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('no-store', response['Cache-Control'])
+        self.assertIn(b'teacher_directory_import_duration_seconds',
+                      response.content)
+        with self.assertRaises(PermissionDenied):
+            self.get_metrics('10.0.0.1')
+        with override_settings(METRICS_ALLOWED_IPS=['10.0.0.1']):
+            self.assertEqual(self.get_metrics('10.0.0.1').status_code, 200)
+            with self.assertRaises(PermissionDenied):
+                self.get_metrics('127.0.0.1')
+
+    def test_metrics_are_off_by_default(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+        self.assertNotIn('Server-Timing', self.client.get('/login/'))
+
+    @override_settings(REQUEST_METRICS=True)
+    def test_server_timing(self):
+        def view(request):
+            list(Teacher.objects.all())
+            return HttpResponse()
+
+        middleware = RequestMetricsMiddleware(view)
+        response = middleware(RequestFactory().get('/'))
+        self.assertRegex(
+            response['Server-Timing'],
+            r'^db;dur=[\d.]+;desc="1 queries", render;dur=[\d.]+, '
+            r'total;dur=[\d.]+$'
+        )
+
+
+class ChunkedUploadTests(TemporaryDirectoryMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('uploader', password='secret')
+        self.client.force_login(self.user)
+        self.data = os.urandom(3000)
+
+    def create(self, **data):
+        data.setdefault('filename', 'teachers.csv')
+        data.setdefault('size', len(self.data))
+        response = self.client.post('/teachers/import/uploads/', data)
+        self.assertEqual(response.status_code, 201)
+        return response.json()['url']
+
+    def put(self, url, start, end, size=None, digest=None, body=None):
+        body = self.data[start:end + 1] if body is None else body
+        headers = {
+            'HTTP_CONTENT_RANGE':
+                f'bytes {start}-{end}/{size or len(self.data)}',
+        }
+        if digest is not None:
+            headers['HTTP_CONTENT_DIGEST'] = (
+                f'sha-256=:{base64.b64encode(digest).decode()}:'
+            )
+        return self.client.put(
+            url, body, content_type='application/octet-stream', **headers
+        )
+
+    def test_upload_in_chunks(self):
+        url = self.create(sha256=hashlib.sha256(self.data).hexdigest())
+        for start in range(0, len(self.data), 1000):
+            chunk = self.data[start:start + 1000]
+            response = self.put(
+                url, start, start + len(chunk) - 1,
+                digest=hashlib.sha256(chunk).digest()
+            )
+            self.assertEqual(response.status_code, 200)
+        status = response.json()
+        self.assertEqual(status['status'], 'complete')
+        self.assertEqual(
+            status['sha256'], hashlib.sha256(self.data).hexdigest()
+        )
+
+    def test_duplicate_chunk_is_rejected_with_offset(self):
+        url = self.create()
+        self.assertEqual(self.put(url, 0, 999).status_code, 200)
+        response = self.put(url, 0, 999)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['offset'], 1000)
+        # Resuming from the returned offset completes the upload
+        self.assertEqual(self.put(url, 1000, 2999).json()['status'],
+                         'complete')
+
+    def test_chunk_after_offset_is_rejected(self):
+        url = self.create()
+        response = self.put(url, 1000, 1999)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['offset'], 0)
+
+    def test_invalid_content_range(self):
+        url = self.create()
+        response = self.client.put(
+            url, self.data[:10], content_type='application/octet-stream'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.put(url, 10, 5, body=b'').status_code, 416)
+        self.assertEqual(self.put(url, 0, 9, size=10).status_code, 400)
+        self.assertEqual(self.client.get(url).json()['offset'], 0)
+
+    def test_digest_mismatch(self):
+        url = self.create()
+        response = self.put(url, 0, 999, digest=b'\0' * 32)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['offset'], 0)
+
+    def test_uploads_of_other_users_are_not_found(self):
+        url = self.create()
+        other = User.objects.create_user('other', password='secret')
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(url).status_code, 404)
@@ -1,6 +1,7 @@
+import re
+
 from django.conf import settings
-from django.urls import path
-from django.conf.urls.static import static
+from django.urls import path, re_path
 from core.views import *
 from django.contrib.auth.views import LogoutView
 
@@ -14,7 +15,7 @@ urlpatterns = [
          name='login'),
     path('logout/',
          LogoutView.as_view(next_page='login'),
-         ame='logout'),
+         name='logout'),
     path('register/',
          CustomRegisterView.as_view(),
          name='register'),
@@ -25,14 +26,51 @@ urlpatterns = [
     path('teachers/directory/list/',
          TeachersDirectoryListView.as_view(),
          name='teachers_directory_list'),
+    path('teachers/directory/api/',
+         TeachersDirectoryApiView.as_view(),
+         name='teachers_directory_api'),
+    path('teachers/export/',
+         TeachersExportView.as_view(),
+         name='teachers_export'),
     path('teachers/import/',
          TeachersImportView.as_view(),
          name='teachers_import'),
+    path('teachers/import/uploads/',
+         ChunkedUploadCreateView.as_view(),
+         name='chunked_upload_create'),
+    path('teachers/import/uploads/<int:pk>/',
+         ChunkedUploadView.as_view(),
+         name='chunked_upload'),
+    path('teachers/import/uploads/import/',
+         ChunkedUploadImportView.as_view(),
+         name='chunked_upload_import'),
+    path('teachers/import/jobs/<int:pk>/',
+         ImportJobView.as_view(),
+         name='import_job'),
+    path('teachers/import/jobs/<int:pk>/status/',
+         ImportJobStatusView.as_view(),
+         name='import_job_status'),
     path('teachers/<int:pk>/',
          TeacherProfileView.as_view(),
          name='teacher_profile'),
+
+    re_path(r'^{}(?P<path>.+)$'.format(re.escape(
+                settings.MEDIA_URL.lstrip('/'))),
+            MediaFileView.as_view(),
+            name='media'),
 ]
 
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL,
-                          document_root=settings.MEDIA_ROOT)
+if not settings.DEBUG and getattr(settings, 'SERVE_STATIC_FILES', False):
+    urlpatterns += [
+        re_path(r'^{}(?P<path>.+)$'.format(re.escape(
+                    settings.STATIC_URL.lstrip('/'))),
+                StaticAssetView.as_view(),
+                name='static'),
+    ]
+
+if getattr(settings, 'REQUEST_METRICS', False):
+    urlpatterns += [
+        path('metrics',
+             MetricsView.as_view(),
+             name='metrics'),
+    ]
@@ -0,0 +1,145 @@
+import os
+import pickle
+import shutil
+import tempfile
+import weakref
+import numpy as np
+
+from django.conf import settings
+
+EMAIL_HASH_COLUMN = '_email_hash'
+
+
+class TeacherDataset():
+    """
+    Validated teacher data handed from CSVFileValidator to the importer, so
+    the uploaded CSV file is parsed only once.
+
+    Chunks are kept in memory until the dataset grows beyond ``spill_rows``
+    rows. From then on every chunk is pickled to a spill file in a private
+    temporary directory, which is removed together with the dataset. Every
+    chunk carries the hashes of its email addresses, so rows with email
+    addresses that turn out to be duplicates can be excluded after the whole
+    file was read.
+
+    Attributes:
+        spill_rows (int): Number of rows kept in memory before spilling.
+        path (str): Path of the spill file, or None while in memory.
+        rows (int): Number of rows added to the dataset.
+    """
+
+    def __init__(self, spill_rows=None):
+        self.spill_rows = spill_rows or getattr(
+            settings, 'IMPORT_SPILL_ROWS', 50000
+        )
+        self.chunks = []
+        self.path = None
+        self.rows = 0
+        self.excluded_emails = np.empty(0, dtype=np.uint64)
+        self._spill_file = None
+        self._finalizer = None
+
+    def append(self, df, email_hashes):
+        """
+        Adds a chunk of valid rows to the dataset.
+
+        Args:
+            df (pd.DataFrame): Valid rows.
+            email_hashes (np.ndarray): Hash of the email address of every row.
+        """
+        df = df.assign(**{EMAIL_HASH_COLUMN: email_hashes})
+        self.rows += len(df)
+        if self._spill_file is None and self.rows > self.spill_rows:
+            self.spill()
+        if self._spill_file is None:
+            self.chunks.append(df)
+        else:
+            pickle.dump(df, self._spill_file, pickle.HIGHEST_PROTOCOL)
+
+    def spill(self):
+        """
+        Moves the chunks held in memory to a spill file.
+        """
+        directory = tempfile.mkdtemp(
+            prefix='teachers-import-',
+            dir=getattr(settings, 'IMPORT_SPILL_DIR', None)
+        )
+        self._finalizer = weakref.finalize(
+            self, shutil.rmtree, directory, True
+        )
+        self.path = os.path.join(directory, 'teachers.pickle')
+        self._spill_file = open(self.path, 'wb')
+        for df in self.chunks:
+            pickle.dump(df, self._spill_file, pickle.HIGHEST_PROTOCOL)
+        self.chunks = []
+
+    def exclude_emails(self, email_hashes):
+        """
+        Excludes the rows with the given email address hashes when the
+        dataset is read.
+
+        Args:
+            email_hashes (np.ndarray): Hashes of excluded email addresses.
+        """
+        self.excluded_emails = np.union1d(self.excluded_emails, email_hashes)
+
+    def save(self, path):
+        """
+        Writes the dataset to ``path``, e.g. for a background import job,
+        and releases the temporary directory.
+
+        Args:
+            path (str): Destination path.
+        """
+        with open(path, 'wb') as destination:
+            for df in self:
+                pickle.dump(df, destination, pickle.HIGHEST_PROTOCOL)
+        self.close()
+
+    def close(self):
+        """
+        Releases the chunks and removes the spill file.
+        """
+        if self._spill_file is not None:
+            self._spill_file.close()
+            self._spill_file = None
+        if self._finalizer is not None:
+            self._finalizer()
+        self.chunks = []
+
+    def __iter__(self):
+        """
+        Yields the chunks of the dataset without the excluded rows.
+
+        Yields:
+            pd.DataFrame: Chunk of valid rows.
+        """
+        if self._spill_file is not None:
+            self._spill_file.flush()
+        chunks = iter(self.chunks) if self.path is None else read_chunks(
+            self.path
+        )
+        for df in chunks:
+            excluded = np.isin(df[EMAIL_HASH_COLUMN], self.excluded_emails)
+            yield df[~excluded].drop(columns=EMAIL_HASH_COLUMN)
+
+    def __len__(self):
+        return self.rows
+
+
+def read_chunks(path):
+    """
+    Reads the chunks of a dataset saved with ``TeacherDataset.save``.
+
+    Args:
+        path (str): Path of the saved dataset.
+
+    Yields:
+        pd.DataFrame: Chunk of valid rows.
+    """
+    with open(path, 'rb') as source:
+        while True:
+            try:
+                yield pickle.load(source)
+            except EOFError:
+                return
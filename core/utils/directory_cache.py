@@ -0,0 +1,55 @@
+import hashlib
+
+from django.core.cache import caches
+from django.core.cache.backends.base import InvalidCacheBackendError
+from core.utils.generation import get_generation
+
+
+def get_directory_cache():
+    """
+    Returns the cache of directory pages, the 'directory' cache if it is
+    configured and the default cache otherwise.
+
+    Returns:
+        BaseCache: Cache backend.
+    """
+    try:
+        return caches['directory']
+    except InvalidCacheBackendError:
+        return caches['default']
+
+
+def normalize_query(query):
+    """
+    Normalizes a search query, so queries that match the same teachers
+    share cache entries.
+
+    Args:
+        query (str): Search query.
+
+    Returns:
+        str: Lowercase query with single spaces between tokens.
+    """
+    return ' '.join((query or '').casefold().split())
+
+
+def directory_cache_key(kind, *parts, generation=None):
+    """
+    Returns a cache key of directory data. Keys contain the data
+    generation, so entries written before an import are never read again
+    and expire from the cache.
+
+    Args:
+        kind (str): Kind of cached data, e.g. 'list' or 'count'.
+        *parts (str): Values identifying the entry, e.g. query and page.
+        generation (int): Data generation, or None to read the current one.
+
+    Returns:
+        str: Cache key.
+    """
+    if generation is None:
+        generation = get_generation()
+    digest = hashlib.blake2b(
+        '\x1f'.join(str(part) for part in parts).encode(), digest_size=16
+    ).hexdigest()
+    return f'directory:{generation}:{kind}:{digest}'
@@ -0,0 +1,114 @@
+import csv
+import io
+import json
+import tempfile
+
+from collections import defaultdict
+from itertools import islice
+from django.conf import settings
+from core.models import Teacher
+from core.utils.importer import TEACHER_FIELDS
+
+# Columns of the CSV file layout accepted by CSVFileValidator. The stored
+# name of the profile picture is not in any archive, so importing it keeps
+# the picture, and an export imported again leaves every teacher unchanged
+EXPORT_COLUMNS = [
+    'first_name', 'last_name', 'email_address', 'phone_number',
+    'room_number', 'subjects_taught', 'profile_picture',
+]
+EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+}
+
+
+def iter_teacher_rows(chunk_size=None):
+    """
+    Yields the teachers in the layout of the import file, chunk by chunk.
+    Teachers are read with a server-side iterator and the subjects of every
+    chunk with a single query, so memory does not depend on the number of
+    teachers and the number of queries grows with the number of chunks.
+
+    Args:
+        chunk_size (int): Number of teachers per chunk. Defaults to
+        EXPORT_CHUNK_SIZE.
+
+    Yields:
+        list: Chunk of teacher rows, dicts with the EXPORT_COLUMNS.
+    """
+    chunk_size = chunk_size or getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+    teachers = Teacher.objects.order_by('pk').values_list(
+        'pk', 'email_address', 'profile_picture', *TEACHER_FIELDS
+    ).iterator(chunk_size=chunk_size)
+    through = Teacher.subjects_taught.through
+
+    while True:
+        chunk = list(islice(teachers, chunk_size))
+        if not chunk:
+            return
+        subjects = defaultdict(list)
+        for teacher_id, name in through.objects.filter(
+            teacher_id__in=[row[0] for row in chunk]
+        ).order_by('pk').values_list('teacher_id', 'subject__name'):
+            subjects[teacher_id].append(name)
+
+        rows = []
+        for pk, *values in chunk:
+            row = dict(zip(
+                ['email_address', 'profile_picture'] + TEACHER_FIELDS, values
+            ))
+            row['profile_picture'] = row['profile_picture'] or ''
+            row['subjects_taught'] = ', '.join(subjects[pk])
+            rows.append({column: row[column] for column in EXPORT_COLUMNS})
+        yield rows
+
+
+def export_teachers(export_format='csv', chunk_size=None):
+    """
+    Yields the export of the directory as text, one chunk of teachers at a
+    time.
+
+    Args:
+        export_format (str): 'csv' for a file CSVFileValidator accepts, or
+        'jsonl' for one JSON object per line.
+        chunk_size (int): Number of teachers per chunk.
+
+    Yields:
+        str: Part of the export.
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f'Unknown export format: {export_format}')
+
+    if export_format == 'csv':
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, EXPORT_COLUMNS)
+        writer.writeheader()
+        yield buffer.getvalue()
+
+    for rows in iter_teacher_rows(chunk_size):
+        if export_format == 'csv':
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerows(rows)
+            yield buffer.getvalue()
+        else:
+            yield ''.join(
+                json.dumps(row, ensure_ascii=False) + '\n' for row in rows
+            )
+
+
+def spool_export(parts):
+    """
+    Writes an export to an anonymous temporary file.
+
+    Args:
+        parts (iterable): Parts of the export.
+
+    Returns:
+        file: Binary file positioned at the start of the export.
+    """
+    spool = tempfile.TemporaryFile()
+    for part in parts:
+        spool.write(part.encode())
+    spool.seek(0)
+    return spool
@@ -0,0 +1,43 @@
+from django.db.models import F
+from django.utils import timezone
+from core.models import DataGeneration
+
+GENERATION_PK = 1
+
+
+def get_generation():
+    """
+    Returns the current generation of the directory data.
+
+    Returns:
+        int: Generation counter.
+    """
+    generation = DataGeneration.objects.filter(
+        pk=GENERATION_PK
+    ).values_list('generation', flat=True).first()
+    return generation or 0
+
+
+async def aget_generation():
+    """
+    Async variant of ``get_generation``.
+    """
+    generation = await DataGeneration.objects.filter(
+        pk=GENERATION_PK
+    ).values_list('generation', flat=True).afirst()
+    return generation or 0
+
+
+def bump_generation():
+    """
+    Increments the generation of the directory data. Called inside the
+    transaction that changes the data, so other processes see the new
+    generation exactly when they can see the new data.
+    """
+    updated = DataGeneration.objects.filter(pk=GENERATION_PK).update(
+        generation=F('generation') + 1, updated_at=timezone.now()
+    )
+    if not updated:
+        DataGeneration.objects.get_or_create(
+            pk=GENERATION_PK, defaults={'generation': 1}
+        )
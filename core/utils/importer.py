@@ -1,90 +1,598 @@
+import hashlib
+import logging
+import threading
 import zipfile
 import pandas as pd
 
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+from django.conf import settings
 from django.core.files import File
-from io import BytesIO
+from django.db import transaction
+from django.utils import timezone
 from core.models import Subject, Teacher
+from core.signals import bulk_teacher_changes
+from core.utils.generation import bump_generation
+from core.utils.pictures import collect_orphaned_pictures
+from core.utils.pictures import content_address, hash_file, touch_picture
+from core.utils.search import update_search_index
+from core.utils.thumbnails import generate_thumbnails
 
+TEACHER_FIELDS = ['first_name', 'last_name', 'phone_number', 'room_number']
 
-def import_teachers_from_csv_and_zip(csv_data, zip_file):
+# Errors of pictures that pass ZipFileValidator but cannot be decoded
+PICTURE_ERRORS = (OSError, ValueError, Image.DecompressionBombError)
+
+logger = logging.getLogger(__name__)
+
+
+class BulkTeacherImporter():
     """
-    Import teachers and their profile pictures from a CSV file and a zip file.
+    Set-based importer for teacher data.
 
-    Args:
-        csv_data (DataFrame): Dataframe with teacher data.
-        zip_file (InMemoryUploadedFile): Zip file with profile pictures.
+    Rows are processed in batches of ``batch_size``. For every batch the
+    existing teachers are preloaded by email address, new teachers are
+    inserted with a single ``bulk_create``, existing ones are updated with a
+    single ``bulk_update`` and the ``subjects_taught`` relations are inserted
+    directly into the through table. Subjects are cached for the whole import,
+    so the number of queries grows with the number of batches instead of with
+    rows × subjects. The whole import runs in one transaction.
+
+    Profile pictures are streamed from the archive to the storage by a pool
+    of ``image_workers`` threads while the rows are written, and the teachers
+    are linked to their stored pictures with one bulk update at the end.
+    Pictures are stored under the SHA-256 digest of their content, so a
+    picture that is already stored is never written again, and pictures no
+    teacher refers to are deleted once the import commits. Pictures that
+    cannot be decoded are skipped: the teachers keep their current picture,
+    and an error is recorded for each of them instead of failing the import.
+
+    The search rows of inserted and updated teachers are refreshed with
+    every batch.
+
+    Every teacher stores a fingerprint of the row it was imported from, and
+    rows whose fingerprint did not change are skipped entirely. Rows with
+    a new fingerprint that would still leave their teacher as it is, e.g.
+    the rows of an export, are counted as unchanged as well and only their
+    fingerprint is stored. In ``sync``
+    mode the subjects of changed teachers are replaced instead of extended,
+    and teachers missing from the file are deleted.
+
+    Attributes:
+        batch_size (int): Number of rows written per batch.
+        image_workers (int): Number of threads storing profile pictures.
+        zip_ref (ZipFile): Open archive with profile pictures, or None.
+        progress (callable): Called after every batch with the total number
+        of rows and images processed so far, or None.
+        sync (bool): Mirror the file instead of merging it into the
+        directory.
+        summary (dict): Number of inserted, updated, unchanged and removed
+        teachers.
+        errors (list): Messages of the rows whose picture was skipped.
     """
-    with zipfile.ZipFile(zip_file, 'r') as zip_ref:
-        for _, row in csv_data.iterrows():
-            teacher, created = Teacher.objects.get_or_create(
-                email_address=row['email_address'],
-                defaults={
-                    'first_name': row['first_name'],
-                    'last_name': row['last_name'],
-                    'phone_number': row['phone_number'],
-                    'room_number': row['room_number'],
-                }
+
+    def __init__(self, zip_ref=None, batch_size=None, progress=None,
+                 image_workers=None, sync=False):
+        self.zip_ref = zip_ref
+        self.batch_size = batch_size or getattr(
+            settings, 'IMPORT_BATCH_SIZE', 500
+        )
+        self.image_workers = image_workers or getattr(
+            settings, 'IMPORT_IMAGE_WORKERS', 4
+        )
+        self.progress = progress
+        self.sync = sync
+        self.summary = {
+            'inserted': 0, 'updated': 0, 'unchanged': 0, 'removed': 0,
+        }
+        self.seen_pks = set()
+        self.subject_ids = {}
+        self.rows_processed = 0
+        self.images_processed = 0
+        self.zip_members = set(zip_ref.namelist()) if zip_ref else set()
+        self.picture_field = Teacher._meta.get_field('profile_picture')
+        self.image_pool = None
+        self.stored_pictures = {}
+        self.pending_pictures = {}
+        self.current_pictures = {}
+        self.picture_errors = {}
+        self.errors = []
+        self.lock = threading.Lock()
+        self.name_locks = defaultdict(threading.Lock)
+
+    def run(self, csv_data):
+        """
+        Import all rows of the dataframe.
+
+        Args:
+            csv_data (DataFrame or iterable): Dataframe with teacher data, or
+            an iterable of dataframe chunks which are imported as they are
+            read.
+
+        Returns:
+            dict: Number of processed rows and of inserted, updated,
+            unchanged and removed teachers, and the messages of skipped
+            pictures as 'errors'.
+        """
+        if isinstance(csv_data, pd.DataFrame):
+            csv_data = [csv_data]
+        started_at = timezone.now()
+        self.image_pool = ThreadPoolExecutor(
+            max_workers=self.image_workers, thread_name_prefix='import-image'
+        )
+        try:
+            # Nothing below should send per-row signals, but if a change
+            # does, the index and generation are updated by the import
+            with transaction.atomic(), bulk_teacher_changes():
+                self.subject_ids = dict(
+                    Subject.objects.values_list('name', 'pk')
+                )
+                for chunk in csv_data:
+                    for start in range(0, len(chunk), self.batch_size):
+                        batch = chunk.iloc[start:start + self.batch_size]
+                        self.rows_processed += self.import_batch(batch)
+                        self.report_progress()
+                self.link_profile_pictures()
+                self.report_progress()
+                if self.sync:
+                    self.remove_missing_teachers()
+                bump_generation()
+                if getattr(settings, 'IMPORT_COLLECT_ORPHANED_PICTURES', True):
+                    transaction.on_commit(
+                        lambda: collect_orphaned_pictures(started_at)
+                    )
+        finally:
+            self.image_pool.shutdown(cancel_futures=True)
+        return dict(self.summary, rows=self.rows_processed, errors=self.errors)
+
+    def report_progress(self):
+        if self.progress:
+            self.progress(self.rows_processed, self.images_processed)
+
+    def import_batch(self, batch):
+        """
+        Import a single batch of rows.
+
+        Args:
+            batch (DataFrame): Slice of the dataframe with teacher data.
+
+        Returns:
+            int: Number of imported rows.
+        """
+        # Later rows win when the same email address occurs more than once
+        rows = {}
+        for row in batch.to_dict('records'):
+            rows[row['email_address']] = row
+
+        existing = Teacher.objects.only(
+            'pk', 'email_address', 'fingerprint', 'profile_picture', 'version',
+            *TEACHER_FIELDS
+        ).in_bulk(list(rows), field_name='email_address')
+        fingerprints = {
+            email: self.fingerprint(row) for email, row in rows.items()
+        }
+        unchanged = self.unchanged_rows(existing, rows, fingerprints)
+        now = timezone.now()
+        to_create, to_update, refingerprinted = [], [], []
+        teacher_subjects, pictures = {}, {}
+        for email, row in rows.items():
+            fingerprint = fingerprints[email]
+            teacher = existing.get(email)
+            if teacher is None:
+                teacher = Teacher(email_address=email)
+                to_create.append(teacher)
+            elif teacher.fingerprint == fingerprint or email in unchanged:
+                if teacher.fingerprint != fingerprint:
+                    teacher.fingerprint = fingerprint
+                    refingerprinted.append(teacher)
+                self.seen_pks.add(teacher.pk)
+                self.summary['unchanged'] += 1
+                continue
+            else:
+                teacher.version += 1
+                to_update.append(teacher)
+            teacher.fingerprint = fingerprint
+            teacher.updated_at = now
+            for field in TEACHER_FIELDS:
+                setattr(teacher, field, row[field])
+            picture = self.set_profile_picture(teacher, row)
+            if picture:
+                pictures[email] = picture
+            teacher_subjects[email] = self.parse_subjects(
+                row['subjects_taught']
             )
 
-            if not created:
-                teacher.first_name = row['first_name']
-                teacher.last_name = row['last_name']
-                teacher.phone_number = row['phone_number']
-                teacher.room_number = row['room_number']
+        self.create_missing_subjects(teacher_subjects.values())
+
+        Teacher.objects.bulk_create(to_create, batch_size=self.batch_size)
+        if any(teacher.pk is None for teacher in to_create):
+            # Backends without RETURNING support leave the pks unset
+            pks = dict(Teacher.objects.filter(
+                email_address__in=[t.email_address for t in to_create]
+            ).values_list('email_address', 'pk'))
+            for teacher in to_create:
+                teacher.pk = pks[teacher.email_address]
+        Teacher.objects.bulk_update(
+            to_update,
+            TEACHER_FIELDS + [
+                'profile_picture', 'fingerprint', 'version', 'updated_at'
+            ],
+            batch_size=self.batch_size
+        )
+        Teacher.objects.bulk_update(
+            refingerprinted, ['fingerprint'], batch_size=self.batch_size
+        )
+        self.summary['inserted'] += len(to_create)
+        self.summary['updated'] += len(to_update)
 
-            if pd.isna(row['profile_picture']):
-                teacher.profile_picture = File(None)
+        teachers = {t.email_address: t for t in to_create + to_update}
+        self.seen_pks.update(teacher.pk for teacher in teachers.values())
+        for email, teacher in teachers.items():
+            if email in pictures:
+                self.pending_pictures[teacher.pk] = pictures[email]
+                self.current_pictures[teacher.pk] = teacher.profile_picture.name
             else:
-                try:
-                    with zip_ref.open(row['profile_picture']) as img_file:
-                        image_data = BytesIO(img_file.read())
-                        teacher.profile_picture.save(
-                            row['profile_picture'],
-                            File(image_data)
-                        )
-                except KeyError:
-                    pass
-
-            subjects_list = row['subjects_taught'].split(",")
-            for subject_name in subjects_list:
-                subject_name = subject_name.strip().title()
-                subject, _ = Subject.objects.get_or_create(name=subject_name)
-                teacher.subjects_taught.add(subject)
-
-            teacher.save()
-
-
-def import_teachers_from_csv(csv_data):
+                # A later row for the same teacher replaces an earlier picture
+                self.pending_pictures.pop(teacher.pk, None)
+        through = Teacher.subjects_taught.through
+        if self.sync and to_update:
+            through.objects.filter(
+                teacher_id__in=[teacher.pk for teacher in to_update]
+            )._raw_delete(through.objects.db)
+        through.objects.bulk_create(
+            [
+                through(
+                    teacher_id=teachers[email].pk,
+                    subject_id=self.subject_ids[name]
+                )
+                for email, names in teacher_subjects.items()
+                for name in names
+            ],
+            batch_size=self.batch_size,
+            ignore_conflicts=True
+        )
+        update_search_index(
+            [teacher.pk for teacher in teachers.values()],
+            batch_size=self.batch_size
+        )
+        return len(rows)
+
+    def fingerprint(self, row):
+        """
+        Compute the fingerprint of a row over the teacher fields, the subject
+        set and the profile picture. For pictures found in the archive the
+        CRC and size from the central directory are included, so a changed
+        picture changes the fingerprint without reading it.
+
+        Args:
+            row (dict): Row with teacher data.
+
+        Returns:
+            str: Hex digest of the row.
+        """
+        values = [str(row[field]) for field in TEACHER_FIELDS]
+        values.append(','.join(sorted(
+            self.parse_subjects(row['subjects_taught'])
+        )))
+        if 'profile_picture' in row and not pd.isna(row['profile_picture']):
+            picture = row['profile_picture']
+            values.append(picture)
+            if picture in self.zip_members:
+                info = self.zip_ref.getinfo(picture)
+                values.append(f'{info.CRC:08x}:{info.file_size}')
+        else:
+            values.append('' if 'profile_picture' in row else '-')
+        return hashlib.blake2b(
+            '\x1f'.join(values).encode(), digest_size=16
+        ).hexdigest()
+
+    def unchanged_rows(self, existing, rows, fingerprints):
+        """
+        Find the rows whose fingerprint differs from the one of their
+        teacher, but which would leave the teacher as it is. The subjects
+        of their teachers are read with a single query.
+
+        Args:
+            existing (dict): Teachers of the batch by email address.
+            rows (dict): Rows of the batch by email address.
+            fingerprints (dict): Fingerprints of the rows by email address.
+
+        Returns:
+            set: Email addresses of the rows.
+        """
+        stale = {
+            email: teacher for email, teacher in existing.items()
+            if teacher.fingerprint != fingerprints[email]
+        }
+        if not stale:
+            return set()
+        subjects = defaultdict(set)
+        through = Teacher.subjects_taught.through
+        for teacher_id, name in through.objects.filter(
+            teacher_id__in=[teacher.pk for teacher in stale.values()]
+        ).values_list('teacher_id', 'subject__name'):
+            subjects[teacher_id].add(name)
+        return {
+            email for email, teacher in stale.items()
+            if self.leaves_unchanged(
+                teacher, rows[email], subjects[teacher.pk]
+            )
+        }
+
+    def leaves_unchanged(self, teacher, row, subjects):
+        """
+        Check whether importing a row would leave a teacher as it is. The
+        subjects must be equal in ``sync`` mode and are only added
+        otherwise. A picture is kept by a row without a 'profile_picture'
+        column or with a name that is not in the archive, such as the
+        stored name written by the export, and an empty cell only leaves
+        a teacher without picture unchanged.
+
+        Args:
+            teacher (Teacher): Teacher with the TEACHER_FIELDS loaded.
+            row (dict): Row with teacher data.
+            subjects (set): Names of the subjects of the teacher.
+
+        Returns:
+            bool: True if the row would not change the teacher.
+        """
+        if any(str(getattr(teacher, field)) != str(row[field])
+               for field in TEACHER_FIELDS):
+            return False
+        row_subjects = set(self.parse_subjects(row['subjects_taught']))
+        if row_subjects != subjects and (
+                self.sync or not row_subjects <= subjects):
+            return False
+        if 'profile_picture' not in row:
+            return True
+        picture = row['profile_picture']
+        if pd.isna(picture):
+            return not teacher.profile_picture
+        return picture not in self.zip_members
+
+    def remove_missing_teachers(self):
+        """
+        Delete the teachers that do not occur in the imported file.
+
+        The teachers and their subjects are deleted with plain DELETE
+        statements instead of ``QuerySet.delete``, which would load every
+        teacher and send ``post_delete`` for it, and their search rows are
+        removed once per batch. The generation is bumped by ``run``.
+        """
+        missing = [
+            pk for pk in Teacher.objects.values_list('pk', flat=True)
+            .iterator(chunk_size=self.batch_size * 10)
+            if pk not in self.seen_pks
+        ]
+        through = Teacher.subjects_taught.through
+        for start in range(0, len(missing), self.batch_size):
+            batch = missing[start:start + self.batch_size]
+            through.objects.filter(teacher_id__in=batch)._raw_delete(
+                through.objects.db
+            )
+            Teacher.objects.filter(pk__in=batch)._raw_delete(
+                Teacher.objects.db
+            )
+            update_search_index(batch, batch_size=self.batch_size)
+        self.summary['removed'] = len(missing)
+
+    def set_profile_picture(self, teacher, row):
+        """
+        Update the profile picture of the teacher from the row.
+
+        An empty 'profile_picture' cell clears the picture. Otherwise the
+        picture is taken from the archive if it contains the file, and left
+        unchanged if it does not. Pictures are left untouched when the
+        CSV file has no 'profile_picture' column. Pictures found in the
+        archive are submitted to the image pool and linked to the teacher by
+        ``link_profile_pictures``.
+
+        Args:
+            teacher (Teacher): Teacher instance, saved or not.
+            row (dict): Row with teacher data.
+
+        Returns:
+            str: Archive member with the new picture, or None.
+        """
+        if 'profile_picture' not in row:
+            return None
+        picture = row['profile_picture']
+        if pd.isna(picture):
+            teacher.profile_picture = File(None)
+        elif picture in self.zip_members:
+            if picture not in self.stored_pictures:
+                future = self.image_pool.submit(self.store_picture, picture)
+                future.add_done_callback(self.count_image)
+                self.stored_pictures[picture] = future
+            return picture
+        return None
+
+    def store_picture(self, member):
+        """
+        Stream an archive member to the storage of the profile picture field
+        under its content address and generate its thumbnails. Nothing is
+        written when a picture with the same content is already stored along
+        with its thumbnails. A picture that cannot be decoded is not kept.
+
+        Args:
+            member (str): Name of the picture in the archive.
+
+        Returns:
+            str: Name of the stored picture, or None if it was skipped.
+        """
+        with self.zip_ref.open(member) as img_file:
+            name = content_address(hash_file(img_file), member)
+
+        storage = self.picture_field.storage
+        with self.lock:
+            name_lock = self.name_locks[name]
+        with name_lock:
+            # A reused picture is touched, so the orphan collection of a
+            # concurrent import does not delete it before this one commits
+            stored = not touch_picture(storage, name)
+            if stored:
+                with self.zip_ref.open(member) as img_file:
+                    name = storage.save(
+                        name,
+                        File(img_file),
+                        max_length=self.picture_field.max_length
+                    )
+            try:
+                generate_thumbnails(storage, name)
+            except PICTURE_ERRORS as e:
+                logger.warning("Skipped profile picture %s: %s", member, e)
+                if stored:
+                    storage.delete(name)
+                with self.lock:
+                    self.picture_errors[member] = e
+                return None
+        return name
+
+    def count_image(self, future):
+        if (not future.cancelled() and future.exception() is None
+                and future.result() is not None):
+            with self.lock:
+                self.images_processed += 1
+
+    def wait_for_pictures(self):
+        """
+        Wait for the image pool and record an error for every teacher whose
+        picture was skipped.
+
+        Returns:
+            dict: Stored picture name, or None, of every archive member.
+        """
+        stored = {
+            member: future.result()
+            for member, future in self.stored_pictures.items()
+        }
+        failed = {
+            pk: member for pk, member in self.pending_pictures.items()
+            if stored[member] is None
+        }
+        if failed:
+            emails = self.teacher_emails(list(failed))
+            self.errors.extend(
+                f"Teacher '{emails.get(pk, pk)}': profile picture "
+                f"'{member}' was skipped: {self.picture_errors[member]}"
+                for pk, member in sorted(failed.items())
+            )
+        return stored
+
+    def teacher_emails(self, pks):
+        return dict(Teacher.objects.filter(pk__in=pks).values_list(
+            'pk', 'email_address'
+        ))
+
+    def link_profile_pictures(self):
+        """
+        Wait for the image pool and link the teachers to their stored
+        pictures with a single bulk update.
+        """
+        stored = self.wait_for_pictures()
+        Teacher.objects.bulk_update(
+            [
+                Teacher(pk=pk, profile_picture=stored[member])
+                for pk, member in self.pending_pictures.items()
+                if stored[member] is not None
+                and stored[member] != self.current_pictures.get(pk)
+            ],
+            ['profile_picture'],
+            batch_size=self.batch_size
+        )
+
+    def create_missing_subjects(self, subject_lists):
+        """
+        Insert subjects that are not yet in the database and cache their ids.
+
+        Args:
+            subject_lists (iterable): Lists of subject names.
+        """
+        missing = {
+            name
+            for names in subject_lists
+            for name in names
+            if name not in self.subject_ids
+        }
+        if not missing:
+            return
+        Subject.objects.bulk_create(
+            [Subject(name=name) for name in missing],
+            batch_size=self.batch_size,
+            ignore_conflicts=True
+        )
+        self.subject_ids.update(
+            Subject.objects.filter(name__in=missing).values_list('name', 'pk')
+        )
+
+    @staticmethod
+    def parse_subjects(subjects_taught):
+        """
+        Split a 'subjects_taught' cell into normalized subject names.
+
+        Args:
+            subjects_taught (str): Comma-separated subject names.
+
+        Returns:
+            list: Title-cased subject names without duplicates.
+        """
+        names = [name.strip().title() for name in subjects_taught.split(",")]
+        return list(dict.fromkeys(name for name in names if name))
+
+
+def import_teachers_from_csv_and_zip(csv_data, zip_file, batch_size=None,
+                                     progress=None, image_workers=None,
+                                     sync=False):
     """
-    Import teachers from a CSV file.
+    Import teachers and their profile pictures from a CSV file and a zip file.
 
     Args:
-        csv_data (DataFrame): Dataframe with teacher data.
+        csv_data (DataFrame or iterable): Dataframe with teacher data, or an
+        iterable of dataframe chunks.
+        zip_file (InMemoryUploadedFile or str): Zip file with profile
+        pictures, or its path.
+        batch_size (int): Number of rows written per batch.
+        progress (callable): Called with the number of rows and images
+        processed so far after every batch.
+        image_workers (int): Number of threads storing profile pictures.
+        sync (bool): Replace the subjects of changed teachers and delete
+        teachers missing from the file.
+
+    Returns:
+        dict: Number of processed rows and of inserted, updated, unchanged
+        and removed teachers, and the messages of skipped pictures.
     """
-    for _, row in csv_data.iterrows():
-        teacher, created = Teacher.objects.get_or_create(
-            email_address=row['email_address'],
-            defaults={
-                'first_name': row['first_name'],
-                'last_name': row['last_name'],
-                'phone_number': row['phone_number'],
-                'room_number': row['room_number'],
-            }
+    with zipfile.ZipFile(zip_file, 'r') as zip_ref:
+        importer = BulkTeacherImporter(
+            zip_ref,
+            batch_size=batch_size,
+            progress=progress,
+            image_workers=image_workers,
+            sync=sync
         )
+        return importer.run(csv_data)
 
-        if not created:
-            teacher.first_name = row['first_name']
-            teacher.last_name = row['last_name']
-            teacher.phone_number = row['phone_number']
-            teacher.room_number = row['room_number']
 
-        if pd.isna(row['profile_picture']):
-            teacher.profile_picture = File(None)
+def import_teachers_from_csv(csv_data, batch_size=None, progress=None,
+                             sync=False):
+    """
+    Import teachers from a CSV file.
 
-        subjects_list = row['subjects_taught'].split(",")
-        for subject_name in subjects_list:
-            subject_name = subject_name.strip().title()
-            subject, _ = Subject.objects.get_or_create(name=subject_name)
-            teacher.subjects_taught.add(subject)
+    Args:
+        csv_data (DataFrame or iterable): Dataframe with teacher data, or an
+        iterable of dataframe chunks.
+        batch_size (int): Number of rows written per batch.
+        progress (callable): Called with the number of rows and images
+        processed so far after every batch.
+        sync (bool): Replace the subjects of changed teachers and delete
+        teachers missing from the file.
 
-        teacher.save()
+    Returns:
+        dict: Number of processed rows and of inserted, updated, unchanged
+        and removed teachers, and the messages of skipped pictures.
+    """
+    importer = BulkTeacherImporter(
+        batch_size=batch_size, progress=progress, sync=sync
+    )
+    return importer.run(csv_data)
@@ -0,0 +1,238 @@
+import logging
+import os
+import shutil
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.utils import timezone
+from core.models import ImportJob
+from core.utils.dataset import read_chunks
+from core.utils.importer import import_teachers_from_csv
+from core.utils.importer import import_teachers_from_csv_and_zip
+from core.utils.metrics import IMPORT_DURATION
+from core.utils.shadow_import import ReplaceImportRunning
+from core.utils.shadow_import import replace_teachers_from_csv
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def get_job_directory(job_id):
+    """
+    Returns the private directory that holds the files of an import job.
+
+    Args:
+        job_id (int): Import job id.
+
+    Returns:
+        str: Path of the job directory.
+    """
+    return os.path.join(settings.IMPORT_JOBS_DIR, str(job_id))
+
+
+def create_import_job(dataset, zip_file=None, errors=None,
+                      mode=ImportJob.MERGE):
+    """
+    Creates an import job, saves its data into the job directory and queues
+    it for execution.
+
+    Args:
+        dataset (TeacherDataset): Validated teacher data.
+        zip_file (UploadedFile or str): Zip file with profile pictures, or
+        the path of an assembled chunked upload, which is moved into the job
+        directory, or None.
+        errors (list): Validation error messages of the upload.
+        mode (str): Import mode, one of ImportJob.MODE_CHOICES.
+
+    Returns:
+        ImportJob: The queued job.
+    """
+    job = ImportJob.objects.create(
+        status=ImportJob.RUNNING, mode=mode, errors=errors or []
+    )
+    directory = get_job_directory(job.pk)
+    os.makedirs(directory, exist_ok=True)
+
+    job.data_path = os.path.join(directory, 'teachers.pickle')
+    dataset.save(job.data_path)
+    if zip_file:
+        job.zip_path = os.path.join(directory, 'pictures.zip')
+        if isinstance(zip_file, str):
+            # A rename when the upload spool is on the same filesystem
+            shutil.move(zip_file, job.zip_path)
+        else:
+            with open(job.zip_path, 'wb') as destination:
+                for chunk in zip_file.chunks():
+                    destination.write(chunk)
+
+    # The job is only visible to workers once its files are in place
+    job.status = ImportJob.QUEUED
+    job.save()
+    enqueue_import_job(job)
+    return job
+
+
+def enqueue_import_job(job):
+    """
+    Submits the job to the in-process thread pool once the current
+    transaction commits. When IMPORT_JOB_THREADS is 0 the job is left in the
+    queue for the ``import_worker`` management command.
+
+    Args:
+        job (ImportJob): Queued import job.
+    """
+    threads = getattr(settings, 'IMPORT_JOB_THREADS', 1)
+    if not threads:
+        return
+
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=threads, thread_name_prefix='import-job'
+        )
+    transaction.on_commit(lambda: _executor.submit(run_in_thread, job.pk))
+
+
+def run_in_thread(job_id):
+    """
+    Runs an import job in a pool thread and closes the thread's database
+    connections afterwards.
+
+    Args:
+        job_id (int): Import job id.
+    """
+    try:
+        run_import_job(job_id)
+    finally:
+        connections.close_all()
+
+
+def claim_import_job(job_id):
+    """
+    Atomically marks a queued job as running, so that each job is executed
+    by exactly one worker.
+
+    Args:
+        job_id (int): Import job id.
+
+    Returns:
+        bool: True if the job was claimed by the caller.
+    """
+    claimed = ImportJob.objects.filter(
+        pk=job_id, status=ImportJob.QUEUED
+    ).update(status=ImportJob.RUNNING, started_at=timezone.now())
+    return claimed == 1
+
+
+def run_next_import_job():
+    """
+    Claims and runs the oldest queued import job.
+
+    Returns:
+        bool: True if a job was run, False if the queue is empty.
+    """
+    queued = ImportJob.objects.filter(
+        status=ImportJob.QUEUED
+    ).order_by('created_at').values_list('pk', flat=True)
+    for job_id in queued[:10]:
+        if run_import_job(job_id):
+            return True
+    return False
+
+
+def progress_cache_key(job_id):
+    return f'import-job-progress:{job_id}'
+
+
+def get_import_job_status(job):
+    """
+    Returns the status of the job. The counters of a running job are read
+    from the cache, since the import transaction is not committed yet. Jobs
+    run by the ``import_worker`` command only report live counters when the
+    cache is shared between processes.
+
+    Args:
+        job (ImportJob): Import job.
+
+    Returns:
+        dict: Job status as returned by ``ImportJob.as_status``.
+    """
+    if job.status == ImportJob.RUNNING:
+        rows, images = cache.get(progress_cache_key(job.pk), (None, None))
+        return job.as_status(rows, images)
+    return job.as_status()
+
+
+def run_import_job(job_id):
+    """
+    Runs a queued import job.
+
+    Args:
+        job_id (int): Import job id.
+
+    Returns:
+        bool: True if the job was claimed and run by the caller.
+    """
+    if not claim_import_job(job_id):
+        return False
+
+    job = ImportJob.objects.get(pk=job_id)
+    key = progress_cache_key(job.pk)
+
+    def progress(rows, images):
+        job.rows_processed, job.images_processed = rows, images
+        cache.set(key, (rows, images), timeout=None)
+
+    mode = job.mode
+    if mode != ImportJob.MERGE and job.errors:
+        # Rows that failed validation would be removed from the directory
+        mode = ImportJob.MERGE
+        job.errors.append(
+            "Teachers missing from the file were not removed, because the "
+            "file has errors."
+        )
+    sync = mode == ImportJob.SYNC
+
+    started = time.perf_counter()
+    try:
+        df_teachers = read_chunks(job.data_path)
+        if mode == ImportJob.REPLACE:
+            summary = replace_teachers_from_csv(
+                df_teachers, job.zip_path or None, progress=progress
+            )
+        elif job.zip_path:
+            summary = import_teachers_from_csv_and_zip(
+                df_teachers, job.zip_path, progress=progress, sync=sync
+            )
+        else:
+            summary = import_teachers_from_csv(
+                df_teachers, progress=progress, sync=sync
+            )
+    except Exception as e:
+        if isinstance(e, ReplaceImportRunning):
+            logger.warning("Import job %s refused: %s", job.pk, e)
+        else:
+            logger.exception("Import job %s failed", job.pk)
+        job.status = ImportJob.FAILED
+        job.errors.append(f"Import failed: {e}")
+        # Nothing was committed by the failed import
+        job.rows_processed = job.images_processed = 0
+    else:
+        job.status = ImportJob.DONE
+        for field in ('inserted', 'updated', 'unchanged', 'removed'):
+            setattr(job, field, summary[field])
+        # Rows whose picture could not be decoded were imported without it
+        job.errors.extend(summary.get('errors', []))
+    finally:
+        job.finished_at = timezone.now()
+        job.save()
+        IMPORT_DURATION.observe(
+            time.perf_counter() - started, job.mode, job.status
+        )
+        cache.delete(key)
+        shutil.rmtree(get_job_directory(job.pk), ignore_errors=True)
+    return True
@@ -0,0 +1,262 @@
+import contextvars
+import threading
+import time
+
+from collections import Counter
+from contextlib import contextmanager
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.template.backends.django import Template
+
+# Upper bounds of the histogram buckets, in seconds and numbers of queries
+LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10
+)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+IMPORT_BUCKETS = (1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+# Histograms of this process, in the order they are rendered
+REGISTRY = []
+
+
+class Histogram():
+    """
+    Cumulative histogram in the Prometheus text format, with one series per
+    combination of label values. The histograms of a process are collected
+    by ``render_metrics``.
+
+    Attributes:
+        name (str): Metric name.
+        help (str): Description of the metric.
+        labels (tuple): Label names.
+        buckets (tuple): Upper bounds of the buckets.
+    """
+
+    def __init__(self, name, help, labels, buckets):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self.series = {}
+        self.lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value, *label_values):
+        """
+        Adds an observation to the series of the label values.
+
+        Args:
+            value (float): Observed value.
+            *label_values (str): Value of every label.
+        """
+        with self.lock:
+            series = self.series.get(label_values)
+            if series is None:
+                series = self.series[label_values] = [
+                    [0] * len(self.buckets), 0, 0
+                ]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += 1
+            series[2] += value
+
+    def render(self):
+        """
+        Returns the histogram in the Prometheus text exposition format.
+
+        Returns:
+            list: Lines of the exposition.
+        """
+        lines = [
+            f'# HELP {self.name} {self.help}',
+            f'# TYPE {self.name} histogram',
+        ]
+        with self.lock:
+            series = sorted(
+                (labels, list(buckets), count, total)
+                for labels, (buckets, count, total) in self.series.items()
+            )
+        for label_values, buckets, count, total in series:
+            labels = ','.join(
+                f'{name}="{escape_label(value)}"'
+                for name, value in zip(self.labels, label_values)
+            )
+            prefix = labels + ',' if labels else ''
+            for bound, bucket_count in zip(self.buckets, buckets):
+                lines.append(
+                    f'{self.name}_bucket{{{prefix}le="{bound}"}} '
+                    f'{bucket_count}'
+                )
+            lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {count}')
+            lines.append(f'{self.name}_sum{{{labels}}} {total}')
+            lines.append(f'{self.name}_count{{{labels}}} {count}')
+        return lines
+
+
+REQUEST_DURATION = Histogram(
+    'teacher_directory_request_duration_seconds',
+    'Time spent handling a request.',
+    ('view', 'method', 'status'),
+    LATENCY_BUCKETS
+)
+REQUEST_DB_DURATION = Histogram(
+    'teacher_directory_request_db_duration_seconds',
+    'Time spent executing SQL queries per request.',
+    ('view',),
+    LATENCY_BUCKETS
+)
+REQUEST_RENDER_DURATION = Histogram(
+    'teacher_directory_request_render_duration_seconds',
+    'Time spent rendering templates per request.',
+    ('view',),
+    LATENCY_BUCKETS
+)
+REQUEST_QUERIES = Histogram(
+    'teacher_directory_request_queries',
+    'Number of SQL queries per request.',
+    ('view',),
+    QUERY_BUCKETS
+)
+IMPORT_DURATION = Histogram(
+    'teacher_directory_import_duration_seconds',
+    'Time spent running an import job.',
+    ('mode', 'status'),
+    IMPORT_BUCKETS
+)
+
+
+class RequestMetrics():
+    """
+    Query count, SQL time and template render time of a request, collected
+    while ``record`` is active.
+
+    Attributes:
+        queries (int): Number of executed queries.
+        db_time (float): Seconds spent executing queries.
+        render_time (float): Seconds spent rendering templates.
+        statements (Counter): Number of executions of every SQL statement,
+        without its parameters.
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.render_time = 0.0
+        self.statements = Counter()
+
+    @contextmanager
+    def record(self):
+        """
+        Collects the metrics of the queries and templates executed in the
+        block, see ``instrument``. The metrics are held in a context
+        variable, which asgiref carries into the threads that run the ORM
+        for async views.
+        """
+        token = _current.set(self)
+        try:
+            yield self
+        finally:
+            _current.reset(token)
+
+    def repeated_statements(self, threshold):
+        """
+        Returns the statements executed at least ``threshold`` times, which
+        usually means a query runs once per row of another query (N+1).
+
+        Args:
+            threshold (int): Minimum number of executions.
+
+        Returns:
+            list: (statement, executions) pairs, most executed first.
+        """
+        return [
+            (sql, count) for sql, count in self.statements.most_common()
+            if count >= threshold
+        ]
+
+
+def current_metrics():
+    """
+    Returns the metrics of the request being recorded, or None.
+    """
+    return _current.get()
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    Database execute wrapper adding every query to the metrics of the
+    request being recorded.
+    """
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.db_time += time.perf_counter() - started
+        metrics.queries += 1
+        metrics.statements[sql] += 1
+
+
+def instrument_connection(sender, connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def instrument():
+    """
+    Installs the hooks that feed ``RequestMetrics``: an execute wrapper on
+    every database connection, which are per thread, and a timer around the
+    render method of the Django template backend. Called once per process,
+    and only when request metrics are enabled.
+    """
+    connection_created.connect(
+        instrument_connection, dispatch_uid='core.metrics'
+    )
+    for connection in connections.all():
+        instrument_connection(None, connection)
+
+    render = Template.render
+    if getattr(render, 'instrumented', False):
+        return
+
+    def timed_render(self, *args, **kwargs):
+        metrics = _current.get()
+        if metrics is None:
+            return render(self, *args, **kwargs)
+        started = time.perf_counter()
+        try:
+            return render(self, *args, **kwargs)
+        finally:
+            metrics.render_time += time.perf_counter() - started
+
+    timed_render.instrumented = True
+    Template.render = timed_render
+
+
+def metrics_enabled():
+    return getattr(settings, 'REQUEST_METRICS', False)
+
+
+def render_metrics():
+    """
+    Returns all metrics of this process in the Prometheus text exposition
+    format.
+
+    Returns:
+        str: Exposition.
+    """
+    return '\n'.join(
+        line for histogram in REGISTRY for line in histogram.render()
+    ) + '\n'
+
+
+def escape_label(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace(
+        '\n', r'\n'
+    )
@@ -0,0 +1,256 @@
+import base64
+import binascii
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Q
+from core.utils.directory_cache import directory_cache_key
+from core.utils.directory_cache import get_directory_cache, normalize_query
+from core.utils.prefix_index import SearchResults
+
+# Directory order, also covered by the teacher_directory_order index
+CURSOR_ORDERING = ('last_name', 'first_name', 'pk')
+
+
+def encode_cursor(teacher, backwards=False):
+    """
+    Returns an opaque cursor pointing after, or before, a teacher.
+
+    Args:
+        teacher (Teacher): Last teacher of a page, or the first one.
+        backwards (bool): Point to the teachers ordered before the teacher.
+
+    Returns:
+        str: URL safe cursor.
+    """
+    data = [int(backwards), teacher.last_name, teacher.first_name, teacher.pk]
+    return base64.urlsafe_b64encode(
+        json.dumps(data, separators=(',', ':')).encode()
+    ).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Decodes a cursor returned by ``encode_cursor``.
+
+    Args:
+        cursor (str): Cursor from the request.
+
+    Returns:
+        tuple: The direction flag and the (last_name, first_name, id) key,
+        or None if the cursor is missing or invalid.
+    """
+    if not cursor:
+        return None
+    try:
+        backwards, last_name, first_name, pk = json.loads(
+            base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        )
+        key = (str(last_name), str(first_name), int(pk))
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError):
+        return None
+    return bool(backwards), key
+
+
+class CursorPage():
+    """
+    Page of teachers selected by a cursor. Unlike ``django.core.paginator``
+    pages it does not count the results or skip rows with OFFSET, so every
+    page costs the same, however deep it is.
+
+    Attributes:
+        object_list (list): Teachers of the page.
+        next_cursor (str): Cursor of the next page, or None.
+        previous_cursor (str): Cursor of the previous page, or None.
+        results (QuerySet or SearchResults): All teachers being paginated.
+        query (str): Search query of the results.
+    """
+
+    def __init__(self, object_list, next_cursor, previous_cursor, results,
+                 query=''):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.results = results
+        self.query = query
+        self._count = None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    @property
+    def count(self):
+        """
+        Total number of results. It is counted once per query and data
+        generation and then served from the cache.
+        """
+        if self._count is None:
+            self._count = self.count_results()
+        return self._count
+
+    def count_results(self):
+        if isinstance(self.results, SearchResults):
+            return len(self.results)
+        cache = get_directory_cache()
+        key = directory_cache_key('count', normalize_query(self.query))
+        count = cache.get(key)
+        if count is None:
+            count = self.results.count()
+            cache.set(
+                key, count,
+                getattr(settings, 'DIRECTORY_COUNT_CACHE_TIMEOUT', 300)
+            )
+        return count
+
+
+def keyset_filter(key, backwards=False):
+    """
+    Returns the filter selecting the teachers ordered after, or before, a
+    key in directory order.
+
+    Args:
+        key (tuple): (last_name, first_name, id) of a teacher.
+        backwards (bool): Select the teachers ordered before the key.
+
+    Returns:
+        Q: Filter on last_name, first_name and pk.
+    """
+    last_name, first_name, pk = key
+    lookup = 'lt' if backwards else 'gt'
+    return (
+        Q(**{f'last_name__{lookup}': last_name}) |
+        Q(last_name=last_name, **{f'first_name__{lookup}': first_name}) |
+        Q(last_name=last_name, first_name=first_name, **{f'pk__{lookup}': pk})
+    )
+
+
+def keyset_queryset(results, key, backwards, per_page):
+    """
+    Returns the query of a page of a queryset, with one extra teacher that
+    tells whether there are more pages in that direction.
+
+    Args:
+        results (QuerySet): Teachers to paginate.
+        key (tuple): Key of the cursor, or None for the first page.
+        backwards (bool): Select the teachers ordered before the key.
+        per_page (int): Number of teachers per page.
+
+    Returns:
+        QuerySet: Sliced queryset.
+    """
+    queryset = results.order_by(*CURSOR_ORDERING)
+    if key is not None:
+        queryset = queryset.filter(keyset_filter(key, backwards))
+    if backwards:
+        queryset = queryset.reverse()
+    return queryset[:per_page + 1]
+
+
+def queryset_page(results, teachers, key, backwards, per_page, query):
+    """
+    Builds the page from the teachers returned by ``keyset_queryset``.
+
+    Args:
+        results (QuerySet): Teachers being paginated.
+        teachers (list): Teachers returned by the page query.
+        key (tuple): Key of the cursor, or None for the first page.
+        backwards (bool): Whether the teachers were selected backwards.
+        per_page (int): Number of teachers per page.
+        query (str): Search query of the results.
+
+    Returns:
+        CursorPage: The page, or None if going back reached the start, in
+        which case the first page is shown instead.
+    """
+    has_more = len(teachers) > per_page
+    teachers = teachers[:per_page]
+    if backwards and not has_more:
+        return None
+    if backwards:
+        teachers.reverse()
+        has_previous, has_next = True, True
+    else:
+        has_previous, has_next = key is not None, has_more
+    return cursor_page(teachers, has_next, has_previous, results, query)
+
+
+def cursor_page(teachers, has_next, has_previous, results, query):
+    """ Returns a CursorPage with the cursors of the adjacent pages. """
+    return CursorPage(
+        teachers,
+        encode_cursor(teachers[-1]) if has_next and teachers else None,
+        encode_cursor(teachers[0], backwards=True)
+        if has_previous and teachers else None,
+        results,
+        query
+    )
+
+
+def paginate_by_cursor(results, cursor, per_page, query=''):
+    """
+    Returns the page of results selected by a cursor.
+
+    Args:
+        results (QuerySet or SearchResults): Teachers to paginate.
+        cursor (str): Cursor from the request, or None for the first page.
+        per_page (int): Number of teachers per page.
+        query (str): Search query, part of the cache key of the count.
+
+    Returns:
+        CursorPage: The selected page.
+    """
+    decoded = decode_cursor(cursor)
+    backwards, key = decoded if decoded else (False, None)
+
+    if isinstance(results, SearchResults):
+        if key is None:
+            start = 0
+        elif backwards:
+            start = max(results.offset(key, after=False) - per_page, 0)
+        else:
+            start = results.offset(key)
+        teachers = results[start:start + per_page + 1]
+        return cursor_page(
+            teachers[:per_page], len(teachers) > per_page, start > 0,
+            results, query
+        )
+
+    teachers = list(keyset_queryset(results, key, backwards, per_page))
+    page = queryset_page(results, teachers, key, backwards, per_page, query)
+    if page is None:
+        return paginate_by_cursor(results, None, per_page, query)
+    return page
+
+
+async def apaginate_by_cursor(results, cursor, per_page, query=''):
+    """
+    Async variant of ``paginate_by_cursor`` for async views.
+    """
+    if isinstance(results, SearchResults):
+        return await sync_to_async(paginate_by_cursor)(
+            results, cursor, per_page, query
+        )
+
+    decoded = decode_cursor(cursor)
+    backwards, key = decoded if decoded else (False, None)
+    teachers = [
+        teacher async for teacher in
+        keyset_queryset(results, key, backwards, per_page)
+    ]
+    page = queryset_page(results, teachers, key, backwards, per_page, query)
+    if page is None:
+        return await apaginate_by_cursor(results, None, per_page, query)
+    return page
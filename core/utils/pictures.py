@@ -0,0 +1,133 @@
+import hashlib
+import os
+import posixpath
+
+from core.models import Teacher
+from core.utils.thumbnails import THUMBNAILS_DIR, thumbnail_names
+
+CHUNK_SIZE = 64 * 1024
+
+
+def hash_file(file):
+    """
+    Computes the SHA-256 digest of a file-like object by reading it in
+    chunks.
+
+    Args:
+        file (file-like object): Binary file opened for reading.
+
+    Returns:
+        str: Hex digest of the file content.
+    """
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def content_address(digest, file_name):
+    """
+    Returns the storage name of a profile picture with the given content.
+    Pictures are sharded by the first two characters of the digest and keep
+    the extension of the original file.
+
+    Args:
+        digest (str): SHA-256 hex digest of the picture.
+        file_name (str): Original file name of the picture.
+
+    Returns:
+        str: Storage name, e.g. 'profile_pictures/ab/ab12...ef.jpg'.
+    """
+    field = Teacher._meta.get_field('profile_picture')
+    extension = os.path.splitext(file_name)[1].lower()
+    return posixpath.join(
+        str(field.upload_to), digest[:2], f'{digest}{extension}'
+    )
+
+
+def touch_picture(storage, name):
+    """
+    Sets the modification time of a stored picture and its thumbnails to
+    now, so ``collect_orphaned_pictures`` run by an import that started
+    earlier keeps them while the import reusing them has not committed yet.
+
+    Args:
+        storage (Storage): Storage of the profile picture field.
+        name (str): Storage name of the original picture.
+
+    Returns:
+        bool: True if the picture is stored, False if it has to be stored
+        (again).
+    """
+    for path in [name] + thumbnail_names(name):
+        try:
+            os.utime(storage.path(path))
+        except FileNotFoundError:
+            if path == name:
+                return False
+        except NotImplementedError:
+            # Storages without local paths are not protected by the touch
+            return storage.exists(name)
+    return True
+
+
+def iter_stored_pictures(storage, directory):
+    """
+    Yields the names of all files below a storage directory.
+
+    Args:
+        storage (Storage): Storage of the profile picture field.
+        directory (str): Directory to walk.
+
+    Yields:
+        str: Storage name of every file.
+    """
+    if not storage.exists(directory):
+        return
+    directories, files = storage.listdir(directory)
+    for name in files:
+        yield posixpath.join(directory, name)
+    for name in directories:
+        yield from iter_stored_pictures(
+            storage, posixpath.join(directory, name)
+        )
+
+
+def collect_orphaned_pictures(modified_before=None):
+    """
+    Deletes stored profile pictures that no teacher refers to, along with
+    thumbnails whose original picture is not referred to.
+
+    Args:
+        modified_before (datetime): Only files last modified before this time
+        are deleted, so files written or reused (see ``touch_picture``) by
+        imports that are still running are kept.
+
+    Returns:
+        int: Number of deleted files.
+    """
+    field = Teacher._meta.get_field('profile_picture')
+    storage = field.storage
+    referenced = set(
+        Teacher.objects.exclude(profile_picture='')
+        .exclude(profile_picture__isnull=True)
+        .values_list('profile_picture', flat=True)
+    )
+
+    referenced.update(
+        thumbnail for name in list(referenced)
+        for thumbnail in thumbnail_names(name)
+    )
+
+    deleted = 0
+    directories = [str(field.upload_to).rstrip('/'), THUMBNAILS_DIR]
+    for name in (name for directory in directories
+                 for name in iter_stored_pictures(storage, directory)):
+        if name in referenced:
+            continue
+        if (modified_before is not None and
+                storage.get_modified_time(name) >= modified_before):
+            continue
+        storage.delete(name)
+        deleted += 1
+    return deleted
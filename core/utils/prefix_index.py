@@ -0,0 +1,245 @@
+import re
+import threading
+import unicodedata
+import numpy as np
+
+from bisect import bisect_left, bisect_right
+from django.db import transaction
+from core.models import Teacher
+from core.utils.generation import get_generation
+
+TOKEN_PATTERN = re.compile(r'\w+')
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def tokenize(text):
+    """
+    Splits a text into lowercase tokens without diacritics, like the
+    'unicode61 remove_diacritics 2' tokenizer of the FTS5 search table.
+
+    Args:
+        text (str): Text to split.
+
+    Returns:
+        list: Normalized tokens.
+    """
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return TOKEN_PATTERN.findall(text.casefold())
+
+
+class PrefixIndex():
+    """
+    In-memory index of the tokens of teacher names and subject names.
+
+    Teachers are numbered by their position in the directory order. The
+    distinct tokens are kept in a sorted list and the positions of the
+    teachers with every token in one array, sliced by ``offsets``. As the
+    tokens starting with a prefix are adjacent in the sorted list, their
+    postings form a single contiguous slice of ``postings``, so a prefix is
+    looked up with two bisections and a multi-token query is answered by
+    intersecting one slice per token.
+
+    Attributes:
+        generation (int): Generation of the data the index was built from.
+        keys (list): (last_name, first_name, id) of the teachers in directory
+        order.
+        ids (np.ndarray): Teacher ids in directory order.
+        tokens (list): Distinct tokens, sorted.
+        offsets (np.ndarray): Start of the postings of every token, followed
+        by the total number of postings.
+        postings (np.ndarray): Teacher positions of every token, sorted.
+    """
+
+    def __init__(self, generation, keys, ids, tokens, offsets, postings):
+        self.generation = generation
+        self.keys = keys
+        self.ids = ids
+        self.tokens = tokens
+        self.offsets = offsets
+        self.postings = postings
+
+    @classmethod
+    def build(cls, generation):
+        """
+        Builds the index from the database.
+
+        Args:
+            generation (int): Generation of the data that is read.
+
+        Returns:
+            PrefixIndex: The new index.
+        """
+        token_positions = {}
+        # Both queries read the same snapshot, so the subjects of teachers
+        # inserted by an import that commits in between are not read
+        with transaction.atomic():
+            # Sorted in Python, so keys can be bisected with the same ordering
+            keys = sorted(
+                Teacher.objects.values_list('last_name', 'first_name', 'pk')
+            )
+            positions = {pk: position
+                         for position, (_, _, pk) in enumerate(keys)}
+
+            for last_name, first_name, pk in keys:
+                for token in tokenize(f'{first_name} {last_name}'):
+                    token_positions.setdefault(token, set()).add(
+                        positions[pk]
+                    )
+            subjects = Teacher.subjects_taught.through.objects.values_list(
+                'teacher_id', 'subject__name'
+            )
+            for pk, name in subjects.iterator(chunk_size=10000):
+                for token in tokenize(name):
+                    token_positions.setdefault(token, set()).add(
+                        positions[pk]
+                    )
+
+        tokens = sorted(token_positions)
+        lengths = [len(token_positions[token]) for token in tokens]
+        offsets = np.zeros(len(tokens) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        postings = np.empty(offsets[-1], dtype=np.int32)
+        for token, start, end in zip(tokens, offsets, offsets[1:]):
+            postings[start:end] = sorted(token_positions[token])
+        ids = np.array([pk for _, _, pk in keys], dtype=np.int64)
+        return cls(generation, keys, ids, tokens, offsets, postings)
+
+    def lookup(self, prefix):
+        """
+        Returns the positions of the teachers with a token starting with the
+        prefix.
+
+        Args:
+            prefix (str): Normalized token prefix.
+
+        Returns:
+            np.ndarray: Sorted positions.
+        """
+        start = bisect_left(self.tokens, prefix)
+        end = bisect_left(self.tokens, prefix + '\U0010ffff', start)
+        if start == end:
+            return np.empty(0, dtype=np.int32)
+        postings = self.postings[self.offsets[start]:self.offsets[end]]
+        if end - start == 1:
+            return postings
+        return np.unique(postings)
+
+    def search(self, query):
+        """
+        Returns the teachers with a token starting with every token of the
+        query.
+
+        Args:
+            query (str): Search query.
+
+        Returns:
+            np.ndarray: Sorted positions of the matching teachers.
+        """
+        prefixes = sorted(set(tokenize(query)), key=len, reverse=True)
+        if not prefixes:
+            return np.arange(len(self.ids), dtype=np.int32)
+        positions = None
+        for prefix in prefixes:
+            matches = self.lookup(prefix)
+            positions = matches if positions is None else np.intersect1d(
+                positions, matches, assume_unique=True
+            )
+            if not len(positions):
+                break
+        return positions
+
+    def position(self, key, after=True):
+        """
+        Returns the position of the first teacher ordered after a key, or at
+        or after it.
+
+        Args:
+            key (tuple): (last_name, first_name, id) of a teacher.
+            after (bool): Skip the teacher with the key itself.
+
+        Returns:
+            int: Position in directory order.
+        """
+        bisect = bisect_right if after else bisect_left
+        return bisect(self.keys, tuple(key))
+
+
+class SearchResults():
+    """
+    Lazy sequence of the teachers matched by the prefix index, for the
+    paginator. The number of results is known without a query and only the
+    teachers of the requested page are loaded.
+
+    Attributes:
+        queryset (QuerySet): Teachers the results are loaded from.
+        index (PrefixIndex): Index that was searched.
+        positions (np.ndarray): Sorted positions of the matched teachers.
+    """
+
+    def __init__(self, queryset, index, positions):
+        self.queryset = queryset
+        self.index = index
+        self.positions = positions
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            return self[key:key + 1][0]
+        ids = [int(pk) for pk in self.index.ids[self.positions[key]]]
+        teachers = self.queryset.in_bulk(ids)
+        return [teachers[pk] for pk in ids if pk in teachers]
+
+    def offset(self, key, after=True):
+        """
+        Returns the offset of the first result ordered after a key, or at or
+        after it.
+
+        Args:
+            key (tuple): (last_name, first_name, id) of a teacher.
+            after (bool): Skip the teacher with the key itself.
+
+        Returns:
+            int: Offset in the results.
+        """
+        return int(np.searchsorted(
+            self.positions, self.index.position(key, after)
+        ))
+
+
+def get_prefix_index():
+    """
+    Returns the prefix index of this process. It is built on first use and
+    rebuilt when the generation of the directory data changed.
+
+    Returns:
+        PrefixIndex: Current index.
+    """
+    global _index
+    generation = get_generation()
+    index = _index
+    if index is None or index.generation != generation:
+        with _index_lock:
+            if _index is None or _index.generation != generation:
+                _index = PrefixIndex.build(generation)
+            index = _index
+    return index
+
+
+def memory_search(queryset, query):
+    """
+    Searches the in-memory prefix index.
+
+    Args:
+        queryset (QuerySet): Teachers to search.
+        query (str): Search query.
+
+    Returns:
+        SearchResults: Matching teachers in directory order.
+    """
+    index = get_prefix_index()
+    return SearchResults(queryset, index, index.search(query))
@@ -0,0 +1,183 @@
+from functools import reduce
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from core.utils.prefix_index import memory_search
+
+SEARCH_TABLE = 'core_teacher_search'
+TEACHER_TABLE = 'core_teacher'
+THROUGH_TABLE = 'core_teacher_subjects_taught'
+
+# Teacher names and the names of their subjects, one row per teacher
+SEARCH_ROWS_SQL = """
+    SELECT t.id, t.first_name, t.last_name,
+           COALESCE(GROUP_CONCAT(s.name, ' '), '')
+    FROM {teacher_table} t
+    LEFT JOIN {through_table} ts ON ts.teacher_id = t.id
+    LEFT JOIN core_subject s ON s.id = ts.subject_id
+    {where}
+    GROUP BY t.id
+"""
+
+_fts_available = None
+
+
+def fts_available():
+    """
+    Checks whether the SQLite FTS5 search table exists. Other database
+    backends and SQLite builds without FTS5 use the ORM search instead.
+
+    Returns:
+        bool: True if the full-text search table can be queried.
+    """
+    global _fts_available
+    if _fts_available is None:
+        _fts_available = (
+            connection.vendor == 'sqlite' and
+            SEARCH_TABLE in connection.introspection.table_names()
+        )
+    return _fts_available
+
+
+def get_search_backend():
+    """
+    Returns the search backend configured by DIRECTORY_SEARCH_BACKEND.
+    'auto' selects 'fts' when the full-text search table is available and
+    'orm' otherwise. 'memory' searches the in-memory prefix index of the
+    process.
+
+    Returns:
+        str: 'fts', 'memory' or 'orm'.
+    """
+    backend = getattr(settings, 'DIRECTORY_SEARCH_BACKEND', 'auto')
+    if backend == 'auto':
+        return 'fts' if fts_available() else 'orm'
+    if backend == 'fts' and not fts_available():
+        return 'orm'
+    return backend
+
+
+def search_teachers(queryset, query):
+    """
+    Filters teachers whose first name, last name or one of whose subjects
+    starts with every token of the query.
+
+    Args:
+        queryset (QuerySet): Teachers to search.
+        query (str): Search query.
+
+    Returns:
+        QuerySet or SearchResults: Matching teachers.
+    """
+    tokens = query.split()
+    if not tokens:
+        return queryset
+    backend = get_search_backend()
+    if backend == 'memory':
+        return memory_search(queryset, query)
+    if backend == 'fts':
+        return fts_search(queryset, tokens)
+    return orm_search(queryset, tokens)
+
+
+def orm_search(queryset, tokens):
+    """
+    Searches with one ``istartswith`` filter per token.
+
+    Args:
+        queryset (QuerySet): Teachers to search.
+        tokens (list): Search tokens.
+
+    Returns:
+        QuerySet: Matching teachers.
+    """
+    query_filters = [
+        Q(first_name__istartswith=token) |
+        Q(last_name__istartswith=token) |
+        Q(subjects_taught__name__istartswith=token)
+        for token in tokens
+    ]
+    return queryset.filter(
+        reduce(lambda a, b: a & b, query_filters)
+    ).distinct()
+
+
+def fts_search(queryset, tokens):
+    """
+    Searches the FTS5 table for words starting with every token. Unlike the
+    ORM search, tokens also match words inside names and subjects, e.g.
+    'sci' matches 'Computer Science'.
+
+    Args:
+        queryset (QuerySet): Teachers to search.
+        tokens (list): Search tokens.
+
+    Returns:
+        QuerySet: Matching teachers.
+    """
+    # Every token is a quoted prefix phrase, so FTS5 syntax is not parsed
+    match = ' AND '.join(
+        '"{}"*'.format(token.replace('"', '""')) for token in tokens
+    )
+    return queryset.filter(pk__in=RawSQL(
+        f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s',
+        [match]
+    ))
+
+
+def update_search_index(teacher_ids=None, batch_size=500):
+    """
+    Updates the search rows of the given teachers, or rebuilds the whole
+    search table. Rows of deleted teachers are removed.
+
+    Args:
+        teacher_ids (iterable): Ids of changed teachers, or None to rebuild.
+        batch_size (int): Number of teachers updated per statement.
+    """
+    if not fts_available():
+        return
+
+    insert = (
+        f'INSERT INTO {SEARCH_TABLE} '
+        f'(rowid, first_name, last_name, subjects) '
+    )
+    with connection.cursor() as cursor:
+        if teacher_ids is None:
+            cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+            cursor.execute(insert + search_rows_sql())
+            return
+
+        teacher_ids = list(teacher_ids)
+        for start in range(0, len(teacher_ids), batch_size):
+            batch = teacher_ids[start:start + batch_size]
+            placeholders = ', '.join(['%s'] * len(batch))
+            cursor.execute(
+                f'DELETE FROM {SEARCH_TABLE} '
+                f'WHERE rowid IN ({placeholders})',
+                batch
+            )
+            cursor.execute(
+                insert + search_rows_sql(
+                    where=f'WHERE t.id IN ({placeholders})'
+                ),
+                batch
+            )
+
+
+def search_rows_sql(where='', teacher_table=TEACHER_TABLE,
+                    through_table=THROUGH_TABLE):
+    """
+    Returns the query selecting the search rows of teachers.
+
+    Args:
+        where (str): WHERE clause on the teacher table aliased as 't'.
+        teacher_table (str): Teacher table, e.g. a staging table.
+        through_table (str): Table relating the teachers to their subjects.
+
+    Returns:
+        str: SQL query.
+    """
+    return SEARCH_ROWS_SQL.format(
+        where=where, teacher_table=teacher_table, through_table=through_table
+    )
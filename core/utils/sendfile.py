@@ -0,0 +1,121 @@
+import mimetypes
+import os
+import posixpath
+import re
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date
+
+# Profile pictures and their thumbnails are named after the SHA-256 digest
+# of their content, so a name always refers to the same bytes
+CONTENT_ADDRESSED_NAME = re.compile(r'(^|/)[0-9a-f]{64}\.\w+$')
+
+# Precompressed variants in order of preference
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def is_content_addressed(name):
+    """
+    Checks whether a media file name contains the digest of its content.
+
+    Args:
+        name (str): Storage name relative to MEDIA_ROOT.
+
+    Returns:
+        bool: True for content-addressed names.
+    """
+    return bool(CONTENT_ADDRESSED_NAME.search(name))
+
+
+def serve_file(request, root, path, offload_url, immutable=False,
+               precompressed=False):
+    """
+    Serves a file below ``root``. With SENDFILE_BACKEND set, the response
+    only carries an X-Accel-Redirect (nginx) or X-Sendfile (Apache,
+    lighttpd) header and the front proxy sends the file, otherwise the file
+    is streamed with FileResponse, which uses the sendfile support of the
+    WSGI server when there is one.
+
+    Args:
+        request (HttpRequest): Current request.
+        root (str): Directory the file is served from.
+        path (str): Path of the file relative to ``root``.
+        offload_url (str): Internal URL prefix that the proxy maps to
+        ``root``, for X-Accel-Redirect.
+        immutable (bool): The content of the path never changes, so clients
+        may cache it for STATIC_MAX_AGE seconds without revalidating.
+        precompressed (bool): Serve .br and .gz variants stored next to the
+        file to clients accepting them.
+
+    Returns:
+        HttpResponse: Response sending the file, or 304 Not Modified.
+    """
+    path = posixpath.normpath(path).lstrip('/')
+    try:
+        full_path = safe_join(root, path)
+    except SuspiciousFileOperation:
+        raise Http404('File not found')
+    if not os.path.isfile(full_path):
+        raise Http404('File not found')
+
+    stat = os.stat(full_path)
+    response = get_conditional_response(
+        request, last_modified=int(stat.st_mtime)
+    )
+    if response is None:
+        backend = getattr(settings, 'SENDFILE_BACKEND', None)
+        content_type, _ = mimetypes.guess_type(full_path)
+        content_type = content_type or 'application/octet-stream'
+        encoding = None
+        if precompressed and backend != 'x-accel-redirect':
+            # nginx drops Content-Encoding on internal redirects and picks
+            # the variants itself with gzip_static and brotli_static
+            encoding, full_path = choose_variant(request, full_path)
+
+        if backend == 'x-accel-redirect':
+            response = HttpResponse(content_type=content_type)
+            response['X-Accel-Redirect'] = offload_url.rstrip('/') + '/' + path
+        elif backend == 'x-sendfile':
+            response = HttpResponse(content_type=content_type)
+            response['X-Sendfile'] = full_path
+        else:
+            response = FileResponse(
+                open(full_path, 'rb'), content_type=content_type
+            )
+        if encoding:
+            response['Content-Encoding'] = encoding
+        if precompressed:
+            patch_vary_headers(response, ['Accept-Encoding'])
+        response['Last-Modified'] = http_date(stat.st_mtime)
+
+    if immutable:
+        patch_cache_control(
+            response, public=True, immutable=True,
+            max_age=getattr(settings, 'STATIC_MAX_AGE', 365 * 24 * 3600)
+        )
+    else:
+        patch_cache_control(response, public=True, no_cache=True)
+    return response
+
+
+def choose_variant(request, full_path):
+    """
+    Returns the precompressed variant of a file that the client accepts.
+
+    Args:
+        request (HttpRequest): Current request.
+        full_path (str): Path of the uncompressed file.
+
+    Returns:
+        tuple: Content encoding, or None, and the path of the file to send.
+    """
+    accepted = request.META.get('HTTP_ACCEPT_ENCODING', '')
+    for encoding, extension in ENCODINGS:
+        if encoding in accepted and os.path.isfile(full_path + extension):
+            return encoding, full_path + extension
+    return None, full_path
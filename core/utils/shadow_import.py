@@ -0,0 +1,583 @@
+import os
+import re
+import socket
+import time
+import zipfile
+import pandas as pd
+
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+from core.models import ImportLock, Subject, Teacher
+from core.utils.generation import bump_generation
+from core.utils.importer import TEACHER_FIELDS, BulkTeacherImporter
+from core.utils.pictures import collect_orphaned_pictures
+from core.utils.search import (
+    SEARCH_TABLE, TEACHER_TABLE, THROUGH_TABLE, fts_available,
+    search_rows_sql
+)
+
+STAGING_SUFFIX = '_staging'
+RETIRED_SUFFIX = '_old'
+# Index names are global in SQLite, so the indexes of the staging tables are
+# created under this suffix whenever the live table holds the plain name
+SHADOW_INDEX_SUFFIX = '_shadow'
+
+CREATE_INDEX = re.compile(
+    r'^(CREATE (?:UNIQUE )?INDEX )"([^"]+)" ON "([^"]+)"', re.IGNORECASE
+)
+
+# ImportLock held while the staging tables are in use
+LOCK_NAME = 'replace-import'
+# Seconds between refreshes of the lock by a running import
+LOCK_REFRESH_INTERVAL = 30
+
+
+class ReplaceImportRunning(Exception):
+    """
+    Another replace import holds the staging tables, or the lock of this
+    import expired and was taken over.
+    """
+
+
+class ShadowTeacherImporter(BulkTeacherImporter):
+    """
+    Full-replace importer that never writes to the live tables while rows
+    are loaded.
+
+    The teachers and their subjects are written to empty staging copies of
+    ``core_teacher`` and its subjects table, in one short transaction per
+    batch. Once all rows and pictures are in place, the indexes and the
+    search table are built on the staging tables, and a single transaction
+    renames the staging tables over the live ones and bumps the data
+    generation. Readers see the previous directory until that transaction
+    commits and the new one afterwards, and a failed import only leaves
+    staging tables behind, which are dropped.
+
+    Teachers keep their id and version when their email address is already
+    in the directory, and their version is incremented when their row
+    changed, so cached profiles and bookmarked URLs stay valid. New teachers
+    get ids above every id the live table ever used. Teachers missing from
+    the file are removed, like in ``sync`` mode, and so are changes made to
+    the live tables while the import runs.
+
+    The staging tables have fixed names, so a replace import holds an
+    ImportLock from before it creates them until they are dropped, and a
+    second replace import, e.g. the ``import_teachers`` command while an
+    import job runs, is refused with ReplaceImportRunning.
+
+    The swap relies on SQLite renaming tables along with their foreign keys,
+    so other database backends run a ``sync`` import instead.
+    """
+
+    def __init__(self, zip_ref=None, batch_size=None, progress=None,
+                 image_workers=None):
+        super().__init__(
+            zip_ref,
+            batch_size=batch_size,
+            progress=progress,
+            image_workers=image_workers,
+            sync=True
+        )
+        self.teacher_table = TEACHER_TABLE + STAGING_SUFFIX
+        self.through_table = THROUGH_TABLE + STAGING_SUFFIX
+        self.search_table = SEARCH_TABLE + STAGING_SUFFIX
+        self.staged_pks = {}
+        self.next_pk = None
+        self.import_lock = None
+        self.lock_refreshed = 0.0
+
+    def run(self, csv_data):
+        """
+        Import all rows of the dataframe into staging tables and swap them
+        in.
+
+        Args:
+            csv_data (DataFrame or iterable): Dataframe with teacher data, or
+            an iterable of dataframe chunks which are imported as they are
+            read.
+
+        Returns:
+            dict: Number of processed rows and of inserted, updated,
+            unchanged and removed teachers, and the messages of skipped
+            pictures as 'errors'.
+
+        Raises:
+            ReplaceImportRunning: If another replace import is running.
+        """
+        if connection.vendor != 'sqlite':
+            return super().run(csv_data)
+        if isinstance(csv_data, pd.DataFrame):
+            csv_data = [csv_data]
+        started_at = timezone.now()
+        self.acquire_lock()
+        self.image_pool = ThreadPoolExecutor(
+            max_workers=self.image_workers, thread_name_prefix='import-image'
+        )
+        try:
+            self.create_staging_tables()
+            self.subject_ids = dict(Subject.objects.values_list('name', 'pk'))
+            for chunk in csv_data:
+                for start in range(0, len(chunk), self.batch_size):
+                    batch = chunk.iloc[start:start + self.batch_size]
+                    with transaction.atomic():
+                        self.rows_processed += self.import_batch(batch)
+                    self.report_progress()
+            with transaction.atomic():
+                self.link_profile_pictures()
+            self.report_progress()
+            self.create_staging_indexes()
+            self.swap_tables()
+        finally:
+            self.image_pool.shutdown(cancel_futures=True)
+            try:
+                self.drop_tables(STAGING_SUFFIX)
+            finally:
+                self.release_lock()
+        if getattr(settings, 'IMPORT_COLLECT_ORPHANED_PICTURES', True):
+            transaction.on_commit(
+                lambda: collect_orphaned_pictures(started_at)
+            )
+        return dict(self.summary, rows=self.rows_processed, errors=self.errors)
+
+    def acquire_lock(self):
+        """
+        Take the replace import lock, after removing a lock its holder did
+        not refresh for IMPORT_LOCK_TIMEOUT seconds.
+
+        Raises:
+            ReplaceImportRunning: If another replace import holds the lock.
+        """
+        timeout = getattr(settings, 'IMPORT_LOCK_TIMEOUT', 10 * 60)
+        now = timezone.now()
+        ImportLock.objects.filter(
+            name=LOCK_NAME, updated_at__lt=now - timedelta(seconds=timeout)
+        ).delete()
+        try:
+            with transaction.atomic():
+                self.import_lock = ImportLock.objects.create(
+                    name=LOCK_NAME,
+                    owner=f'process {os.getpid()} on {socket.gethostname()}',
+                    created_at=now,
+                    updated_at=now
+                )
+        except IntegrityError:
+            holder = ImportLock.objects.filter(name=LOCK_NAME).first()
+            message = 'Another replace import is running'
+            if holder:
+                started = timezone.localtime(holder.created_at)
+                message += f' ({holder.owner}, since {started:%Y-%m-%d %H:%M})'
+            raise ReplaceImportRunning(message + '.')
+        self.lock_refreshed = time.monotonic()
+
+    def refresh_lock(self, force=False):
+        """
+        Refresh the lock at most every LOCK_REFRESH_INTERVAL seconds, unless
+        ``force`` is set.
+
+        Raises:
+            ReplaceImportRunning: If the lock expired and was taken over.
+        """
+        if not force and (time.monotonic() - self.lock_refreshed
+                          < LOCK_REFRESH_INTERVAL):
+            return
+        refreshed = ImportLock.objects.filter(pk=self.import_lock.pk).update(
+            updated_at=timezone.now()
+        )
+        if not refreshed:
+            raise ReplaceImportRunning(
+                'The lock of the replace import expired and was taken over '
+                'by another import.'
+            )
+        self.lock_refreshed = time.monotonic()
+
+    def release_lock(self):
+        ImportLock.objects.filter(pk=self.import_lock.pk).delete()
+        self.import_lock = None
+
+    def report_progress(self):
+        if self.import_lock:
+            self.refresh_lock()
+        super().report_progress()
+
+    def wait_for_pictures(self):
+        if self.import_lock:
+            # Keep the lock while the image pool finishes the pictures
+            pending = set(self.stored_pictures.values())
+            while pending:
+                _, pending = wait(pending, timeout=LOCK_REFRESH_INTERVAL)
+                self.refresh_lock()
+        return super().wait_for_pictures()
+
+    def create_staging_tables(self):
+        """
+        Create empty staging tables from the schema of the live tables. The
+        staging subjects table refers to the staging teachers, and the id
+        sequence of the staging teachers continues the live one.
+        """
+        self.drop_tables(STAGING_SUFFIX)
+        self.drop_tables(RETIRED_SUFFIX)
+        # Left under the shadow names by an import interrupted after its swap
+        self.restore_index_names()
+        with transaction.atomic(), connection.cursor() as cursor:
+            for table in (TEACHER_TABLE, THROUGH_TABLE):
+                sql = self.schema_sql(cursor, 'table', table)
+                sql = sql.replace(
+                    f'TABLE "{table}"', f'TABLE "{table}{STAGING_SUFFIX}"', 1
+                ).replace(
+                    f'REFERENCES "{TEACHER_TABLE}" ',
+                    f'REFERENCES "{self.teacher_table}" '
+                )
+                cursor.execute(sql)
+            if fts_available():
+                cursor.execute(self.schema_sql(
+                    cursor, 'table', SEARCH_TABLE
+                ).replace(SEARCH_TABLE, self.search_table, 1))
+
+            self.next_pk = self.last_used_pk(cursor) + 1
+
+    def create_staging_indexes(self):
+        """
+        Create the indexes of the live tables on the loaded staging tables
+        and fill the staging search table.
+        """
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'index'"
+            )
+            existing = {name for name, in cursor.fetchall()}
+            for table in (TEACHER_TABLE, THROUGH_TABLE):
+                cursor.execute(
+                    "SELECT sql FROM sqlite_master "
+                    "WHERE type = 'index' AND tbl_name = %s "
+                    "AND sql IS NOT NULL",
+                    [table]
+                )
+                for sql, in cursor.fetchall():
+                    cursor.execute(self.staging_index_sql(sql, existing))
+            if fts_available():
+                cursor.execute(
+                    f'INSERT INTO {self.search_table} '
+                    f'(rowid, first_name, last_name, subjects) ' +
+                    search_rows_sql(
+                        teacher_table=self.teacher_table,
+                        through_table=self.through_table
+                    )
+                )
+
+    @staticmethod
+    def staging_index_sql(sql, existing):
+        """
+        Rewrite the CREATE INDEX statement of a live table for its staging
+        table. The index gets the plain name if it is free and the shadow
+        name otherwise, see ``restore_index_names``.
+
+        Args:
+            sql (str): CREATE INDEX statement of the live index.
+            existing (set): Names of all indexes in the database.
+
+        Returns:
+            str: CREATE INDEX statement for the staging table.
+        """
+        match = CREATE_INDEX.match(sql)
+        name = match.group(2)
+        if name.endswith(SHADOW_INDEX_SUFFIX):
+            name = name[:-len(SHADOW_INDEX_SUFFIX)]
+        if name in existing:
+            name += SHADOW_INDEX_SUFFIX
+        return (
+            f'{match.group(1)}"{name}" ON '
+            f'"{match.group(3)}{STAGING_SUFFIX}"' + sql[match.end():]
+        )
+
+    def swap_tables(self):
+        """
+        Replace the live tables by the staging tables in one transaction and
+        drop the previous tables once it committed.
+
+        Renaming a table renames its ``sqlite_sequence`` row along with it,
+        so the sequence of the live teachers is carried over explicitly:
+        otherwise the ids of removed teachers above the highest staged id
+        would be handed out again.
+        """
+        tables = [TEACHER_TABLE, THROUGH_TABLE]
+        if fts_available():
+            tables.append(SEARCH_TABLE)
+        with transaction.atomic(), connection.cursor() as cursor:
+            # Only swap in tables nobody else touched since the lock expired
+            self.refresh_lock(force=True)
+            cursor.execute(
+                f'SELECT COUNT(*) FROM "{TEACHER_TABLE}" WHERE id NOT IN '
+                f'(SELECT id FROM "{self.teacher_table}")'
+            )
+            self.summary['removed'] = cursor.fetchone()[0]
+            last_pk = self.last_used_pk(cursor)
+            for table in tables:
+                cursor.execute(
+                    f'ALTER TABLE "{table}" '
+                    f'RENAME TO "{table}{RETIRED_SUFFIX}"'
+                )
+                cursor.execute(
+                    f'ALTER TABLE "{table}{STAGING_SUFFIX}" '
+                    f'RENAME TO "{table}"'
+                )
+            cursor.execute(
+                'DELETE FROM sqlite_sequence WHERE name = %s',
+                [TEACHER_TABLE]
+            )
+            cursor.execute(
+                'INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)',
+                [TEACHER_TABLE, max(last_pk, self.next_pk - 1)]
+            )
+            bump_generation()
+        self.drop_tables(RETIRED_SUFFIX)
+        self.restore_index_names()
+
+    @staticmethod
+    def last_used_pk(cursor):
+        """
+        Returns the highest teacher id the live table ever used.
+        """
+        cursor.execute(
+            'SELECT seq FROM sqlite_sequence WHERE name = %s',
+            [TEACHER_TABLE]
+        )
+        row = cursor.fetchone()
+        cursor.execute(f'SELECT MAX(id) FROM "{TEACHER_TABLE}"')
+        return max(row[0] if row else 0, cursor.fetchone()[0] or 0)
+
+    def restore_index_names(self):
+        """
+        Rebuild the indexes the swap brought in under SHADOW_INDEX_SUFFIX
+        under their plain names, which the retired tables held until they
+        were dropped, so the names match the migration state again. SQLite
+        cannot rename an index, so each one is dropped and created again.
+        """
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT name, sql FROM sqlite_master "
+                "WHERE type = 'index' AND tbl_name IN (%s, %s) "
+                "AND sql IS NOT NULL",
+                [TEACHER_TABLE, THROUGH_TABLE]
+            )
+            for name, sql in cursor.fetchall():
+                if not name.endswith(SHADOW_INDEX_SUFFIX):
+                    continue
+                match = CREATE_INDEX.match(sql)
+                cursor.execute(f'DROP INDEX "{name}"')
+                cursor.execute(
+                    f'{match.group(1)}"{name[:-len(SHADOW_INDEX_SUFFIX)]}" '
+                    f'ON "{match.group(3)}"' + sql[match.end():]
+                )
+
+    def drop_tables(self, suffix):
+        """
+        Drop the staging or retired tables, if they exist.
+
+        Args:
+            suffix (str): STAGING_SUFFIX or RETIRED_SUFFIX.
+        """
+        with transaction.atomic(), connection.cursor() as cursor:
+            for table in (THROUGH_TABLE, TEACHER_TABLE, SEARCH_TABLE):
+                cursor.execute(f'DROP TABLE IF EXISTS "{table}{suffix}"')
+
+    @staticmethod
+    def schema_sql(cursor, kind, name):
+        cursor.execute(
+            'SELECT sql FROM sqlite_master WHERE type = %s AND name = %s',
+            [kind, name]
+        )
+        return cursor.fetchone()[0]
+
+    def import_batch(self, batch):
+        """
+        Write a single batch of rows to the staging tables.
+
+        Args:
+            batch (DataFrame): Slice of the dataframe with teacher data.
+
+        Returns:
+            int: Number of imported rows.
+        """
+        if connection.vendor != 'sqlite':
+            return super().import_batch(batch)
+
+        # Later rows win when the same email address occurs more than once
+        rows = {}
+        for row in batch.to_dict('records'):
+            rows[row['email_address']] = row
+
+        existing = Teacher.objects.only(
+            'pk', 'email_address', 'fingerprint', 'profile_picture',
+            'version', 'updated_at', *TEACHER_FIELDS
+        ).in_bulk(list(rows), field_name='email_address')
+        fingerprints = {
+            email: self.fingerprint(row) for email, row in rows.items()
+        }
+        unchanged = self.unchanged_rows(existing, rows, fingerprints)
+        now = timezone.now()
+        teachers, teacher_subjects = [], {}
+        repeated = [self.staged_pks[email] for email in rows
+                    if email in self.staged_pks]
+        for email, row in rows.items():
+            subjects = self.parse_subjects(row['subjects_taught'])
+            fingerprint = fingerprints[email]
+            teacher = existing.get(email)
+            if teacher is None:
+                teacher = Teacher(
+                    pk=self.staged_pks.get(email), email_address=email
+                )
+                if teacher.pk is None:
+                    teacher.pk = self.next_pk
+                    self.next_pk += 1
+                    self.summary['inserted'] += 1
+            elif teacher.fingerprint == fingerprint or email in unchanged:
+                # Only the fingerprint of the live row may change
+                teacher.fingerprint = fingerprint
+                if email not in self.staged_pks:
+                    self.summary['unchanged'] += 1
+            else:
+                teacher.version += 1
+                teacher.updated_at = now
+                if email not in self.staged_pks:
+                    self.summary['updated'] += 1
+
+            if teacher.fingerprint != fingerprint:
+                teacher.fingerprint = fingerprint
+                for field in TEACHER_FIELDS:
+                    setattr(teacher, field, row[field])
+                picture = self.set_profile_picture(teacher, row)
+                if picture:
+                    self.pending_pictures[teacher.pk] = picture
+                    self.current_pictures[teacher.pk] = (
+                        teacher.profile_picture.name
+                    )
+                else:
+                    self.pending_pictures.pop(teacher.pk, None)
+            else:
+                # The live row is copied as it is
+                for field in TEACHER_FIELDS:
+                    setattr(teacher, field, row[field])
+                self.pending_pictures.pop(teacher.pk, None)
+            self.staged_pks[email] = teacher.pk
+            teachers.append(teacher)
+            teacher_subjects[teacher.pk] = subjects
+
+        self.create_missing_subjects(teacher_subjects.values())
+
+        columns = ['id', 'email_address'] + TEACHER_FIELDS + [
+            'profile_picture', 'fingerprint', 'version', 'updated_at'
+        ]
+        placeholders = ', '.join(['%s'] * len(columns))
+        with connection.cursor() as cursor:
+            if repeated:
+                cursor.execute(
+                    f'DELETE FROM "{self.through_table}" WHERE teacher_id IN '
+                    f'({", ".join(["%s"] * len(repeated))})',
+                    repeated
+                )
+            cursor.executemany(
+                f'INSERT OR REPLACE INTO "{self.teacher_table}" '
+                f'({", ".join(columns)}) VALUES ({placeholders})',
+                [self.staging_row(teacher) for teacher in teachers]
+            )
+            cursor.executemany(
+                f'INSERT INTO "{self.through_table}" '
+                f'(teacher_id, subject_id) VALUES (%s, %s)',
+                [
+                    (pk, self.subject_ids[name])
+                    for pk, names in teacher_subjects.items()
+                    for name in names
+                ]
+            )
+        return len(rows)
+
+    @staticmethod
+    def staging_row(teacher):
+        """
+        Returns the column values of a teacher for the staging table.
+
+        Args:
+            teacher (Teacher): Teacher instance, saved or not.
+
+        Returns:
+            list: Values in the order of the staging INSERT statement.
+        """
+        values = [teacher.pk, teacher.email_address] + [
+            getattr(teacher, field) for field in TEACHER_FIELDS
+        ]
+        values.append(teacher.profile_picture.name or '')
+        values.append(teacher.fingerprint)
+        values.append(teacher.version)
+        values.append(connection.ops.adapt_datetimefield_value(
+            teacher.updated_at
+        ))
+        return values
+
+    def link_profile_pictures(self):
+        """
+        Wait for the image pool and link the staged teachers to their stored
+        pictures.
+        """
+        if connection.vendor != 'sqlite':
+            return super().link_profile_pictures()
+        stored = self.wait_for_pictures()
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'UPDATE "{self.teacher_table}" '
+                f'SET profile_picture = %s WHERE id = %s',
+                [
+                    (stored[member], pk)
+                    for pk, member in self.pending_pictures.items()
+                    if stored[member] is not None
+                    and stored[member] != self.current_pictures.get(pk)
+                ]
+            )
+
+    def teacher_emails(self, pks):
+        if connection.vendor != 'sqlite':
+            return super().teacher_emails(pks)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT id, email_address FROM "{self.teacher_table}" '
+                f'WHERE id IN ({", ".join(["%s"] * len(pks))})',
+                pks
+            )
+            return dict(cursor.fetchall())
+
+
+def replace_teachers_from_csv(csv_data, zip_file=None, batch_size=None,
+                              progress=None, image_workers=None):
+    """
+    Replace the directory with the teachers of a CSV file and their profile
+    pictures from an optional zip file, see ``ShadowTeacherImporter``.
+
+    Args:
+        csv_data (DataFrame or iterable): Dataframe with teacher data, or an
+        iterable of dataframe chunks.
+        zip_file (InMemoryUploadedFile or str): Zip file with profile
+        pictures, or its path, or None.
+        batch_size (int): Number of rows written per batch.
+        progress (callable): Called with the number of rows and images
+        processed so far after every batch.
+        image_workers (int): Number of threads storing profile pictures.
+
+    Returns:
+        dict: Number of processed rows and of inserted, updated, unchanged
+        and removed teachers, and the messages of skipped pictures.
+    """
+    if zip_file is None:
+        importer = ShadowTeacherImporter(
+            batch_size=batch_size, progress=progress
+        )
+        return importer.run(csv_data)
+    with zipfile.ZipFile(zip_file, 'r') as zip_ref:
+        importer = ShadowTeacherImporter(
+            zip_ref,
+            batch_size=batch_size,
+            progress=progress,
+            image_workers=image_workers
+        )
+        return importer.run(csv_data)
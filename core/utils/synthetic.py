@@ -0,0 +1,153 @@
+import io
+import random
+import zipfile
+import numpy as np
+import pandas as pd
+
+from PIL import Image, ImageDraw
+
+FIRST_NAMES = [
+    'Aaron', 'Abigail', 'Adam', 'Aisha', 'Alejandro', 'Alice', 'Amelia',
+    'Andrew', 'Anna', 'Arjun', 'Beatriz', 'Benjamin', 'Camille', 'Carlos',
+    'Charlotte', 'Chen', 'Chloe', 'Daniel', 'David', 'Diego', 'Elena',
+    'Elijah', 'Emily', 'Emma', 'Ethan', 'Fatima', 'Felix', 'François',
+    'Gabriel', 'Grace', 'Hana', 'Hannah', 'Henry', 'Ibrahim', 'Isabella',
+    'Isaac', 'Jack', 'James', 'Jana', 'Javier', 'José', 'Julia', 'Kenji',
+    'Laura', 'Leila', 'Liam', 'Lucas', 'Lucía', 'Maria', 'Mark', 'Marta',
+    'Mateo', 'Mia', 'Michael', 'Mohammed', 'Nadia', 'Noah', 'Nora',
+    'Oliver', 'Olivia', 'Omar', 'Priya', 'Rachel', 'Rahul', 'Rebecca',
+    'Renée', 'Samuel', 'Sara', 'Sofia', 'Sophie', 'Thomas', 'Tomás',
+    'Valentina', 'Wei', 'William', 'Yuki', 'Zoë',
+]
+LAST_NAMES = [
+    'Adams', 'Ahmed', 'Álvarez', 'Anderson', 'Bailey', 'Baker', 'Becker',
+    'Brown', 'Campbell', 'Carter', 'Chen', 'Clark', 'Collins', 'Cooper',
+    'Davies', 'Díaz', 'Dubois', 'Edwards', 'Evans', 'Fischer', 'Flores',
+    'García', 'Gómez', 'González', 'Green', 'Hall', 'Harris', 'Hernández',
+    'Hill', 'Hughes', 'Ito', 'Jackson', 'Johnson', 'Jones', 'Kelly', 'Khan',
+    'Kim', 'King', 'Kowalski', 'Lee', 'Lewis', 'López', 'Martin',
+    'Martínez', 'Meyer', 'Miller', 'Moore', 'Morgan', 'Müller', 'Murphy',
+    'Nguyen', 'Novak', "O'Brien", 'Patel', 'Pérez', 'Phillips', 'Roberts',
+    'Robinson', 'Rodríguez', 'Rossi', 'Sánchez', 'Schmidt', 'Scott',
+    'Singh', 'Smith', 'Suzuki', 'Tanaka', 'Taylor', 'Thomas', 'Thompson',
+    'Turner', 'Walker', 'Wang', 'Watson', 'White', 'Williams', 'Wilson',
+    'Wright', 'Yamamoto', 'Young', 'Zhang',
+]
+# Subjects in descending order of how many teachers teach them
+SUBJECTS = [
+    'Mathematics', 'English', 'Science', 'History', 'Physical Education',
+    'Geography', 'Biology', 'Chemistry', 'Physics', 'Art', 'Music',
+    'Computer Science', 'French', 'Spanish', 'German', 'Economics',
+    'Religious Studies', 'Drama', 'Design Technology', 'Psychology',
+    'Sociology', 'Latin', 'Business Studies', 'Philosophy', 'Astronomy',
+]
+# Probabilities of teaching one to five subjects
+SUBJECT_COUNTS = [0.35, 0.35, 0.18, 0.08, 0.04]
+
+
+def synthetic_roster(rows, seed=0, pictures=0):
+    """
+    Returns a dataframe with valid synthetic teachers in the layout accepted
+    by CSVFileValidator. Names are drawn from common first and last names,
+    so searches match realistic fractions of the roster, and subjects follow
+    a Zipf distribution, so a few subjects are taught by most teachers.
+
+    Args:
+        rows (int): Number of teachers.
+        seed (int): Seed of the random generator, so equal arguments return
+        equal rosters.
+        pictures (int): Number of pictures in the archive the roster refers
+        to, see ``synthetic_archive``. With 0 the roster has no
+        'profile_picture' column.
+
+    Returns:
+        pd.DataFrame: Teacher data.
+    """
+    rng = np.random.default_rng(seed)
+    first_names = np.array(FIRST_NAMES, dtype=object)[
+        rng.integers(len(FIRST_NAMES), size=rows)
+    ]
+    last_names = np.array(LAST_NAMES, dtype=object)[
+        rng.integers(len(LAST_NAMES), size=rows)
+    ]
+    weights = 1 / np.arange(1, len(SUBJECTS) + 1)
+    counts = rng.choice(
+        np.arange(1, len(SUBJECT_COUNTS) + 1), size=rows, p=SUBJECT_COUNTS
+    )
+    # Weighted sampling without replacement: the subjects with the largest
+    # random keys u ** (1 / weight) are taken
+    keys = rng.random((rows, len(SUBJECTS))) ** (1 / weights)
+    order = np.argsort(-keys, axis=1)[:, :len(SUBJECT_COUNTS)]
+    subjects = [
+        ', '.join(SUBJECTS[i] for i in chosen[:count])
+        for chosen, count in zip(order.tolist(), counts.tolist())
+    ]
+    phones = rng.integers(0, 1000, size=(rows, 2))
+
+    data = {
+        'first_name': first_names,
+        'last_name': last_names,
+        'email_address': [
+            f'{first}.{last}.{i}@school.example'.lower().replace("'", '')
+            for i, (first, last) in enumerate(zip(first_names, last_names))
+        ],
+        'phone_number': [f'+1-555-{a:03d}-{b:03d}' for a, b in phones],
+        'room_number': [str(room) for room in rng.integers(1, 400, rows)],
+        'subjects_taught': subjects,
+    }
+    if pictures:
+        data['profile_picture'] = [
+            picture_name(i) for i in rng.integers(pictures, size=rows)
+        ]
+    return pd.DataFrame(data)
+
+
+def picture_name(index):
+    return f'teacher-{index:06d}.jpg'
+
+
+def synthetic_archive(path, pictures, seed=0, size=(480, 480)):
+    """
+    Writes a ZIP archive with JPEG portraits accepted by ZipFileValidator.
+    Every picture has a random background and shapes, so pictures have
+    different content and compress like photos rather than like solid
+    colors.
+
+    Args:
+        path (str or file-like object): Destination of the archive.
+        pictures (int): Number of pictures.
+        seed (int): Seed of the random generator.
+        size (tuple): Width and height of every picture in pixels.
+
+    Returns:
+        list: Names of the pictures in the archive.
+    """
+    rng = random.Random(seed)
+    noise = Image.fromarray(np.random.default_rng(seed).normal(
+        128, 48, (size[1], size[0])
+    ).clip(0, 255).astype(np.uint8))
+    names = []
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_STORED) as archive:
+        for index in range(pictures):
+            color = tuple(rng.randrange(256) for _ in range(3))
+            image = Image.merge('RGB', [
+                noise.point(lambda value, offset=offset: value + offset - 128)
+                for offset in color
+            ])
+            draw = ImageDraw.Draw(image)
+            for _ in range(8):
+                x, y = rng.randrange(size[0]), rng.randrange(size[1])
+                radius = rng.randrange(20, size[0] // 3)
+                draw.ellipse(
+                    (x - radius, y - radius, x + radius, y + radius),
+                    fill=tuple(rng.randrange(256) for _ in range(3))
+                )
+            buffer = io.BytesIO()
+            image.save(buffer, 'JPEG', quality=85)
+            names.append(picture_name(index))
+            # A fixed timestamp keeps the archive byte-for-byte reproducible
+            archive.writestr(
+                zipfile.ZipInfo(names[-1], date_time=(1980, 1, 1, 0, 0, 0)),
+                buffer.getvalue()
+            )
+    return names
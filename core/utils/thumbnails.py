@@ -0,0 +1,169 @@
+import posixpath
+
+from io import BytesIO
+from PIL import Image, ImageOps, features
+from django.conf import settings
+from django.core.files.base import ContentFile
+
+THUMBNAILS_DIR = 'thumbnails'
+
+# Pillow format name, MIME type and save options of every derivative format
+FORMATS = {
+    'webp': ('WEBP', 'image/webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', 'image/jpeg', {'quality': 85, 'optimize': True,
+                                    'progressive': True}),
+}
+
+
+def get_variants():
+    """
+    Returns the thumbnail variants, mapping a variant name to the widths
+    generated for it. Derivatives are square crops of the original picture.
+
+    Returns:
+        dict: Widths in pixels of every variant, smallest first.
+    """
+    variants = getattr(settings, 'THUMBNAIL_VARIANTS', {
+        'card': [210, 420],
+        'profile': [320, 640],
+    })
+    return {name: sorted(widths) for name, widths in variants.items()}
+
+
+def get_formats():
+    """
+    Returns the thumbnail formats that are configured and supported by
+    Pillow, preferred format first.
+
+    Returns:
+        list: Format names, keys of FORMATS.
+    """
+    formats = getattr(settings, 'THUMBNAIL_FORMATS', ['webp', 'jpeg'])
+    return [
+        fmt for fmt in formats
+        if fmt in FORMATS and (fmt != 'webp' or features.check('webp'))
+    ]
+
+
+def get_widths():
+    """
+    Returns all thumbnail widths of all variants.
+
+    Returns:
+        list: Distinct widths in pixels.
+    """
+    return sorted({
+        width for widths in get_variants().values() for width in widths
+    })
+
+
+def thumbnail_name(name, width, fmt):
+    """
+    Returns the storage name of a derivative of a stored picture. The name
+    is derived from the name of the original, so no lookups are needed.
+
+    Args:
+        name (str): Storage name of the original picture.
+        width (int): Width of the derivative in pixels.
+        fmt (str): Format of the derivative, a key of FORMATS.
+
+    Returns:
+        str: Storage name, e.g. 'thumbnails/210/profile_pictures/ab/ab...webp'.
+    """
+    stem = posixpath.splitext(name)[0]
+    return posixpath.join(THUMBNAILS_DIR, str(width), f'{stem}.{fmt}')
+
+
+def thumbnail_names(name):
+    """
+    Returns the storage names of all derivatives of a stored picture.
+
+    Args:
+        name (str): Storage name of the original picture.
+
+    Returns:
+        list: Storage names of the derivatives.
+    """
+    return [
+        thumbnail_name(name, width, fmt)
+        for width in get_widths()
+        for fmt in get_formats()
+    ]
+
+
+def generate_thumbnails(storage, name, force=False):
+    """
+    Generates the missing derivatives of a stored picture. The original is
+    decoded once and downscaled for every width, starting with the largest.
+
+    Args:
+        storage (Storage): Storage of the profile picture field.
+        name (str): Storage name of the original picture.
+        force (bool): Regenerate derivatives that already exist.
+
+    Returns:
+        int: Number of derivatives written.
+    """
+    widths = get_widths()
+    formats = get_formats()
+    missing = [
+        (width, fmt) for width in widths for fmt in formats
+        if force or not storage.exists(thumbnail_name(name, width, fmt))
+    ]
+    if not missing:
+        return 0
+
+    with storage.open(name, 'rb') as original:
+        with Image.open(original) as image:
+            # Let the JPEG decoder downscale while decoding
+            image.draft('RGB', (widths[-1], widths[-1]))
+            image = ImageOps.exif_transpose(image).convert('RGB')
+
+    written = 0
+    for width in sorted({width for width, _ in missing}, reverse=True):
+        image = ImageOps.fit(image, (width, width), Image.LANCZOS)
+        for fmt in formats:
+            if (width, fmt) not in missing:
+                continue
+            pillow_format, _, options = FORMATS[fmt]
+            content = BytesIO()
+            image.save(content, pillow_format, **options)
+            derivative = thumbnail_name(name, width, fmt)
+            if storage.exists(derivative):
+                storage.delete(derivative)
+            storage.save(derivative, ContentFile(content.getvalue()))
+            written += 1
+    return written
+
+
+def picture_sources(storage, name, variant):
+    """
+    Returns the ``<source>`` definitions of a stored picture for a variant,
+    or an empty list if its derivatives have not been generated yet.
+
+    Args:
+        storage (Storage): Storage of the profile picture field.
+        name (str): Storage name of the original picture.
+        variant (str): Variant name, a key of THUMBNAIL_VARIANTS.
+
+    Returns:
+        list: Dicts with the 'type', 'srcset' and 'src' of every format.
+    """
+    widths = get_variants()[variant]
+    formats = get_formats()
+    if not formats or not storage.exists(
+            thumbnail_name(name, widths[0], formats[-1])):
+        return []
+
+    sources = []
+    for fmt in formats:
+        urls = [
+            (storage.url(thumbnail_name(name, width, fmt)), width)
+            for width in widths
+        ]
+        sources.append({
+            'type': FORMATS[fmt][1],
+            'srcset': ', '.join(f'{url} {width}w' for url, width in urls),
+            'src': urls[0][0],
+        })
+    return sources
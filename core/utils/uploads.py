@@ -0,0 +1,343 @@
+import base64
+import binascii
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import threading
+
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from core.models import ChunkedUpload
+
+# Bytes read from the request at a time while a chunk is spooled
+READ_SIZE = 1024 * 1024
+CONTENT_RANGE_PATTERN = re.compile(r'bytes (\d+)-(\d+)/(\d+)')
+CONTENT_DIGEST_PATTERN = re.compile(r'(?:^|,)\s*sha-256=:([^:]*):')
+
+# Running SHA-256 of the uploads this process received chunks for, keyed by
+# upload id, as (offset, hasher) pairs. Uploads whose chunks were received by
+# several processes are hashed again once they are complete.
+_hashers = {}
+_hashers_lock = threading.Lock()
+
+
+class UploadError(Exception):
+    """
+    Rejected chunk or upload.
+
+    Attributes:
+        status (int): HTTP status code of the response.
+        upload (ChunkedUpload): The upload, for the offset to resume from.
+    """
+
+    def __init__(self, message, status=400, upload=None):
+        super().__init__(message)
+        self.status = status
+        self.upload = upload
+
+
+def get_upload_directory(upload_id):
+    """
+    Returns the spool directory that holds the chunks of an upload and,
+    once it is complete, the assembled file.
+
+    Args:
+        upload_id (int): Chunked upload id.
+
+    Returns:
+        str: Path of the upload directory.
+    """
+    return os.path.join(settings.UPLOADS_DIR, str(upload_id))
+
+
+def get_upload_path(upload):
+    """ Returns the path of the assembled file of an upload. """
+    return os.path.join(get_upload_directory(upload.pk), 'file')
+
+
+def get_part_path(upload, offset):
+    # Zero-padded offsets sort in the order the parts are assembled
+    return os.path.join(
+        get_upload_directory(upload.pk), f'{offset:016d}.part'
+    )
+
+
+def create_upload(user, filename, size, sha256=''):
+    """
+    Starts a chunked upload.
+
+    Args:
+        user (User): Uploading user.
+        filename (str): Name of the uploaded file.
+        size (int): Size of the file in bytes.
+        sha256 (str): Hex digest the assembled file must have, or ''.
+
+    Returns:
+        ChunkedUpload: The upload, at offset 0.
+    """
+    max_size = getattr(settings, 'UPLOAD_MAX_SIZE', 4 * 1024 ** 3)
+    if size < 1 or size > max_size:
+        raise UploadError(f'The file size must be between 1 and {max_size} '
+                          f'bytes.', status=413 if size > 0 else 400)
+    sha256 = sha256.lower()
+    if sha256 and (len(sha256) != 64 or
+                   not all(c in '0123456789abcdef' for c in sha256)):
+        raise UploadError('The SHA-256 digest must be 64 hex digits.')
+
+    upload = ChunkedUpload.objects.create(
+        user=user, filename=os.path.basename(filename)[:255], size=size,
+        expected_sha256=sha256
+    )
+    os.makedirs(get_upload_directory(upload.pk), exist_ok=True)
+    return upload
+
+
+def write_chunk(upload, offset, stream, length, digest=None):
+    """
+    Appends a chunk to an upload. The chunk is spooled to a temporary file
+    in the upload directory while it is hashed, and becomes a part of the
+    upload only if the upload is still at ``offset`` when it was received
+    completely, so a retried or duplicated chunk cannot be appended twice.
+    The running SHA-256 of the upload is updated with the chunk, and the
+    upload is assembled once its last chunk arrived.
+
+    Args:
+        upload (ChunkedUpload): Upload being written.
+        offset (int): Position of the chunk in the file.
+        stream (file-like object): Request body with the chunk.
+        length (int): Size of the chunk in bytes.
+        digest (bytes): SHA-256 digest the chunk must have, or None.
+
+    Returns:
+        ChunkedUpload: The upload after the chunk was appended.
+
+    Raises:
+        UploadError: If the upload is not at ``offset`` (409), the chunk is
+        too large or truncated, or its digest does not match.
+    """
+    max_chunk_size = getattr(
+        settings, 'UPLOAD_MAX_CHUNK_SIZE', 64 * 1024 ** 2
+    )
+    if upload.status != ChunkedUpload.UPLOADING:
+        raise UploadError('The upload is not in progress.', 409, upload)
+    if offset != upload.offset:
+        raise UploadError(f'The upload is at offset {upload.offset}.', 409,
+                          upload)
+    if length < 1 or length > max_chunk_size:
+        raise UploadError(f'Chunks must be between 1 and {max_chunk_size} '
+                          f'bytes.', 413 if length > 0 else 400, upload)
+    if offset + length > upload.size:
+        raise UploadError('The chunk ends after the end of the file.', 400,
+                          upload)
+
+    with _hashers_lock:
+        running = _hashers.get(upload.pk)
+    if running and running[0] == offset:
+        file_hasher = running[1].copy()
+    else:
+        file_hasher = hashlib.sha256() if offset == 0 else None
+    chunk_hasher = hashlib.sha256()
+
+    directory = get_upload_directory(upload.pk)
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as temp:
+            remaining = length
+            while remaining:
+                data = stream.read(min(READ_SIZE, remaining))
+                if not data:
+                    raise UploadError('The chunk is shorter than its '
+                                      'Content-Range.', 400, upload)
+                remaining -= len(data)
+                temp.write(data)
+                chunk_hasher.update(data)
+                if file_hasher:
+                    file_hasher.update(data)
+            temp.flush()
+            os.fsync(temp.fileno())
+        if digest is not None and chunk_hasher.digest() != digest:
+            raise UploadError('The chunk does not match its digest.', 400,
+                              upload)
+
+        with transaction.atomic():
+            # Only the request that moves the offset appends its part. A
+            # part left behind by a request that failed to commit is
+            # replaced by the retry.
+            appended = ChunkedUpload.objects.filter(
+                pk=upload.pk, offset=offset, status=ChunkedUpload.UPLOADING
+            ).update(offset=offset + length, updated_at=timezone.now())
+            if not appended:
+                upload.refresh_from_db()
+                raise UploadError(
+                    f'The upload is at offset {upload.offset}.', 409, upload
+                )
+            os.replace(temp_path, get_part_path(upload, offset))
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+    upload.offset = offset + length
+    with _hashers_lock:
+        if file_hasher:
+            _hashers[upload.pk] = (upload.offset, file_hasher)
+        else:
+            _hashers.pop(upload.pk, None)
+    if upload.offset == upload.size:
+        complete_upload(upload)
+    return upload
+
+
+def complete_upload(upload):
+    """
+    Assembles the parts of an upload into a single file and checks its
+    digest. The parts are appended with copy_file_range, which lets the
+    kernel copy (or on copy-on-write filesystems share) the data without
+    passing it through user space, falling back to sendfile and to a
+    buffered copy.
+
+    Args:
+        upload (ChunkedUpload): Upload whose last chunk was received.
+    """
+    directory = get_upload_directory(upload.pk)
+    parts = sorted(
+        name for name in os.listdir(directory) if name.endswith('.part')
+    )
+    path = get_upload_path(upload)
+    with open(path, 'wb') as destination:
+        for name in parts:
+            with open(os.path.join(directory, name), 'rb') as source:
+                append_file(
+                    source, destination, os.fstat(source.fileno()).st_size
+                )
+        destination.flush()
+        os.fsync(destination.fileno())
+    for name in parts:
+        os.remove(os.path.join(directory, name))
+
+    with _hashers_lock:
+        running = _hashers.pop(upload.pk, None)
+    if running and running[0] == upload.size:
+        upload.sha256 = running[1].hexdigest()
+    else:
+        upload.sha256 = file_sha256(path)
+
+    if os.path.getsize(path) != upload.size or (
+            upload.expected_sha256 and
+            upload.sha256 != upload.expected_sha256):
+        upload.status = ChunkedUpload.FAILED
+        os.remove(path)
+    else:
+        upload.status = ChunkedUpload.COMPLETE
+    upload.save(update_fields=['sha256', 'status', 'updated_at'])
+
+
+def append_file(source, destination, count):
+    """
+    Appends ``count`` bytes of a file to another file without copying them
+    through user space where the platform allows it.
+
+    Args:
+        source (file): Binary file positioned at the start.
+        destination (file): Binary file positioned at the end.
+        count (int): Number of bytes to append.
+    """
+    src, dst = source.fileno(), destination.fileno()
+    copies = []
+    if hasattr(os, 'copy_file_range'):
+        copies.append(lambda size: os.copy_file_range(src, dst, size))
+    if hasattr(os, 'sendfile'):
+        copies.append(lambda size: os.sendfile(dst, src, None, size))
+    for copy in copies:
+        try:
+            while count:
+                copied = copy(count)
+                if not copied:
+                    break
+                count -= copied
+        except OSError:
+            # Not supported for these files, e.g. across filesystems on old
+            # kernels; continue from where the copy stopped
+            continue
+        if not count:
+            return
+    source.seek(os.lseek(src, 0, os.SEEK_CUR))
+    destination.seek(os.lseek(dst, 0, os.SEEK_CUR))
+    shutil.copyfileobj(source, destination)
+
+
+def file_sha256(path):
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for data in iter(lambda: f.read(READ_SIZE), b''):
+            hasher.update(data)
+    return hasher.hexdigest()
+
+
+def delete_upload(upload):
+    """ Deletes an upload and its spool directory. """
+    with _hashers_lock:
+        _hashers.pop(upload.pk, None)
+    shutil.rmtree(get_upload_directory(upload.pk), ignore_errors=True)
+    upload.delete()
+
+
+def delete_expired_uploads():
+    """
+    Deletes the uploads that were not written to for UPLOAD_EXPIRY seconds,
+    whether they were abandoned before they were complete or never imported.
+
+    Returns:
+        int: Number of deleted uploads.
+    """
+    expiry = getattr(settings, 'UPLOAD_EXPIRY', 24 * 60 * 60)
+    expired = ChunkedUpload.objects.filter(
+        updated_at__lt=timezone.now() - timedelta(seconds=expiry)
+    )
+    count = 0
+    for upload in expired:
+        delete_upload(upload)
+        count += 1
+    return count
+
+
+def parse_content_range(header):
+    """
+    Parses a Content-Range header of a chunk, e.g. 'bytes 0-8388607/20000000'.
+
+    Args:
+        header (str): Header value.
+
+    Returns:
+        tuple: Offset of the first byte, number of bytes and size of the
+        file.
+
+    Raises:
+        UploadError: If the header is missing or malformed.
+    """
+    match = CONTENT_RANGE_PATTERN.fullmatch(header or '')
+    if not match:
+        raise UploadError('Chunks need a Content-Range header like '
+                          '"bytes 0-1023/4096".')
+    first, last, size = (int(value) for value in match.groups())
+    if last < first or last >= size:
+        raise UploadError('The Content-Range is not satisfiable.', 416)
+    return first, last - first + 1, size
+
+
+def parse_content_digest(header):
+    """
+    Returns the SHA-256 digest of a Content-Digest header (RFC 9530), e.g.
+    'sha-256=:X48E9qOokqqrvdts8nOJRJN3OWDUoyWxBf7kbu9DBPE=:', or None if the
+    header has no SHA-256 digest.
+    """
+    match = CONTENT_DIGEST_PATTERN.search(header or '')
+    if not match:
+        return None
+    try:
+        return base64.b64decode(match.group(1), validate=True)
+    except binascii.Error:
+        raise UploadError('The Content-Digest is not valid base64.')
@@ -2,8 +2,10 @@ import re
 import pandas as pd
 import numpy as np
 
+from django.conf import settings
 from django.forms import ValidationError
-from pandas.errors import ParserError
+from pandas.errors import EmptyDataError, ParserError
+from core.utils.dataset import TeacherDataset
 
 
 class CSVFileValidator():
@@ -23,6 +25,10 @@ class CSVFileValidator():
         addresses.
         PHONE_NUMBER_PATTERN (re.Pattern): Regular expression pattern for valid
         phone numbers.
+        ERROR_ORDER (dict): Rule and position of every error message. Errors
+        are reported rule by rule, by row within a rule, like a single pass
+        over the whole file would report them.
+        chunk_size (int): Number of rows read and validated at a time.
 
     Raises:
         ValidationError: If the CSV file does not meet the requirements.
@@ -34,14 +40,80 @@ class CSVFileValidator():
     }
     EMAIL_PATTERN = re.compile(r"[^@]+@[^@]+\.[^@]+")
     PHONE_NUMBER_PATTERN = re.compile(r'\+\d{1,3}-\d{3}-\d{3}-\d{3}')
+    ERROR_ORDER = {
+        "Field is empty": (0, 0),
+        "Invalid email address": (1, 0),
+        "Duplicate email address": (1, 1),
+        "Invalid phone number": (2, 0),
+        "More than 5 subjects": (3, 0),
+    }
+
+    def __init__(self, chunk_size=None):
+        self.chunk_size = chunk_size or getattr(
+            settings, 'IMPORT_CHUNK_SIZE', 10000
+        )
 
     def __call__(self, file):
+        """
+        Validates the CSV file in chunks of ``chunk_size`` rows as it is read,
+        so the file is parsed only once and memory usage does not depend on
+        its size. The valid rows are collected in a TeacherDataset that is
+        attached to the file as ``teachers_dataset`` for the importer. Email
+        uniqueness is checked across the whole file with hashes of the email
+        addresses, and rows with duplicate email addresses are excluded from
+        the dataset once the whole file was read.
+        """
+        dataset = TeacherDataset()
+        errors = []  # List of errors
+        email_indexes, email_hashes = [], []
         try:
-            df = pd.read_csv(file)
+            file.seek(0)
+            reader = pd.read_csv(file, dtype=str, chunksize=self.chunk_size)
+            for df in reader:
+                errors.extend(self.validate_chunk(df, dataset))
+                emails = df['email_address'].dropna()
+                email_indexes.append(emails.index.to_numpy())
+                email_hashes.append(self.hash_emails(emails))
         except (FileNotFoundError, IOError) as e:
+            dataset.close()
             raise ValidationError(f"Error opening the CSV file: {e}")
-        except ParserError as e:
+        except (ParserError, EmptyDataError) as e:
+            dataset.close()
             raise ValidationError(e)
+        except ValidationError:
+            dataset.close()
+            raise
+
+        # Check for unique email addresses across all chunks
+        if email_hashes:
+            errors.extend(self.check_email_uniqueness(
+                np.concatenate(email_indexes),
+                np.concatenate(email_hashes),
+                dataset
+            ))
+        errors.sort(key=self.error_order)
+        file.teachers_dataset = dataset
+
+        # If there are any errors, raise a ValueError with a detailed message
+        if errors:
+            error_messages = [f"Row {index}, Column '{col}': {msg}"
+                              for index, col, msg in errors]
+            raise ValidationError(error_messages)
+
+    def validate_chunk(self, df, dataset):
+        """
+        Validates a chunk of the CSV file and adds its valid rows to the
+        dataset. Email uniqueness is checked by the caller.
+
+        Args:
+            df (pd.DataFrame): Chunk of the CSV file. Its columns and blank
+            values are normalized in place.
+            dataset (TeacherDataset): Dataset collecting the valid rows.
+
+        Returns:
+            list: List of tuples containing the row index, column name, and
+            error message.
+        """
         # Convert column names to lower case and join words with an underscore
         df.columns = df.columns.str.lower().str.replace(' ', '_')
 
@@ -50,10 +122,10 @@ class CSVFileValidator():
             raise ValidationError('CSV file is missing required columns.')
 
         # Replace all empty strings and strings consisting only of ws with NaN
-        df = df.replace(r'^\s*$', np.nan, regex=True)
+        df.mask(df.apply(self.is_blank), inplace=True)
 
         # Remove rows where all variables are NaN
-        df = df.dropna(how='all')
+        df.dropna(how='all', inplace=True)
 
         errors = []  # List of errors
 
@@ -61,8 +133,8 @@ class CSVFileValidator():
         required_fields = self.REQUIRED_COLUMNS - {'profile_picture'}
         errors.extend(self.check_empty_fields(df, required_fields))
 
-        # Check for unique and valid email addresses
-        errors.extend(self.check_email_format_and_uniqueness(df))
+        # Check for valid email addresses
+        errors.extend(self.check_email_format(df))
 
         # Check for valid phone number format
         errors.extend(self.check_phone_number_format(df))
@@ -71,14 +143,77 @@ class CSVFileValidator():
         errors.extend(self.check_subjects_taught(df))
 
         error_indexes = set([index for index, _, _ in errors])
-        df.drop(error_indexes, inplace=True)
-        df.to_csv("data_temp.csv", index=False)
+        valid = df.drop(list(error_indexes))
+        dataset.append(valid, self.hash_emails(valid['email_address']))
+        return errors
 
-        # If there are any errors, raise a ValueError with a detailed message
-        if errors:
-            error_messages = [f"Row {index}, Column '{col}': {msg}"
-                              for index, col, msg in errors]
-            raise ValidationError(error_messages)
+    @classmethod
+    def error_order(cls, error):
+        """
+        Returns the sort key of an error tuple, see ERROR_ORDER. The errors
+        of every chunk are merged into the order of a single pass over the
+        whole file.
+        """
+        index, _, message = error
+        rule, position = cls.ERROR_ORDER[message]
+        return rule, index, position
+
+    @staticmethod
+    def find_duplicates(hashes):
+        """
+        Finds the hashes that occur more than once.
+
+        Args:
+            hashes (np.ndarray): Hashes of email addresses.
+
+        Returns:
+            np.ndarray: Hashes of duplicate email addresses.
+        """
+        unique, counts = np.unique(hashes, return_counts=True)
+        return unique[counts > 1]
+
+    @staticmethod
+    def is_blank(column):
+        """
+        Finds empty strings, strings consisting only of whitespace and
+        missing values in a column.
+
+        Args:
+            column (pd.Series): Column of strings.
+
+        Returns:
+            pd.Series: True for every blank value.
+        """
+        return column.isna() | column.str.isspace().fillna(False).astype(bool)
+
+    @staticmethod
+    def hash_emails(emails):
+        """
+        Hashes email addresses for the uniqueness check.
+
+        Args:
+            emails (pd.Series): Email addresses.
+
+        Returns:
+            np.ndarray: 64-bit hash of every email address.
+        """
+        return pd.util.hash_pandas_object(emails, index=False).to_numpy()
+
+    @staticmethod
+    def collect_errors(mask, col, message):
+        """
+        Turns a boolean mask of invalid rows into error tuples.
+
+        Args:
+            mask (pd.Series): True for every invalid row.
+            col (str): Column name.
+            message (str): Error message.
+
+        Returns:
+            list: List of tuples containing the row index, column name, and
+            error message.
+        """
+        return [(index, col, message) for index in mask.index[mask]]
 
     @staticmethod
     def check_empty_fields(df, required_fields):
@@ -93,17 +228,14 @@ class CSVFileValidator():
             list: List of tuples containing the row index, column name, and
             error message.
         """
-        errors = []
-        for index, row in df[list(required_fields)].isnull().iterrows():
-            for col, is_null in row.items():
-                if is_null:
-                    errors.append((index, col, "Field is empty"))
-        return errors
+        nulls = df[list(required_fields)].isnull().stack()
+        return [(index, col, "Field is empty")
+                for index, col in nulls.index[nulls.to_numpy()]]
 
     @staticmethod
-    def check_email_format_and_uniqueness(df):
+    def check_email_format(df):
         """
-        Checks for valid and unique email addresses.
+        Checks for valid email addresses.
 
         Args:
             df (pd.DataFrame): DataFrame containing the data.
@@ -112,17 +244,32 @@ class CSVFileValidator():
             list: List of tuples containing the row index, column name, and
             error message.
         """
-        errors = []
-        for index, email in df['email_address'].items():
-            if not bool(CSVFileValidator.EMAIL_PATTERN.match(email)):
-                errors.append(
-                    (index, 'email_address', "Invalid email address")
-                )
-            if not df['email_address'].is_unique:
-                errors.append(
-                    (index, 'email_address', "Duplicate email address")
-                )
-        return errors
+        emails = df['email_address'].dropna()
+        invalid = ~emails.str.match(CSVFileValidator.EMAIL_PATTERN)
+        return CSVFileValidator.collect_errors(
+            invalid, 'email_address', "Invalid email address"
+        )
+
+    @staticmethod
+    def check_email_uniqueness(indexes, hashes, dataset=None):
+        """
+        Checks for unique email addresses and excludes the rows with
+        duplicate email addresses from the dataset.
+
+        Args:
+            indexes (np.ndarray): Row index of every email address.
+            hashes (np.ndarray): Hash of every email address.
+            dataset (TeacherDataset): Dataset of valid rows, or None.
+
+        Returns:
+            list: List of tuples containing the row index, column name, and
+            error message.
+        """
+        duplicates = CSVFileValidator.find_duplicates(hashes)
+        if dataset is not None:
+            dataset.exclude_emails(duplicates)
+        return [(index, 'email_address', "Duplicate email address")
+                for index in indexes[np.isin(hashes, duplicates)]]
 
     @staticmethod
     def check_phone_number_format(df):
@@ -136,12 +283,13 @@ class CSVFileValidator():
             list: List of tuples containing the row index, column name, and
             error message.
         """
-        errors = []
-        for index, phone_number in df['phone_number'].items():
-            match = CSVFileValidator.PHONE_NUMBER_PATTERN.match(phone_number)
-            if not bool(match):
-                errors.append((index, 'phone_number', "Invalid phone number"))
-        return errors
+        phone_numbers = df['phone_number'].dropna()
+        invalid = ~phone_numbers.str.match(
+            CSVFileValidator.PHONE_NUMBER_PATTERN
+        )
+        return CSVFileValidator.collect_errors(
+            invalid, 'phone_number', "Invalid phone number"
+        )
 
     @staticmethod
     def check_subjects_taught(df):
@@ -155,11 +303,8 @@ class CSVFileValidator():
             list: List of tuples containing the row index, column name, and
             error message.
         """
-        errors = []
-        for index, subjects in df['subjects_taught'].items():
-            if not pd.isna(subjects):
-                if len(subjects.split(',')) > 5:
-                    errors.append(
-                        (index, 'subjects_taught', "More than 5 subjects")
-                    )
-        return errors
+        subjects = df['subjects_taught'].dropna()
+        too_many = subjects.str.count(',') >= 5
+        return CSVFileValidator.collect_errors(
+            too_many, 'subjects_taught', "More than 5 subjects"
+        )
@@ -1,6 +1,9 @@
 import zipfile
 import io
+
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
+from django.conf import settings
 from django.core.exceptions import ValidationError
 
 
@@ -8,28 +11,133 @@ class ZipFileValidator():
     """
     Validator for ZIP files containing profile images.
 
-    This class checks if the ZIP file exists, is not empty, and if all files
-    in it are valid images that can be opened with PIL.Image.
+    This class checks if the ZIP file can be read, is not empty, and if all
+    files in it are valid images that can be opened with PIL.Image. Only the
+    central directory and a bounded header of every member are read, and
+    PIL.Image parses the header lazily without decoding pixels, so validation
+    time and memory depend on the number of members rather than the size of
+    the archive. The uncompressed size of every member, the total
+    uncompressed size and the compression ratio of every member are limited
+    to reject zip bombs, and images whose header declares more pixels than
+    PIL.Image accepts are rejected as decompression bombs.
+
+    Validation is header-only: a member with a valid header but a truncated
+    or corrupt body passes, and is only found to be undecodable when the
+    importer generates its thumbnails. The importer skips such pictures and
+    reports the rows that referred to them instead of failing the import.
+
+    Attributes:
+        IMAGE_SIGNATURES (tuple): Magic bytes of the accepted image formats.
+        HEADER_SIZE (int): Number of bytes read from every member.
+        max_member_size (int): Maximum uncompressed size of a member.
+        max_total_size (int): Maximum uncompressed size of all members.
+        max_compression_ratio (int): Maximum ratio of the uncompressed to the
+        compressed size of a member.
+        workers (int): Number of threads verifying members.
     """
 
+    IMAGE_SIGNATURES = (
+        b'\xff\xd8\xff',       # JPEG
+        b'\x89PNG\r\n\x1a\n',  # PNG
+        b'GIF87a', b'GIF89a',  # GIF
+        b'RIFF',               # WebP
+        b'BM',                 # BMP
+    )
+    HEADER_SIZE = 128 * 1024
+
+    def __init__(self, max_member_size=None, max_total_size=None,
+                 max_compression_ratio=None, workers=None):
+        self.max_member_size = max_member_size or getattr(
+            settings, 'ZIP_MAX_MEMBER_SIZE', 20 * 1024 ** 2
+        )
+        self.max_total_size = max_total_size or getattr(
+            settings, 'ZIP_MAX_TOTAL_SIZE', 4 * 1024 ** 3
+        )
+        self.max_compression_ratio = max_compression_ratio or getattr(
+            settings, 'ZIP_MAX_COMPRESSION_RATIO', 100
+        )
+        self.workers = workers or getattr(
+            settings, 'ZIP_VALIDATION_WORKERS', 1
+        )
+
     def __call__(self, file):
         try:
             with zipfile.ZipFile(file) as f:
-                file_names = f.namelist()
-                if not file_names:
+                members = [info for info in f.infolist() if not info.is_dir()]
+                if not members:
                     raise ValidationError('ZIP file is empty')
+
+                total_size = sum(info.file_size for info in members)
+                if total_size > self.max_total_size:
+                    raise ValidationError(
+                        f'ZIP file is too large when extracted '
+                        f'({total_size} bytes)'
+                    )
+
                 # check for valid image files
                 errors = []
-                for file_name in file_names:
-                    with f.open(file_name) as image_file:
-                        try:
-                            with Image.open(io.BytesIO(image_file.read())):
-                                pass
-                        except (OSError, IOError):
-                            errors.append((file_name, 'Invalid image file'))
+                if self.workers > 1:
+                    with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                        results = pool.map(
+                            lambda info: self.check_member(f, info), members
+                        )
+                        errors = [error for error in results if error]
+                else:
+                    for info in members:
+                        error = self.check_member(f, info)
+                        if error:
+                            errors.append(error)
+
                 if errors:
                     error_messages = [f"File '{name}': {msg}"
                                       for name, msg in errors]
                     raise ValidationError(error_messages)
-        except (zipfile.BadZipFile, IOError, OSError) as e:
-            pass
+        except zipfile.BadZipFile as e:
+            raise ValidationError(f'Invalid ZIP file: {e}')
+        except (IOError, OSError) as e:
+            raise ValidationError(f'Error opening the ZIP file: {e}')
+
+    def check_member(self, f, info):
+        """
+        Checks the size, compression ratio and image header of a member.
+        The image data after the header is not decoded.
+
+        Args:
+            f (ZipFile): Open ZIP file.
+            info (ZipInfo): Member of the ZIP file.
+
+        Returns:
+            tuple: The member name and an error message, or None if the
+            member is valid.
+        """
+        if info.file_size > self.max_member_size:
+            return (info.filename, 'Image file is too large')
+        ratio = info.file_size / max(info.compress_size, 1)
+        if ratio > self.max_compression_ratio:
+            return (info.filename, 'Suspicious compression ratio')
+
+        try:
+            with f.open(info) as image_file:
+                header = image_file.read(self.HEADER_SIZE)
+                if not header.startswith(self.IMAGE_SIGNATURES):
+                    return (info.filename, 'Invalid image file')
+                try:
+                    with Image.open(io.BytesIO(header)):
+                        pass
+                except OSError:
+                    if len(header) == info.file_size:
+                        raise
+                    # The header is larger than HEADER_SIZE, e.g. because of
+                    # large metadata, so let PIL read from the stream instead
+                    image_file.seek(0)
+                    with Image.open(image_file):
+                        pass
+        except Image.DecompressionBombError:
+            # A small file declaring a huge image, raised from the header
+            return (info.filename, 'Image dimensions are too large')
+        except (zipfile.BadZipFile, OSError, IOError):
+            return (info.filename, 'Invalid image file')
+        except (RuntimeError, NotImplementedError):
+            # Encrypted members or unsupported compression methods
+            return (info.filename, 'Unsupported compression or encryption')
+        return None
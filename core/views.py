@@ -1,18 +1,39 @@
-import os
-import pandas as pd
+import hashlib
 
-from functools import reduce
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse
+from django.http import StreamingHttpResponse
+from django.templatetags.static import static as static_url
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils import timezone
+from django.utils.http import http_date, quote_etag
+from django.shortcuts import get_object_or_404
 from django.views.generic import TemplateView, ListView, DetailView
-from django.views.generic import CreateView, RedirectView
+from django.views.generic import CreateView, RedirectView, View
 from django.views.generic.edit import FormView
 from django.contrib.auth.views import LoginView
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.urls import reverse_lazy
-from django.db.models import Q
-from core.utils.importer import import_teachers_from_csv
-from core.utils.importer import import_teachers_from_csv_and_zip
-from .models import Teacher
-from .forms import RegisterForm, TeachersImportForm
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.urls import reverse, reverse_lazy
+from core.utils.jobs import create_import_job, get_import_job_status
+from core.utils.directory_cache import directory_cache_key
+from core.utils.directory_cache import get_directory_cache, normalize_query
+from core.utils.export import EXPORT_FORMATS, export_teachers, spool_export
+from core.utils.generation import aget_generation
+from core.utils.metrics import render_metrics
+from core.utils.pagination import apaginate_by_cursor
+from core.utils.search import search_teachers
+from core.utils.sendfile import is_content_addressed, serve_file
+from core.utils.thumbnails import picture_sources
+from core.utils.uploads import UploadError, create_upload, delete_upload
+from core.utils.uploads import delete_expired_uploads, get_upload_path
+from core.utils.uploads import parse_content_digest, parse_content_range
+from core.utils.uploads import write_chunk
+from .models import ChunkedUpload, ImportJob, Teacher
+from .forms import RegisterForm, TeachersImportForm, UploadedImportForm
 
 
 class IndexView(RedirectView):
@@ -31,11 +52,55 @@ class CustomRegisterView(CreateView):
     success_url = reverse_lazy('login')
 
 
+def conditional_response(request, etag, last_modified=None):
+    """
+    Returns a 304 Not Modified, or 412 Precondition Failed, response if the
+    conditional headers of the request match the validators, like the
+    ``condition`` decorator, which does not support async views.
+
+    Args:
+        request (HttpRequest): Current request.
+        etag (str): Unquoted strong ETag of the current representation.
+        last_modified (datetime): Modification time, or None.
+
+    Returns:
+        HttpResponse: The conditional response, or None if the view has to
+        respond normally.
+    """
+    return get_conditional_response(
+        request,
+        etag=quote_etag(etag),
+        last_modified=int(last_modified.timestamp()) if last_modified else None
+    )
+
+
+def set_validators(response, etag, last_modified=None):
+    """
+    Adds the ETag and Last-Modified headers to a response and makes caches
+    revalidate it on every use.
+
+    Returns:
+        HttpResponse: The response.
+    """
+    response['ETag'] = quote_etag(etag)
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
 class TeachersDirectoryListView(ListView):
     """
     Renders a list of teachers based on the search query if provided,
     otherwise all teachers. The rendered list is paginated, displaying
-    8 results per page.
+    8 results per page. With DIRECTORY_PAGINATION set to 'cursor', pages
+    are selected by opaque cursors instead of page numbers, so deep pages
+    cost as much as the first one. Rendered pages are cached per data
+    generation, query and page.
+
+    The view is async: cached pages are served on the event loop, the page
+    is loaded through the async ORM and only rendering, which may count the
+    results, runs in a worker thread.
 
     Returns:
         HttpResponse: A response containing the rendered HTML page.
@@ -44,110 +109,567 @@ class TeachersDirectoryListView(ListView):
     template_name = 'teachers_directory_list.html'
     context_object_name = 'teachers'
     paginate_by = 8
+    cache_kind = 'list'
+
+    async def get(self, request, *args, **kwargs):
+        self.generation = await aget_generation()
+        response = self.not_modified()
+        if response is not None:
+            return response
+
+        cache = get_directory_cache()
+        key = directory_cache_key(
+            self.cache_kind,
+            self.use_cursor_pagination(),
+            self.cached_query(),
+            request.GET.get('page', ''),
+            request.GET.get('cursor', ''),
+            generation=self.generation
+        )
+        cached = await cache.aget(key)
+        if cached is not None:
+            content, content_type = cached
+            return self.finalize_response(
+                HttpResponse(content, content_type=content_type)
+            )
+
+        self.object_list = await sync_to_async(self.get_queryset)()
+        if self.use_cursor_pagination():
+            self.page = await apaginate_by_cursor(
+                self.object_list,
+                request.GET.get('cursor'),
+                self.paginate_by,
+                request.GET.get('query', '')
+            )
+            context = self.get_context_data()
+        else:
+            context = await sync_to_async(self.get_context_data)()
+
+        response = self.render_to_response(context)
+        if hasattr(response, 'render'):
+            await sync_to_async(response.render)()
+        if response.status_code == 200:
+            await cache.aset(key, (response.content, response['Content-Type']))
+        return self.finalize_response(response)
+
+    def cached_query(self):
+        # The query is rendered into the pagination links of the fragment,
+        # so it is cached per exact query
+        return self.request.GET.get('query', '')
+
+    def not_modified(self):
+        return None
+
+    def finalize_response(self, response):
+        return response
 
     def get_queryset(self):
         queryset = super().get_queryset()
         query = self.request.GET.get('query')
 
         if query:
-            queries = query.split()
-            query_filters = [
-                Q(first_name__istartswith=query) |
-                Q(last_name__istartswith=query) |
-                Q(subjects_taught__name__istartswith=query)
-                for query in queries
-            ]
-            queryset = queryset.filter(
-                reduce(lambda a, b: a & b, query_filters)
-            ).distinct()
+            queryset = search_teachers(queryset, query)
 
         return queryset
 
+    def use_cursor_pagination(self):
+        return getattr(settings, 'DIRECTORY_PAGINATION', 'cursor') == 'cursor'
+
+    def paginate_queryset(self, queryset, page_size):
+        if not self.use_cursor_pagination():
+            return super().paginate_queryset(queryset, page_size)
+        page = self.page
+        return (None, page, page.object_list, page.has_other_pages())
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         query = self.request.GET.get('query')
         if query:
             context['query'] = query
         context['title'] = 'Teachers Directory'
+        context['cursor_pagination'] = context['paginator'] is None
         return context
 
 
+class TeachersDirectoryApiView(TeachersDirectoryListView):
+    """
+    Returns a page of the teachers directory as compact JSON records, for
+    the search-as-you-type UI. Pages are always selected by cursors.
+    Responses carry a strong ETag derived from the data generation, and
+    requests with a matching If-None-Match header are answered with 304 Not
+    Modified before the search runs.
+
+    Returns:
+        JsonResponse: The teachers of the page and the cursors of the next
+        and previous pages.
+    """
+    cache_kind = 'api'
+
+    def etag(self):
+        # Changes with the data generation and the request parameters only,
+        # so it is known without running the search
+        digest = hashlib.blake2b(
+            self.request.get_full_path().encode(), digest_size=8
+        ).hexdigest()
+        return f'{self.generation}-{digest}'
+
+    def cached_query(self):
+        # Pages do not contain the query, so equivalent queries share them
+        return normalize_query(self.request.GET.get('query'))
+
+    def not_modified(self):
+        response = conditional_response(self.request, self.etag())
+        return self.finalize_response(response) if response else None
+
+    def finalize_response(self, response):
+        return set_validators(response, self.etag())
+
+    def use_cursor_pagination(self):
+        return True
+
+    def render_to_response(self, context, **response_kwargs):
+        page = context['page_obj']
+        return JsonResponse({
+            'teachers': [self.teacher_card(teacher) for teacher in page],
+            'next': page.next_cursor,
+            'previous': page.previous_cursor,
+        })
+
+    @staticmethod
+    def teacher_card(teacher):
+        """
+        Returns the fields of a teacher shown on a directory card.
+
+        Args:
+            teacher (Teacher): Teacher to show.
+
+        Returns:
+            dict: Id, name, phone number, thumbnail URL and profile URL.
+        """
+        thumbnail = static_url('core/img/avatar.jpg')
+        if teacher.profile_picture:
+            sources = picture_sources(
+                teacher.profile_picture.storage,
+                teacher.profile_picture.name,
+                'card'
+            )
+            # The last format is the most widely supported one
+            thumbnail = (sources[-1]['src'] if sources
+                         else teacher.profile_picture.url)
+        return {
+            'id': teacher.pk,
+            'name': f'{teacher.first_name} {teacher.last_name}',
+            'phone': teacher.phone_number,
+            'thumbnail': thumbnail,
+            'url': reverse('teacher_profile', args=[teacher.pk]),
+        }
+
+
 class TeachersDirectoryView(TemplateView):
     """
     Renders the teachers directory page with pagination and search
-    functionality.
+    functionality. The view is async. The page itself queries nothing, and
+    the user shown in the page is loaded when the response is rendered,
+    which Django does in a worker thread.
 
     Returns:
         Rendered HTML template with the list of teachers and pagination.
     """
     template_name = 'teachers_directory.html'
 
+    async def get(self, request, *args, **kwargs):
+        return self.render_to_response(self.get_context_data(**kwargs))
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['title'] = 'Teachers Directory'
         context['current_page'] = self.request.GET.get('page', 1)
+        context['cursor'] = self.request.GET.get('cursor', '')
         return context
 
 
 class TeacherProfileView(DetailView):
     """
     Displays the teacher profile page with detailed information about the
-    teacher.
+    teacher. Responses carry the version of the teacher as ETag and its
+    modification time as Last-Modified, so revalidations of an unchanged
+    profile are answered with 304 Not Modified before the teacher is
+    loaded. Rendered profiles are cached per teacher version.
+
+    Every teacher starts at version 1, so the ETag and the cache key also
+    hold the modification time in microseconds: a teacher that gets the id
+    of a deleted teacher is not served the deleted teacher's profile.
+
+    The view is async and loads the teacher through the async ORM.
 
     Returns:
         HttpResponse: The HTTP response with the rendered teacher profile
         page.
     """
     model = Teacher
+    queryset = Teacher.objects.prefetch_related('subjects_taught')
     template_name = 'teacher_profile.html'
     context_object_name = 'teacher'
 
+    async def get(self, request, *args, **kwargs):
+        pk = kwargs['pk']
+        version = await Teacher.objects.filter(pk=pk).values_list(
+            'version', 'updated_at'
+        ).afirst()
+        if version is None:
+            raise Http404('No teacher found matching the query')
+        last_modified = version[1]
+        revision = f'{version[0]}-{int(last_modified.timestamp() * 1e6):x}'
+        etag = f'{pk}-{revision}'
+
+        response = conditional_response(request, etag, last_modified)
+        if response is not None:
+            return set_validators(response, etag, last_modified)
+
+        cache = get_directory_cache()
+        key = f'teacher-profile:{pk}:{revision}'
+        content = await cache.aget(key)
+        if content is not None:
+            return set_validators(HttpResponse(content), etag, last_modified)
+
+        try:
+            self.object = await self.get_queryset().aget(pk=pk)
+        except Teacher.DoesNotExist:
+            raise Http404('No teacher found matching the query')
+        response = self.render_to_response(
+            self.get_context_data(object=self.object)
+        )
+        await sync_to_async(response.render)()
+        await cache.aset(key, response.content)
+        return set_validators(response, etag, last_modified)
+
 
 class TeachersImportView(LoginRequiredMixin, FormView):
     """
     View for importing teachers from a CSV file and a zip file containing their
-    profile pictures.If the request method is POST and the form is valid, the
-    function will import the teachers data and redirect to the teachers
-    directory page. Otherwise, it will render the teachers import form. If the
-    form is valid and a CSV file is provided, it will be validated and the data
-    will be extracted from it. If a zip file is provided, it will be validated
-    and the profile pictures will be extracted from it and linked to the
-    corresponding teachers. If any errors occur during the validation or import
-    process, they will be displayed to the user.
+    profile pictures. The uploaded files are validated in the request, and the
+    rows that pass validation are imported by a background import job. If the
+    form is valid, the view redirects to the job page, which reports the
+    progress of the import. Otherwise, it renders the teachers import form with
+    the validation errors and a link to the job importing the valid rows.
 
     Returns:
         If the request method is POST and the form is valid, redirects to the
-        teachers directory page.
+        import job page.
         Otherwise, renders the teachers import form.
     """
     template_name = 'teachers_import.html'
     form_class = TeachersImportForm
-    success_url = reverse_lazy('teachers_directory')
 
     def form_valid(self, form):
         zip_file = form.cleaned_data['zip_file']
-
-        df_teachers = pd.read_csv("data_temp.csv")
-        if zip_file:
-            import_teachers_from_csv_and_zip(df_teachers, zip_file)
-        else:
-            import_teachers_from_csv(df_teachers)
-
-        if os.path.exists("data_temp.csv"):
-            os.remove("data_temp.csv")
+        self.job = self.create_import_job(form, zip_file)
         return super().form_valid(form)
 
     def form_invalid(self, form):
         zip_file_errors = form.errors.get('zip_file')
         zip_file = None if zip_file_errors else form.cleaned_data['zip_file']
+        job = self.create_import_job(
+            form, zip_file, form.errors.get('csv_file')
+        )
+        return self.render_to_response(
+            self.get_context_data(form=form, job=job)
+        )
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['upload_chunk_size'] = getattr(
+            settings, 'UPLOAD_CHUNK_SIZE', 8 * 1024 ** 2
+        )
+        return context
+
+    def get_success_url(self):
+        return reverse('import_job', args=[self.job.pk])
+
+    @staticmethod
+    def create_import_job(form, zip_file, errors=None):
+        """
+        Queues an import job for the rows that passed validation. The rows
+        are taken from the dataset CSVFileValidator attached to the uploaded
+        CSV file, so the file is not parsed again.
+
+        Args:
+            form (TeachersImportForm): Bound import form.
+            zip_file (UploadedFile): Zip file with profile pictures, or None.
+            errors (list): Validation errors of the CSV file.
+
+        Returns:
+            ImportJob: The queued job, or None if there is nothing to import.
+        """
+        csv_file = form.files.get('csv_file')
+        dataset = getattr(csv_file, 'teachers_dataset', None)
+        if dataset is None:
+            return None
+        mode = form.cleaned_data.get('mode', ImportJob.MERGE)
+        return create_import_job(dataset, zip_file, list(errors or []), mode)
+
+
+class ImportJobView(LoginRequiredMixin, DetailView):
+    """
+    Displays the progress of an import job.
+
+    Returns:
+        HttpResponse: The HTTP response with the rendered import job page.
+    """
+    model = ImportJob
+    template_name = 'teachers_import_job.html'
+    context_object_name = 'job'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['title'] = 'Import Data'
+        context['status'] = get_import_job_status(self.object)
+        return context
+
+
+class ImportJobStatusView(LoginRequiredMixin, DetailView):
+    """
+    Reports the progress of an import job for polling.
+
+    Returns:
+        JsonResponse: Rows and images processed, errors and throughput of the
+        job.
+    """
+    model = ImportJob
+
+    def render_to_response(self, context, **response_kwargs):
+        return JsonResponse(get_import_job_status(self.object))
+
+
+def upload_status(upload):
+    status = upload.as_status()
+    status['url'] = reverse('chunked_upload', args=[upload.pk])
+    return status
+
+
+def upload_error_response(error):
+    data = {'error': str(error)}
+    if error.upload is not None:
+        data.update(upload_status(error.upload))
+    return JsonResponse(data, status=error.status)
+
+
+class ChunkedUploadCreateView(LoginRequiredMixin, View):
+    """
+    Starts a chunked upload of an import file. The client sends the file
+    name, its size and optionally its SHA-256 hex digest, and then PUTs the
+    chunks to the returned URL.
+
+    Returns:
+        JsonResponse: Status of the new upload, with the URL of its chunks.
+    """
+
+    def post(self, request):
+        delete_expired_uploads()
+        try:
+            size = int(request.POST.get('size', ''))
+        except ValueError:
+            return JsonResponse({'error': 'The file size is missing.'},
+                                status=400)
+        try:
+            upload = create_upload(
+                request.user,
+                request.POST.get('filename', ''),
+                size,
+                request.POST.get('sha256', '')
+            )
+        except UploadError as e:
+            return upload_error_response(e)
+        status = upload_status(upload)
+        response = JsonResponse(status, status=201)
+        response.headers['Location'] = status['url']
+        return response
+
+
+class ChunkedUploadView(LoginRequiredMixin, View):
+    """
+    Receives the chunks of an upload in order. Every chunk is a PUT with a
+    Content-Range header and optionally a Content-Digest header with its
+    SHA-256 digest. A chunk that does not start at the offset of the upload
+    is rejected with 409 and the offset to resume from, which GET also
+    returns after an interrupted upload. DELETE aborts the upload.
+
+    Returns:
+        JsonResponse: Status of the upload.
+    """
+
+    def get_upload(self, pk):
+        return get_object_or_404(ChunkedUpload, pk=pk, user=self.request.user)
+
+    def get(self, request, pk):
+        response = JsonResponse(upload_status(self.get_upload(pk)))
+        patch_cache_control(response, no_store=True)
+        return response
+
+    def put(self, request, pk):
+        upload = self.get_upload(pk)
+        try:
+            offset, length, size = parse_content_range(
+                request.headers.get('Content-Range')
+            )
+            if size != upload.size:
+                raise UploadError(
+                    f'The file size is {upload.size} bytes.', 400, upload
+                )
+            if int(request.headers.get('Content-Length') or 0) != length:
+                raise UploadError(
+                    'The Content-Length does not match the Content-Range.',
+                    400, upload
+                )
+            digest = parse_content_digest(
+                request.headers.get('Content-Digest')
+            )
+            write_chunk(upload, offset, request, length, digest)
+        except UploadError as e:
+            return upload_error_response(e)
+        return JsonResponse(upload_status(upload))
+
+    def delete(self, request, pk):
+        delete_upload(self.get_upload(pk))
+        return HttpResponse(status=204)
+
+
+class ChunkedUploadImportView(LoginRequiredMixin, View):
+    """
+    Imports teachers from complete chunked uploads: a CSV file and
+    optionally a ZIP file of profile pictures. The assembled files are
+    validated where they are on disk, and like in TeachersImportView the
+    rows that pass validation are imported by a background import job. The
+    uploads are deleted once the job has its copy of the data.
 
-        df_teachers = pd.read_csv("data_temp.csv")
-        if zip_file:
-            import_teachers_from_csv_and_zip(df_teachers, zip_file)
+    Returns:
+        JsonResponse: Job id and URL, and the validation errors, with status
+        201 if a job was queued and 400 otherwise.
+    """
+
+    def post(self, request):
+        form = UploadedImportForm(request.user, request.POST)
+        valid = form.is_valid()
+        data = {
+            'errors': {
+                field: list(errors) for field, errors in form.errors.items()
+            }
+        }
+        if form.dataset is None:
+            return JsonResponse(data, status=400)
+
+        zip_upload = form.cleaned_data.get('zip_upload')
+        job = create_import_job(
+            form.dataset,
+            get_upload_path(zip_upload) if zip_upload else None,
+            data['errors'].get('csv_upload'),
+            form.cleaned_data.get('mode', ImportJob.MERGE)
+        )
+        for upload in (form.csv_upload, zip_upload):
+            if upload:
+                delete_upload(upload)
+
+        data.update(job=job.pk, url=reverse('import_job', args=[job.pk]))
+        return JsonResponse(data, status=201 if valid else 400)
+
+
+class TeachersExportView(LoginRequiredMixin, View):
+    """
+    Streams the whole directory as a CSV file in the layout of the import
+    file (?format=csv, the default) or as JSON lines (?format=jsonl).
+
+    Django 4.1 iterates streaming responses in the event loop under ASGI,
+    where the ORM cannot run, so ASGI requests get the export spooled to a
+    temporary file instead.
+
+    Returns:
+        StreamingHttpResponse or FileResponse: The export.
+    """
+
+    def get(self, request):
+        export_format = request.GET.get('format', 'csv')
+        if export_format not in EXPORT_FORMATS:
+            raise Http404(f'Unknown export format: {export_format}')
+        filename = f'teachers-{timezone.localdate():%Y-%m-%d}.{export_format}'
+        content = export_teachers(export_format)
+        if isinstance(request, ASGIRequest):
+            response = FileResponse(
+                spool_export(content),
+                as_attachment=True,
+                filename=filename,
+                content_type=EXPORT_FORMATS[export_format]
+            )
         else:
-            import_teachers_from_csv(df_teachers)
+            response = StreamingHttpResponse(
+                content, content_type=EXPORT_FORMATS[export_format]
+            )
+            response.headers['Content-Disposition'] = (
+                f'attachment; filename="{filename}"'
+            )
+        patch_cache_control(response, no_store=True)
+        return response
+
+
+class MediaFileView(View):
+    """
+    Serves uploaded media, i.e. profile pictures and their thumbnails.
+    Content-addressed files are cached by clients for STATIC_MAX_AGE
+    seconds, and with SENDFILE_BACKEND set the front proxy sends the bytes.
 
-        if os.path.exists("data_temp.csv"):
-            os.remove("data_temp.csv")
+    Returns:
+        HttpResponse: Response sending the file.
+    """
+
+    def get(self, request, path):
+        return serve_file(
+            request,
+            settings.MEDIA_ROOT,
+            path,
+            getattr(settings, 'SENDFILE_MEDIA_URL', '/protected/media/'),
+            immutable=is_content_addressed(path)
+        )
+
+
+class StaticAssetView(View):
+    """
+    Serves collected static files when DEBUG is off and no front proxy
+    serves STATIC_ROOT. Content-hashed names from the manifest are cached by
+    clients for STATIC_MAX_AGE seconds, and precompressed variants are sent
+    to clients accepting them.
+
+    Returns:
+        HttpResponse: Response sending the file.
+    """
+
+    def get(self, request, path):
+        is_hashed = getattr(staticfiles_storage, 'is_hashed', None)
+        return serve_file(
+            request,
+            settings.STATIC_ROOT,
+            path,
+            getattr(settings, 'SENDFILE_STATIC_URL', '/protected/static/'),
+            immutable=bool(is_hashed and is_hashed(path)),
+            precompressed=True
+        )
+
+
+class MetricsView(View):
+    """
+    Serves the request and import metrics of this process in the Prometheus
+    text format. Only installed when REQUEST_METRICS is True, and only
+    answered for clients in METRICS_ALLOWED_IPS.
+
+    Returns:
+        HttpResponse: Metrics exposition.
+    """
 
-        return super().form_invalid(form)
+    def get(self, request):
+        allowed = getattr(settings, 'METRICS_ALLOWED_IPS', ['127.0.0.1'])
+        if request.META.get('REMOTE_ADDR') not in allowed:
+            raise PermissionDenied
+        response = HttpResponse(
+            render_metrics(),
+            content_type='text/plain; version=0.0.4; charset=utf-8'
+        )
+        patch_cache_control(response, no_store=True)
+        return response
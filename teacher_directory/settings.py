@@ -42,6 +42,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -82,9 +83,53 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Keep connections open between requests, checking them first
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# PRAGMAs applied to every new SQLite connection. In WAL mode directory
+# reads continue while an import writes. busy_timeout is in milliseconds,
+# mmap_size in bytes and a negative cache_size in KiB. Set to {} to keep
+# the SQLite defaults.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'busy_timeout': 5000,
+    'mmap_size': 256 * 1024 ** 2,
+    'cache_size': -64 * 1024,
+    'temp_store': 'memory',
+}
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.1/topics/cache/
+
+# Directory pages are cached per data generation. The local-memory cache
+# evicts the least recently used entries beyond MAX_ENTRIES. Set
+# DIRECTORY_CACHE_DIR to share the cache between worker processes through
+# files instead.
+DIRECTORY_CACHE_DIR = None
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'directory': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'directory',
+        'TIMEOUT': 3600,
+        'OPTIONS': {
+            'MAX_ENTRIES': 5000,
+        },
+    },
+}
+if DIRECTORY_CACHE_DIR:
+    CACHES['directory'].update({
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': DIRECTORY_CACHE_DIR,
+    })
 
 
 
@@ -125,12 +170,92 @@ USE_TZ = True
 STATIC_URL = 'static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 STATICFILES_DIRS = []
+# collectstatic stores content-hashed copies with gzip (and brotli, if the
+# brotli package is installed) variants next to them
+STATICFILES_STORAGE = 'core.storage.CompressedManifestStaticFilesStorage'
+# Serve STATIC_ROOT from Django when DEBUG is off and no front proxy does
+SERVE_STATIC_FILES = True
+# Seconds clients cache content-hashed static files and content-addressed
+# media without revalidating
+STATIC_MAX_AGE = 365 * 24 * 3600
 
 
 # Static media
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 MEDIA_URL = '/media/'
 
+# Let the front proxy send media and static files: 'x-accel-redirect'
+# (nginx, with internal locations mapping the URLs below to MEDIA_ROOT and
+# STATIC_ROOT, and gzip_static/brotli_static for static files),
+# 'x-sendfile' (Apache mod_xsendfile, lighttpd) or None to stream them from
+# Django
+SENDFILE_BACKEND = None
+SENDFILE_MEDIA_URL = '/protected/media/'
+SENDFILE_STATIC_URL = '/protected/static/'
+
+
+# Teachers import
+IMPORT_BATCH_SIZE = 500
+IMPORT_CHUNK_SIZE = 10000
+# Threads streaming profile pictures from the archive to the storage
+IMPORT_IMAGE_WORKERS = 4
+# Delete stored profile pictures no teacher refers to after every import
+IMPORT_COLLECT_ORPHANED_PICTURES = True
+# Threads that run import jobs in the web process. Set to 0 and run
+# `manage.py import_worker` to run them in a separate process instead.
+IMPORT_JOB_THREADS = 1
+IMPORT_JOBS_DIR = os.path.join(BASE_DIR, 'import_jobs')
+# Validated uploads with more rows than this are spilled to a private
+# temporary directory (None: the system default) instead of kept in memory
+IMPORT_SPILL_ROWS = 50000
+IMPORT_SPILL_DIR = None
+# Seconds after which the lock of a replace import that stopped refreshing
+# it, e.g. because its process was killed, is taken over by the next one
+IMPORT_LOCK_TIMEOUT = 10 * 60
+# Teachers read per query by the export, along with their subjects
+EXPORT_CHUNK_SIZE = 2000
+# Chunked uploads of import files: spool directory, size of the chunks sent
+# by the import page and largest accepted chunk and file, in bytes, and
+# seconds after which unfinished uploads are deleted
+UPLOADS_DIR = os.path.join(BASE_DIR, 'uploads')
+UPLOAD_CHUNK_SIZE = 8 * 1024 ** 2
+UPLOAD_MAX_CHUNK_SIZE = 64 * 1024 ** 2
+UPLOAD_MAX_SIZE = 4 * 1024 ** 3
+UPLOAD_EXPIRY = 24 * 60 * 60
+
+
+# Profile pictures archive limits, in bytes, and threads verifying members
+ZIP_MAX_MEMBER_SIZE = 20 * 1024 ** 2
+ZIP_MAX_TOTAL_SIZE = 4 * 1024 ** 3
+ZIP_MAX_COMPRESSION_RATIO = 100
+ZIP_VALIDATION_WORKERS = 1
+
+# Profile picture thumbnails: widths in pixels of every variant, and
+# formats in order of preference
+THUMBNAIL_VARIANTS = {
+    'card': [210, 420],
+    'profile': [320, 640],
+}
+THUMBNAIL_FORMATS = ['webp', 'jpeg']
+
+# Directory search: 'fts' (SQLite FTS5 table), 'memory' (prefix index held
+# by every worker process), 'orm' (istartswith lookups) or 'auto' (FTS5 when
+# the table exists)
+DIRECTORY_SEARCH_BACKEND = 'auto'
+# Directory list pagination: 'cursor' (keyset pagination with next and
+# previous links) or 'page' (numbered pages), and seconds the total number
+# of results of a search is cached in cursor mode
+DIRECTORY_PAGINATION = 'cursor'
+DIRECTORY_COUNT_CACHE_TIMEOUT = 300
+
+# Request metrics: query count, SQL, render and total time of every request
+# in a Server-Timing header, and latency histograms at /metrics for the
+# clients in METRICS_ALLOWED_IPS. Statements repeated this many times in
+# one request are logged as possible N+1 queries.
+REQUEST_METRICS = False
+REQUEST_METRICS_N_PLUS_ONE = 10
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.1/ref/settings/#default-auto-field